@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解析器微基準：以合成的 MOPS 匯出檔量測 CSV/HTML 解析與 Excel 合併去重的吞吐量與記憶體高峰
+
+用法：
+    python bench_parsers.py                          # 預設 10、1,000、10,000、100,000 列
+    python bench_parsers.py --sizes 10,1000 --only csv,html
+    python bench_parsers.py --save before.json       # 存下結果
+    python bench_parsers.py --compare before.json    # 改完解析器後與先前結果比較
+
+不需瀏覽器與網路；合成資料涵蓋 UTF-8/Big5、表頭前的說明列、分頁重複表頭與欄位數不符的壞列。
+"""
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from fixed_input_crawler import FixedInputCrawler
+
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+CASES = ["csv", "pick", "html", "excel"]
+
+# 合成資料用字（皆在 Big5 字集內）
+SURNAMES = "陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周"
+GIVEN = "志明淑芬家豪怡君俊傑雅婷建宏美玲冠宇佳穎承恩"
+TITLES = ["董事長", "董事", "獨立董事", "監察人", "總經理", "副總經理", "財務主管", "大股東"]
+CSV_HEADER = ["職稱", "姓名", "選任時持股", "目前持股", "設質股數", "設質股數佔持股比例"]
+REPEAT_HEADER_EVERY = 1000  # 匯出檔每頁重複表頭
+BAD_LINE_EVERY = 97         # 千分位逗號未加引號，欄位數對不上
+
+
+def _name(i):
+    """產生不重複的姓名；每 7 筆一筆法人代表"""
+    base = SURNAMES[i % len(SURNAMES)] + GIVEN[(i // 3) % len(GIVEN)] + GIVEN[(i // 7) % len(GIVEN)]
+    if i % 7 == 0:
+        return f"{base}投資股份有限公司代表人{i}"
+    return f"{base}{i}"
+
+
+def _row(i):
+    """一筆持股資料：職稱、姓名、選任時持股、目前持股、設質股數、設質比例"""
+    held = (i * 7919) % 50_000_000 + 1000
+    pledged = held // 3 if i % 5 == 0 else 0
+    return [TITLES[i % len(TITLES)], _name(i), f"{held + i:,}", f"{held:,}", f"{pledged:,}",
+            f"{pledged / held * 100:.2f}%"]
+
+
+def make_csv(rows, encoding="utf-8", messy=False):
+    """
+    產生 MOPS 風格的 CSV 位元組，回傳 (raw, 預期解析筆數)。
+    messy=True 時加上表頭前說明列、空白列、每頁重複表頭與欄位數不符的壞列。
+    """
+    buf = io.StringIO()
+    if messy:
+        buf.write("公司代號：2330,公司名稱：台灣積體電路製造\n")
+        buf.write("資料年月：113年09月\n\n單位：股\n")
+    buf.write(",".join(CSV_HEADER) + "\n")
+    expected = 0
+    for i in range(rows):
+        if messy and i and i % REPEAT_HEADER_EVERY == 0:
+            buf.write(",".join(CSV_HEADER) + "\n\n")
+        row = _row(i)
+        if messy and i % BAD_LINE_EVERY == BAD_LINE_EVERY - 1:
+            buf.write(",".join(row) + "\n")  # 數字內的逗號未加引號
+            continue
+        buf.write(",".join(f'"{c}"' if "," in c else c for c in row) + "\n")
+        expected += 1
+    if messy:
+        buf.write("\n註：本表資料由公司申報\n")
+    encoding = "utf-8-sig" if encoding == "utf-8" else encoding
+    return buf.getvalue().encode(encoding), expected
+
+
+def make_html(rows, messy=False):
+    """
+    產生查詢結果頁 HTML，回傳 (html, 預期解析筆數)。
+    messy=True 時前面多一個版面表格、資料列內每頁重複表頭，並夾雜 &nbsp; 與 <font> 標籤。
+    """
+    parts = ["<html><body>"]
+    if messy:
+        parts.append("<table><tr><td>首頁</td><td>彙總報表</td></tr><tr><td>公告查詢</td><td>說明</td></tr></table>")
+    header = "<tr>" + "".join(f"<th>{h}</th>" for h in CSV_HEADER) + "</tr>"
+    parts.append('<table class="hasBorder"><thead>' + header + "</thead><tbody>")
+    for i in range(rows):
+        if messy and i and i % REPEAT_HEADER_EVERY == 0:
+            parts.append(header)
+        cells = _row(i)
+        if messy:
+            cells[1] = f"<font color='blue'>{cells[1]}</font>&nbsp;"
+        parts.append("<tr>" + "".join(f"<td>{c}</td>" for c in cells) + "</tr>")
+    parts.append("</tbody></table></body></html>")
+    return "".join(parts), rows
+
+
+def make_frame(rows, header_in_first_row=False):
+    """_pick_columns 的輸入：正常欄名，或欄名落在第一列（read_csv 沒抓到表頭時的樣子）"""
+    data = [_row(i) for i in range(rows)]
+    if header_in_first_row:
+        return pd.DataFrame([CSV_HEADER] + data)
+    return pd.DataFrame(data, columns=CSV_HEADER)
+
+
+def make_chunk(rows, start=0, code="2330"):
+    """append_to_master_excel 的一批資料"""
+    return pd.DataFrame([{"股票代號": code, "公司名稱": "台積電", "姓名": _name(i), "目前持股": _row(i)[3]}
+                         for i in range(start, start + rows)])
+
+
+def _measure(fn, min_time, max_runs):
+    """先跑一次暖身，再依單次耗時決定次數；回傳 (結果, 各次秒數)"""
+    t0 = time.perf_counter()
+    result = fn()
+    first = time.perf_counter() - t0
+    runs = max(1, min(max_runs, math.ceil(min_time / max(first, 1e-6))))
+    if first >= min_time:
+        return result, [first]
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return result, times
+
+
+def _peak(fn):
+    """單獨一次執行的 tracemalloc 高峰（MiB）；與計時分開，避免追蹤拖慢計時"""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def _count(result):
+    if result is None:
+        return 0
+    if isinstance(result, int):  # Excel 合併檔列數
+        return result
+    if isinstance(result, tuple):  # _pick_columns
+        df, name_col, hold_col = result
+        return len(df) if name_col and hold_col else 0
+    return len(result)
+
+
+def build_cases(crawler, sizes, only, workdir, excel_max):
+    """列出 (案例名稱, 列數, 輸入位元組數, 預期筆數, 執行函式)"""
+    cases = []
+    for n in sizes:
+        if "csv" in only:
+            for label, enc, messy in [("utf-8", "utf-8", False), ("big5", "big5", False),
+                                      ("big5 messy", "big5", True)]:
+                raw, expected = make_csv(n, enc, messy)
+                path = os.path.join(workdir, f"bench_{enc}_{int(messy)}_{n}.csv")
+                with open(path, "wb") as f:
+                    f.write(raw)
+                cases.append((f"csv {label}", n, len(raw), expected,
+                              lambda p=path: crawler._read_and_filter_csv(p)))
+        if "pick" in only:
+            for label, shifted in [("", False), (" header-in-row", True)]:
+                df = make_frame(n, shifted)
+                cases.append((f"pick_columns{label}", n, int(df.memory_usage(deep=True).sum()), n,
+                              lambda d=df: crawler._pick_columns(d)))
+        if "html" in only:
+            for label, messy in [("", False), (" messy", True)]:
+                html, expected = make_html(n, messy)
+                cases.append((f"html table{label}", n, len(html.encode("utf-8")), expected,
+                              lambda h=html: crawler._parse_html_payload(h)))
+        if "excel" in only and n <= excel_max:
+            # 既有 n 筆的合併檔，再追加一個代號的 20 筆（其中 10 筆與既有重複）：量測每個代號的重寫成本
+            path = os.path.join(workdir, f"bench_master_{n}.xlsx")
+            crawler.append_to_master_excel(path, make_chunk(n))
+            chunk = make_chunk(20, start=max(n - 10, 0))
+            expected = len(set(range(n)) | set(range(max(n - 10, 0), max(n - 10, 0) + 20)))
+            cases.append(("excel append+dedup", n, os.path.getsize(path), expected,
+                          lambda p=path, c=chunk: _append_and_count(crawler, p, c)))
+    return cases
+
+
+def _append_and_count(crawler, path, chunk):
+    """追加後回傳合併檔目前列數（讀 openpyxl 的 max_row，不重新解析整張表）"""
+    from openpyxl import load_workbook
+    crawler.append_to_master_excel(path, chunk)
+    wb = load_workbook(path, read_only=True)
+    try:
+        return wb["合併"].max_row - 1
+    finally:
+        wb.close()
+
+
+def _fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+
+
+def run(args):
+    only = [c.strip() for c in args.only.split(",") if c.strip()]
+    sizes = [int(s.replace("_", "")) for s in args.sizes.split(",") if s.strip()]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_parsers_") as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # 爬蟲會建立 downloads/ 與日誌檔，放在暫存目錄
+        try:
+            logging.disable(logging.CRITICAL)  # 解析過程的逐步日誌不計入量測
+            crawler = FixedInputCrawler()
+            cases = build_cases(crawler, sizes, only, workdir, args.excel_max)
+            print(f"{'案例':<28}{'列數':>9}{'輸入':>10}{'最佳ms':>11}{'中位ms':>11}{'列/秒':>12}"
+                  f"{'MB/秒':>9}{'高峰MiB':>10}{'解析筆數':>12}")
+            for name, n, size, expected, fn in cases:
+                result, times = _measure(fn, args.min_time, args.max_runs)
+                peak = _peak(fn) if not args.no_memory else None
+                best, median = min(times), statistics.median(times)
+                parsed = _count(result)
+                rec = {"case": name, "rows": n, "bytes": size, "runs": len(times), "best_s": best,
+                       "median_s": median, "rows_per_s": n / best if best else None,
+                       "peak_mib": peak, "parsed": parsed, "expected": expected}
+                results.append(rec)
+                flag = "" if parsed == expected else f" ≠{expected}"
+                print(f"{name:<28}{n:>9,}{_fmt_bytes(size):>10}{best * 1000:>11.2f}{median * 1000:>11.2f}"
+                      f"{rec['rows_per_s'] or 0:>12,.0f}{size / best / 1e6 if best else 0:>9.2f}"
+                      f"{'-' if peak is None else f'{peak:.1f}':>10}{parsed:>12,}{flag}")
+        finally:
+            logging.disable(logging.NOTSET)
+            os.chdir(cwd)
+    return results
+
+
+def save(results, path):
+    meta = {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "pandas": pd.__version__, "platform": platform.platform()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"💾 已儲存結果: {path}")
+
+
+def compare(results, path):
+    """與先前存下的結果逐案例比較最佳耗時與記憶體高峰（<1 表示變快/變省）"""
+    with open(path, "r", encoding="utf-8") as f:
+        base = {(r["case"], r["rows"]): r for r in json.load(f)["results"]}
+    print(f"\n與 {path} 比較（比值 = 目前 / 先前）")
+    print(f"{'案例':<28}{'列數':>9}{'耗時比':>9}{'高峰比':>9}{'解析筆數':>16}")
+    for r in results:
+        b = base.get((r["case"], r["rows"]))
+        if b is None:
+            continue
+        t = r["best_s"] / b["best_s"] if b["best_s"] else float("nan")
+        m = (r["peak_mib"] / b["peak_mib"] if r["peak_mib"] is not None and b.get("peak_mib") else float("nan"))
+        rows = f"{b['parsed']:,}→{r['parsed']:,}" if b["parsed"] != r["parsed"] else f"{r['parsed']:,}"
+        print(f"{r['case']:<28}{r['rows']:>9,}{t:>9.2f}{m:>9.2f}{rows:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析器微基準（合成 MOPS 匯出檔）")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="列數，以逗號分隔")
+    parser.add_argument("--only", default=",".join(CASES), help=f"只跑指定案例：{','.join(CASES)}")
+    parser.add_argument("--excel-max", type=int, default=10000,
+                        help="Excel 合併去重只跑到此列數（整檔重寫，大檔很慢）")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每個案例至少累積的計時秒數")
+    parser.add_argument("--max-runs", type=int, default=20, help="每個案例最多執行次數")
+    parser.add_argument("--no-memory", action="store_true", help="不量測 tracemalloc 記憶體高峰")
+    parser.add_argument("--save", metavar="FILE", help="把結果存成 JSON")
+    parser.add_argument("--compare", metavar="FILE", help="與先前存下的 JSON 結果比較")
+    args = parser.parse_args()
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    results = run(args)
+    if compare_path:
+        compare(results, compare_path)
+    if save_path:
+        save(results, save_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+並行擴展壓測：以本機假 MOPS 網站跑完整的 process_single_stock 流程，
+並行數由 1 逐步加到 N（多瀏覽器或單一瀏覽器多分頁），量測每個並行數的吞吐量與資源用量
+
+用法：
+    python bench_scaling.py --max-workers 4                      # 多瀏覽器，並行數 1、2、3、4
+    python bench_scaling.py --mode tabs --levels 1,2,4,8         # 單一瀏覽器多分頁
+    python bench_scaling.py --latency 1.5 --jitter 0.5 --error-rate 0.1 --csv-error-rate 0.05
+    python bench_scaling.py --save scaling.json
+    python bench_scaling.py --serve                              # 只啟動假網站，供手動檢查
+
+每個並行數輸出：代號/分鐘、單檔耗時中位數與 p95、成功率、階段重試次數、CPU 秒數與使用率、RSS 高峰。
+有安裝 psutil 時 CPU 與 RSS 含 chromedriver 與所有 Chrome 子程序；
+沒有時退回 os.times / resource，只計入本 Python 程序（表頭會標註）。
+需要本機 Chrome；不連外網。
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import psutil
+except ImportError:  # 選用：沒有時只量測本程序
+    psutil = None
+
+from bench_parsers import make_csv
+from fixed_input_crawler import BrowserPool, TabGroup
+
+MODES = ["browsers", "tabs"]
+TARGET_ROUTE = "#/web/t93sc03"
+GAIN_THRESHOLD = 0.10  # 再加一級並行數，吞吐量提升低於此比例即視為飽和
+
+# 假 MOPS：主頁菜单 → 董監事持股餘額查詢頁 → 查詢 API 回應後渲染結果表與 CSV 下載連結
+FAKE_MOPS_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>公開資訊觀測站（壓測用）</title></head>
+<body><div id="app"></div>
+<script>
+function esc(s) {
+  return String(s).replace(/[&<>"]/g, c => ({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})[c]);
+}
+function home() {
+  document.getElementById("app").innerHTML =
+    '<h1>公開資訊觀測站</h1><ul><li><a href="__ROUTE__">董監事持股餘額</a></li><li><a href="#/web/home">重大訊息</a></li></ul>';
+}
+function form() {
+  document.getElementById("app").innerHTML =
+    '<h2>董監事持股餘額</h2><div class="query-form"><div>查詢條件</div>' +
+    '<label for="co_id">公司代號或簡稱</label><input type="text" id="co_id" placeholder="例如：1101">' +
+    '<button type="button" id="query">查詢</button></div><div id="result"></div>';
+  document.getElementById("query").onclick = query;
+}
+async function query() {
+  const code = document.getElementById("co_id").value.trim();
+  const result = document.getElementById("result");
+  result.innerHTML = "";
+  let body;
+  try {
+    const r = await fetch("/mops/api/holdings?co_id=" + encodeURIComponent(code));
+    body = await r.json();
+  } catch (e) {
+    body = {error: "系統忙碌中，請稍後再試"};
+  }
+  if (body.error) { result.innerHTML = "<p>" + esc(body.error) + "</p>"; return; }
+  const head = body.header.map(h => "<th>" + esc(h) + "</th>").join("");
+  const rows = body.rows.map(r => "<tr>" + r.map(c => "<td>" + esc(c) + "</td>").join("") + "</tr>").join("");
+  result.innerHTML = '<p>' + esc(body.name) + '</p><a href="' + body.csv + '">下載CSV</a>' +
+    '<table class="hasBorder"><thead><tr>' + head + '</tr></thead><tbody>' + rows + '</tbody></table>';
+}
+function route() { location.hash === "__ROUTE__" ? form() : home(); }
+window.addEventListener("hashchange", route);
+route();
+</script></body></html>
+""".replace("__ROUTE__", TARGET_ROUTE)
+
+
+class FakeMopsServer:
+    """
+    本機假 MOPS 網站（ThreadingHTTPServer，背景執行緒）。
+    查詢 API 與 CSV 下載各自注入延遲（latency ± jitter 秒）與錯誤率；
+    查詢錯誤回 503 與「系統忙碌」訊息（爬蟲歸類為 site_error），CSV 錯誤回 500。
+    """
+
+    def __init__(self, port=0, latency=0.5, jitter=0.2, error_rate=0.0, csv_error_rate=0.0, rows=20, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.csv_error_rate = csv_error_rate
+        self.rows = rows
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {}  # 端點 -> 請求數（含注入的錯誤）
+        self._csv_cache = {}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/mops/#/web/home"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _delay_and_fail(self, rate):
+        """依設定延遲後回傳這次是否要注入錯誤"""
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < rate
+        time.sleep(delay)
+        return fail
+
+    def _csv(self, code):
+        """每個代號的 CSV 只產生一次（內容與 bench_parsers 的合成匯出檔相同）"""
+        if code not in self._csv_cache:
+            self._csv_cache[code] = make_csv(self.rows)[0]
+        return self._csv_cache[code]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass  # 不輸出逐筆請求
+
+            def _send(self, status, body, content_type):
+                data = body.encode("utf-8") if isinstance(body, str) else body
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                if path in ("/mops", "/mops/"):
+                    server._count("page")
+                    return self._send(200, FAKE_MOPS_PAGE, "text/html; charset=utf-8")
+                if path == "/mops/api/holdings":
+                    code = (re.search(r"co_id=([^&]*)", query) or [None, ""])[1]
+                    fail = server._delay_and_fail(server.error_rate)
+                    server._count("query_error" if fail else "query")
+                    if fail:
+                        return self._send(503, json.dumps({"error": "系統忙碌中，請稍後再試"}, ensure_ascii=False),
+                                          "application/json; charset=utf-8")
+                    if not re.fullmatch(r"\d{4,6}", code):
+                        return self._send(200, json.dumps({"error": "查無此公司代號"}, ensure_ascii=False),
+                                          "application/json; charset=utf-8")
+                    header, rows = _preview(server._csv(code))
+                    body = {"name": f"公司代號：{code}", "header": header, "rows": rows,
+                            "csv": f"/download/{code}.csv"}
+                    return self._send(200, json.dumps(body, ensure_ascii=False), "application/json; charset=utf-8")
+                m = re.fullmatch(r"/download/(\d+)\.csv", path)
+                if m:
+                    fail = server._delay_and_fail(server.csv_error_rate)
+                    server._count("csv_error" if fail else "csv")
+                    if fail:
+                        return self._send(500, "Internal Server Error", "text/plain")
+                    return self._send(200, server._csv(m.group(1)), "text/csv")
+                self._send(404, "Not Found", "text/plain")
+
+        return Handler
+
+
+def _preview(raw):
+    """CSV 內容轉成結果頁表格（表頭與各列）"""
+    lines = [row for row in csv.reader(io.StringIO(raw.decode("utf-8-sig"))) if row]
+    return lines[0], lines[1:]
+
+
+class ResourceSampler:
+    """背景取樣本程序（有 psutil 時含所有子程序）的 RSS 高峰與 CPU 秒數"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_rss = 0
+        self._cpu = {}  # pid -> 最後一次看到的 CPU 秒數（子程序結束後仍保留）
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_times = None
+        self._start_cpu = 0.0
+
+    @staticmethod
+    def _processes():
+        me = psutil.Process()
+        try:
+            return [me] + me.children(recursive=True)
+        except psutil.Error:
+            return [me]
+
+    def _sample(self):
+        rss = 0
+        for p in self._processes():
+            try:
+                with p.oneshot():
+                    rss += p.memory_info().rss
+                    t = p.cpu_times()
+                    self._cpu[(p.pid, p.create_time())] = t.user + t.system
+            except psutil.Error:
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._start_times = os.times()
+        if psutil:
+            self._sample()
+            self._start_cpu = sum(self._cpu.values())
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止取樣，回傳 (CPU 秒數, RSS 高峰 bytes)；須在關閉瀏覽器前呼叫，否則子程序已結束"""
+        if psutil:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+            return sum(self._cpu.values()) - self._start_cpu, self.peak_rss
+        end = os.times()
+        cpu = (end.user - self._start_times.user) + (end.system - self._start_times.system)
+        return cpu, _max_rss_self()
+
+
+def _max_rss_self():
+    """沒有 psutil 時：本程序至今的 RSS 高峰（只增不減，跨並行數累計）"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _p95(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+def _point_at(crawlers, url, route_cache_path):
+    for crawler in crawlers:
+        crawler.main_url = url
+        crawler.route_cache_path = route_cache_path
+        crawler.schedule_by_history = False
+
+
+def run_level(level, args, server, workdir):
+    """跑一個並行數：啟動（不計時）→ 查詢 level × codes_per_worker 檔 → 關閉，回傳量測結果"""
+    codes = [str(1000 + i) for i in range(level * args.codes_per_worker)]
+    route_cache = os.path.join(workdir, f"route_cache_{args.mode}_{level}.json")
+    kwargs = {"block_resources": not args.no_block}
+    group = BrowserPool(size=level, **kwargs) if args.mode == "browsers" else TabGroup(tabs=level, **kwargs)
+    _point_at(group.crawlers, server.url, route_cache)
+    t0 = time.perf_counter()
+    started = group.start(warm=True) if args.mode == "browsers" else group.start()
+    startup = time.perf_counter() - t0
+    if not started:
+        group.close()
+        raise RuntimeError("瀏覽器無法啟動（需要本機 Chrome）")
+
+    server.reset_counts()
+    sampler = ResourceSampler().start()
+    seconds, failures = [], {}
+    t0 = time.perf_counter()
+    try:
+        for rec in group.run(codes, retry=args.retry, throttle_sec=args.throttle):
+            if rec.get("seconds") is not None:
+                seconds.append(rec["seconds"])
+            if not rec["ok"]:
+                reason = rec["reason"] or "未知"
+                failures[reason] = failures.get(reason, 0) + 1
+        wall = time.perf_counter() - t0
+        cpu, rss = sampler.stop()
+    finally:
+        group.close()
+
+    retries = sum(sum(c.stage_retry_counts.values()) for c in group.crawlers)
+    ok = len(codes) - sum(failures.values())
+    return {"mode": args.mode, "workers": level, "started": started, "codes": len(codes), "ok": ok,
+            "failures": failures, "startup_s": startup, "wall_s": wall,
+            "codes_per_min": ok / wall * 60 if wall else None,
+            "median_s": statistics.median(seconds) if seconds else None, "p95_s": _p95(seconds),
+            "stage_retries": retries, "cpu_s": cpu, "cpu_pct": cpu / wall * 100 if wall else None,
+            "peak_rss": rss, "requests": server.reset_counts()}
+
+
+def _fmt(value, spec, none="-"):
+    return none if value is None else format(value, spec)
+
+
+def _saturation(results):
+    """吞吐量不再明顯提升的並行數：下一級的提升低於 GAIN_THRESHOLD（或已下降）"""
+    for prev, cur in zip(results, results[1:]):
+        if not prev["codes_per_min"] or cur["codes_per_min"] is None:
+            continue
+        if cur["codes_per_min"] / prev["codes_per_min"] - 1 < GAIN_THRESHOLD:
+            return prev["workers"]
+    return None
+
+
+def run(args):
+    levels = ([int(s) for s in args.levels.split(",") if s.strip()] if args.levels
+              else list(range(1, args.max_workers + 1)))
+    server = FakeMopsServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            csv_error_rate=args.csv_error_rate, rows=args.rows, seed=args.seed).start()
+    results = []
+    scope = "含瀏覽器" if psutil else "僅本程序"
+    with tempfile.TemporaryDirectory(prefix="bench_scaling_") as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # 爬蟲的日誌、下載目錄、歷史檔與路由快取都放在暫存目錄
+        try:
+            logging.disable(logging.CRITICAL)  # 逐步日誌不計入量測
+            print(f"🧪 假 MOPS: {server.url}（延遲 {args.latency}±{args.jitter}s，查詢錯誤率 {args.error_rate:.0%}，"
+                  f"CSV 錯誤率 {args.csv_error_rate:.0%}）")
+            print(f"{'並行數':>6}{'代號':>6}{'成功':>6}{'啟動s':>8}{'總耗時s':>9}{'代號/分':>9}{'中位s':>8}{'p95s':>8}"
+                  f"{'重試':>6}{f'CPU秒({scope})':>16}{'CPU%':>8}{'RSS高峰MiB':>12}{'增益':>8}")
+            for level in levels:
+                rec = run_level(level, args, server, workdir)
+                prev = results[-1]["codes_per_min"] if results else None
+                gain = (f"{rec['codes_per_min'] / prev - 1:+.0%}" if prev and rec["codes_per_min"] is not None
+                        else "-")
+                results.append(rec)
+                rss = None if rec["peak_rss"] is None else rec["peak_rss"] / 2 ** 20
+                print(f"{level:>6}{rec['codes']:>6}{rec['ok']:>6}{rec['startup_s']:>8.1f}{rec['wall_s']:>9.1f}"
+                      f"{_fmt(rec['codes_per_min'], '.1f'):>9}{_fmt(rec['median_s'], '.1f'):>8}"
+                      f"{_fmt(rec['p95_s'], '.1f'):>8}{rec['stage_retries']:>6}{rec['cpu_s']:>16.1f}"
+                      f"{_fmt(rec['cpu_pct'], '.0f'):>8}{_fmt(rss, '.0f'):>12}{gain:>8}")
+                if rec["failures"]:
+                    detail = "、".join(f"{k} {v}" for k, v in sorted(rec["failures"].items(), key=lambda kv: -kv[1]))
+                    print(f"{'':>6}  失敗: {detail}")
+        finally:
+            logging.disable(logging.NOTSET)
+            os.chdir(cwd)
+            server.close()
+
+    knee = _saturation(results)
+    if knee is not None:
+        print(f"\n📈 並行數超過 {knee} 後吞吐量提升不到 {GAIN_THRESHOLD:.0%}，再增加 worker 幫助不大")
+    elif len(results) > 1:
+        print(f"\n📈 到 {results[-1]['workers']} 個並行數為止吞吐量仍在成長，可再往上測")
+    if not psutil:
+        print("ℹ️ 未安裝 psutil：CPU 與 RSS 只含本 Python 程序，RSS 為累計高峰（不含 Chrome）")
+    return results
+
+
+def save(results, args, path):
+    meta = {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count(), "psutil": bool(psutil),
+            "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+            "csv_error_rate": args.csv_error_rate, "rows": args.rows, "throttle": args.throttle,
+            "codes_per_worker": args.codes_per_worker, "block_resources": not args.no_block}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"💾 已儲存結果: {path}")
+
+
+def serve(args):
+    server = FakeMopsServer(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            csv_error_rate=args.csv_error_rate, rows=args.rows, seed=args.seed).start()
+    print(f"🧪 假 MOPS 已啟動: {server.url}（Ctrl+C 結束）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="並行擴展壓測（本機假 MOPS 網站）")
+    parser.add_argument("--mode", choices=MODES, default="browsers", help="browsers：多個瀏覽器；tabs：單一瀏覽器多分頁")
+    parser.add_argument("--max-workers", type=int, default=4, help="並行數由 1 測到此值")
+    parser.add_argument("--levels", help="指定要測的並行數，以逗號分隔（取代 --max-workers）")
+    parser.add_argument("--codes-per-worker", type=int, default=5, help="每個並行數查詢 並行數 × 此值 檔代號")
+    parser.add_argument("--latency", type=float, default=0.5, help="查詢 API 與 CSV 下載的注入延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延遲的隨機浮動（± 秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="查詢回應「系統忙碌」的比例（0–1）")
+    parser.add_argument("--csv-error-rate", type=float, default=0.0, help="CSV 下載回 500 的比例（0–1）")
+    parser.add_argument("--rows", type=int, default=20, help="每個代號的持股筆數")
+    parser.add_argument("--throttle", type=float, default=1.5, help="每個 worker 兩檔之間的間隔秒數（同 --throttle 預設）")
+    parser.add_argument("--retry", type=int, default=1, help="每檔失敗重試次數")
+    parser.add_argument("--no-block", action="store_true", help="不啟用資源阻擋")
+    parser.add_argument("--seed", type=int, help="注入延遲與錯誤的亂數種子（可重現）")
+    parser.add_argument("--save", metavar="FILE", help="把結果存成 JSON")
+    parser.add_argument("--serve", action="store_true", help="只啟動假網站，不跑壓測")
+    parser.add_argument("--port", type=int, default=8780, help="--serve 時的連接埠（壓測時自動挑選）")
+    args = parser.parse_args()
+    if not 0 <= args.error_rate <= 1 or not 0 <= args.csv_error_rate <= 1:
+        parser.error("錯誤率須介於 0 與 1 之間")
+
+    if args.serve:
+        return serve(args)
+    save_path = os.path.abspath(args.save) if args.save else None
+    try:
+        results = run(args)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    if save_path:
+        save(results, args, save_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,26 +16,1153 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import (TimeoutException, NoSuchElementException, WebDriverException,
+                                        UnexpectedAlertPresentException)
 import os
+import atexit
 import glob
-from datetime import datetime
+import gzip
+import json
+import hashlib
+import sys
+import sqlite3
+import threading
+import unicodedata
+from html.parser import HTMLParser
+from datetime import datetime, timedelta
 from typing import Optional
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-class FixedInputCrawler:
+class StreamingExcelWriter:
+    """
+    以 openpyxl write-only 模式邊收邊寫的 Excel 輸出，列資料直接寫入暫存檔，記憶體用量不隨代號數量成長。
+    合併表達到 Excel 列數上限時自動換新工作表（合併_2、合併_3…），
+    工作表數達到 max_sheets 時自動換新檔案（xxx_part2.xlsx…）。
+    """
+    MAX_ROWS = 1048576  # Excel 單一工作表列數上限（含表頭）
+
+    def __init__(self, path, columns, column_widths=None, max_rows=MAX_ROWS, max_sheets=500,
+                 merged_title="合併", logger=None):
+        from openpyxl.styles import Font, PatternFill, Alignment
+
+        self.path = path
+        self.columns = list(columns)
+        self.column_widths = column_widths or {}
+        self.max_rows = max_rows
+        self.max_sheets = max_sheets
+        self.merged_title = merged_title
+        self.logger = logger or logging.getLogger(__name__)
+        # 所有表頭共用同一組樣式物件
+        self.header_font = Font(bold=True, color="FFFFFF")
+        self.header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        self.header_alignment = Alignment(horizontal="center")
+
+        self.paths = []
+        self.total_rows = 0
+        self.wb = None
+        self._merged_index = 0  # 合併表編號跨檔延續，part2 接在前一檔的合併_N 之後
+        self._open_workbook()
+
+    def _open_workbook(self):
+        from openpyxl import Workbook
+
+        part = len(self.paths) + 1
+        base, ext = os.path.splitext(self.path)
+        self.paths.append(self.path if part == 1 else f"{base}_part{part}{ext}")
+        self.wb = Workbook(write_only=True)
+        self._sheet_count = 0
+        self._merged = None
+        self._merged_rows = 0
+
+    def _roll_file(self):
+        self.wb.save(self.paths[-1])
+        self.logger.info(f"📄 工作表數達上限，已存檔並換新檔案: {self.paths[-1]}")
+        self._open_workbook()
+
+    def _new_sheet(self, title, columns):
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+
+        if self._sheet_count >= self.max_sheets:
+            self._roll_file()
+        ws = self.wb.create_sheet(title=title[:31])  # Excel 名稱長度限制
+        for i, col in enumerate(columns, 1):
+            ws.column_dimensions[get_column_letter(i)].width = self.column_widths.get(col, 16)
+        header = []
+        for col in columns:
+            cell = WriteOnlyCell(ws, value=col)
+            cell.font = self.header_font
+            cell.fill = self.header_fill
+            cell.alignment = self.header_alignment
+            header.append(cell)
+        ws.append(header)
+        self._sheet_count += 1
+        return ws
+
+    @staticmethod
+    def _rows(df, columns):
+        for row in df.reindex(columns=columns).itertuples(index=False, name=None):
+            yield [None if v is None or v is pd.NA or isinstance(v, float) and v != v else v for v in row]
+
+    def append(self, df):
+        """追加到合併表，滿了就換下一張合併表"""
+        for row in self._rows(df, self.columns):
+            if self._merged is None or self._merged_rows >= self.max_rows - 1:
+                self._merged_index += 1
+                title = self.merged_title if self._merged_index == 1 else f"{self.merged_title}_{self._merged_index}"
+                self._merged = self._new_sheet(title, self.columns)
+                self._merged_rows = 0
+            self._merged.append(row)
+            self._merged_rows += 1
+            self.total_rows += 1
+
+    def write_sheet(self, title, df):
+        """以 df 的欄位寫出一張獨立工作表，超過列數上限時接續到 title_2…"""
+        columns = list(df.columns)
+        ws, rows, index = None, 0, 0
+        for row in self._rows(df, columns):
+            if ws is None or rows >= self.max_rows - 1:
+                index += 1
+                ws = self._new_sheet(title if index == 1 else f"{title}_{index}", columns)
+                rows = 0
+            ws.append(row)
+            rows += 1
+        if ws is None:
+            self._new_sheet(title, columns)
+
+    def close(self):
+        """存檔，回傳所有輸出檔路徑"""
+        if self.wb is not None:
+            if self._sheet_count == 0:
+                self._new_sheet(self.merged_title, self.columns)
+            self.wb.save(self.paths[-1])
+            self.wb = None
+        return self.paths
+
+
+class RawArchive:
+    """
+    原始回應封存：CSV/HTML/JSON 內容以 SHA-256 命名、gzip 壓縮存放於 objects/，相同內容只存一份。
+    index.jsonl 每行記錄一次抓取（代號、期別、抓取批次、時間、種類、雜湊），供離線重新解析。
+    """
+
+    def __init__(self, root="archive"):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.jsonl")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
+
+    def put(self, code, kind, raw, period=None, crawl_id=None):
+        """存入一份原始內容並寫入索引，回傳內容雜湊"""
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp, "wb") as f:
+                f.write(raw)
+            os.replace(tmp, path)
+        entry = {
+            "sha256": digest, "code": code, "period": period, "kind": kind,
+            "crawl_id": crawl_id, "crawled_at": datetime.now().isoformat(timespec="seconds"), "size": len(raw),
+        }
+        with self._lock:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return digest
+
+    def get(self, digest):
+        with gzip.open(self._object_path(digest), "rb") as f:
+            return f.read()
+
+    def latest_groups(self, codes=None):
+        """每個 (代號, 期別) 只取最近一次抓取的所有封存項目，回傳 [(代號, 期別, [項目…]), …]"""
+        latest = {}
+        if not os.path.exists(self.index_path):
+            return []
+        wanted = set(codes) if codes else None
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if wanted and entry["code"] not in wanted:
+                    continue
+                key = (entry["code"], entry.get("period"))
+                crawl = entry.get("crawl_id") or entry["crawled_at"]
+                current = latest.get(key)
+                if current is None or crawl > current[0]:
+                    latest[key] = (crawl, [entry])
+                elif crawl == current[0]:
+                    current[1].append(entry)
+        return [(code, period, entries) for (code, period), (_, entries) in sorted(latest.items(),
+                                                                               key=lambda kv: (kv[0][0], kv[0][1] or ""))]
+
+
+class ChromeProfile:
+    """
+    跨重啟沿用的 Chrome 使用者資料目錄：MOPS 的 JS/CSS/字型與編譯後的 Code Cache 留在磁碟上，
+    重啟瀏覽器後不必重新下載與編譯。每個瀏覽器需各自一個目錄（Chrome 不允許兩個程序共用）。
+    只在每輪第一次啟動前檢查大小，超過上限就清掉快取子目錄（不動設定與 cookie）。
+    """
+
+    MARKER = ".mops_crawler_profile"  # 只清理帶有此標記的目錄，避免誤刪使用者自己的 Chrome 設定檔
+    CACHE_DIRS = [
+        os.path.join("Default", "Cache"),
+        os.path.join("Default", "Code Cache"),
+        os.path.join("Default", "GPUCache"),
+        os.path.join("Default", "Service Worker", "CacheStorage"),
+        os.path.join("Default", "Service Worker", "ScriptCache"),
+        "GrShaderCache",
+        "ShaderCache",
+    ]
+    LOCK_FILES = ["SingletonLock", "SingletonSocket", "SingletonCookie"]
+
+    def __init__(self, path, max_mb=512):
+        self.path = os.path.abspath(path)
+        self.max_mb = max_mb
+        self._pruned = False
+        self.logger = logging.getLogger(__name__)
+
+    def prepare(self):
+        """啟動 Chrome 前呼叫：建立目錄、清掉當機留下的鎖檔，每輪第一次時依大小清理快取"""
+        marker = os.path.join(self.path, self.MARKER)
+        if os.path.isdir(self.path) and os.listdir(self.path) and not os.path.exists(marker):
+            raise ValueError(f"{self.path} 不是爬蟲建立的設定檔目錄，請指定空目錄或新路徑")
+        os.makedirs(self.path, exist_ok=True)
+        if not os.path.exists(marker):
+            with open(marker, "w", encoding="utf-8") as f:
+                f.write(datetime.now().isoformat(timespec="seconds") + "\n")
+        for name in self.LOCK_FILES:
+            # 前一個瀏覽器當機時不會刪除鎖檔，新的 Chrome 會以為設定檔仍在使用中
+            path = os.path.join(self.path, name)
+            if os.path.lexists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if not self._pruned:
+            self._pruned = True
+            self.prune()
+
+    @staticmethod
+    def _dir_size(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def size_mb(self):
+        return self._dir_size(self.path) / 1024 / 1024
+
+    def prune(self):
+        """設定檔超過 max_mb 時刪除快取子目錄；必須在 Chrome 未使用此目錄時呼叫。回傳釋放的 MB"""
+        size = self.size_mb()
+        if size <= self.max_mb:
+            self.logger.info(f"🗂️ Chrome 設定檔 {self.path}: {size:.0f} MB")
+            return 0.0
+        import shutil
+        freed = 0.0
+        for sub in self.CACHE_DIRS:
+            path = os.path.join(self.path, sub)
+            if os.path.isdir(path):
+                freed += self._dir_size(path) / 1024 / 1024
+                shutil.rmtree(path, ignore_errors=True)
+        self.logger.info(f"🧹 Chrome 設定檔 {self.path} 超過 {self.max_mb} MB（{size:.0f} MB），已清除快取 {freed:.0f} MB")
+        return freed
+
+    def arguments(self):
+        """Chrome 啟動參數：使用者資料目錄與磁碟快取上限"""
+        return [f"--user-data-dir={self.path}", f"--disk-cache-size={max(self.max_mb // 2, 1) * 1024 * 1024}"]
+
+
+class _SharedDriverService(Service):
+    """可由多個瀏覽器 session 共用的 chromedriver：已在執行時 start 不再重開，driver.quit 時也不關閉"""
+
+    def __init__(self, executable_path):
+        super().__init__(executable_path=executable_path)
+        self._lock = threading.Lock()
+
+    def running(self):
+        process = getattr(self, "process", None)
+        return process is not None and process.poll() is None and self.is_connectable()
+
+    def start(self):
+        with self._lock:
+            if not self.running():
+                super().start()
+
+    def stop(self):
+        # driver.quit() 會呼叫 service.stop()；共用服務留給下一個 session，程序結束時才 shutdown
+        pass
+
+    def shutdown(self):
+        if getattr(self, "process", None) is not None:
+            super().stop()
+
+
+class ChromeDriverCache:
+    """
+    chromedriver 路徑快取（chromedriver_cache.json），並讓同一程序內所有瀏覽器共用一個 chromedriver 服務。
+    Selenium Manager 只在第一次或 Chrome 更新後執行：Chrome 執行檔的修改時間沒變就直接沿用，
+    變了則比對 Chrome 與 chromedriver 的主版本號，不符才重新解析。
+    """
+
+    def __init__(self, path="chromedriver_cache.json"):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._paths = None
+        self._service = None
+
+    @staticmethod
+    def _version(binary):
+        """執行 `binary --version` 取得版本號（例如 120.0.6099.109）；取不到時回傳 None"""
+        import subprocess
+        try:
+            out = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=15).stdout
+        except Exception:
+            return None
+        match = re.search(r"\d+\.\d+\.\d+(?:\.\d+)?", out or "")
+        return match.group(0) if match else None
+
+    @classmethod
+    def _browser_version(cls, binary):
+        """Chrome 版本號；Windows 的 chrome.exe --version 不輸出任何內容，改讀登錄檔（BLBeacon）"""
+        version = cls._version(binary)
+        if version or sys.platform != "win32":
+            return version
+        try:
+            import winreg
+        except ImportError:
+            return None
+        for root in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+            try:
+                with winreg.OpenKey(root, r"Software\Google\Chrome\BLBeacon") as key:
+                    return winreg.QueryValueEx(key, "version")[0]
+            except OSError:
+                continue
+        return None
+
+    @staticmethod
+    def _major(version):
+        return version.split(".")[0] if version else None
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, entry):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def _check(self, entry):
+        """快取仍可用時回傳（可能更新過的）項目，否則回傳 None"""
+        if not entry or not os.path.isfile(entry.get("driver_path", "")):
+            return None
+        browser = entry.get("browser_path")
+        if not browser or not os.path.isfile(browser):
+            return None
+        mtime = os.path.getmtime(browser)
+        if mtime == entry.get("browser_mtime"):
+            return entry
+        # Chrome 更新過：主版本相同仍可沿用原本的 chromedriver；讀不到版本號時不冒險沿用
+        browser_version = self._browser_version(browser)
+        if not browser_version:
+            self.logger.info("🔄 Chrome 已更新但讀不到版本號，重新解析 chromedriver")
+            return None
+        if self._major(browser_version) != self._major(entry.get("driver_version")):
+            self.logger.info(f"🔄 Chrome 已更新為 {browser_version}，與 chromedriver {entry.get('driver_version')} 不符，重新解析")
+            return None
+        entry.update(browser_mtime=mtime, browser_version=browser_version or entry.get("browser_version"))
+        self._save(entry)
+        return entry
+
+    def _resolve(self):
+        """以 Selenium Manager 找出（必要時下載）chromedriver 與 Chrome，並寫入快取"""
+        from selenium.webdriver.common.selenium_manager import SeleniumManager
+        start = time.time()
+        output = SeleniumManager().binary_paths(["--browser", "chrome"])
+        entry = {
+            "driver_path": output["driver_path"],
+            "browser_path": output["browser_path"],
+            "browser_mtime": os.path.getmtime(output["browser_path"]),
+            "driver_version": self._version(output["driver_path"]),
+            "browser_version": self._browser_version(output["browser_path"]),
+            "resolved_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if self._major(entry["driver_version"]) != self._major(entry["browser_version"]):
+            self.logger.warning(f"⚠️ chromedriver {entry['driver_version']} 與 Chrome {entry['browser_version']} 主版本不同")
+        self._save(entry)
+        self.logger.info(f"🔧 已解析 chromedriver {entry['driver_version']}（{time.time() - start:.2f}s）: {entry['driver_path']}")
+        return entry
+
+    def paths(self):
+        """回傳 (chromedriver 路徑, Chrome 路徑)；同一程序內只檢查一次"""
+        with self._lock:
+            if self._paths is None:
+                entry = self._check(self._load()) or self._resolve()
+                self._paths = (entry["driver_path"], entry["browser_path"])
+            return self._paths
+
+    def service(self, options):
+        """取得共用的 chromedriver 服務，並讓 options 指向版本已確認的 Chrome"""
+        driver_path, browser_path = self.paths()
+        options.binary_location = browser_path
+        with self._lock:
+            if self._service is None or self._service.path != driver_path:
+                # 舊服務可能仍有 session 在用，不在此關閉（程序結束時由 atexit 關閉）
+                self._service = _SharedDriverService(driver_path)
+                atexit.register(self._service.shutdown)
+            return self._service
+
+    def revalidate(self):
+        """
+        共用服務無法建立 session 時呼叫：只有 Chrome 與快取的 chromedriver 主版本不符（或讀不到版本號）
+        才刪除快取、改用新服務，並回傳 True；單次啟動失敗（Chrome 崩潰、設定檔鎖定、逾時）不動快取。
+        舊服務仍有其他 session 在用，一律不關閉。
+        """
+        with self._lock:
+            if self._paths is None:
+                return False
+            entry = self._load() or {}
+            browser_version = self._browser_version(self._paths[1])
+            driver_version = entry.get("driver_version") or self._version(self._paths[0])
+            if browser_version and self._major(browser_version) == self._major(driver_version):
+                return False
+            self.logger.info(f"🔄 Chrome {browser_version or '（版本不明）'} 與 chromedriver {driver_version} 不符，下次重新解析")
+            self._service = None
+            self._paths = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return True
+
+
+chromedriver_cache = ChromeDriverCache()
+
+
+class CodeHistory:
+    """
+    各代號的抓取歷史（code_history.csv）：耗時的指數移動平均、嘗試與失敗次數、最後成功時間。
+    用來排定待處理代號的順序並估計完成時間。
+    """
+
+    COLUMNS = ["代號", "平均秒數", "嘗試次數", "失敗次數", "最後成功", "最後嘗試"]
+
+    def __init__(self, path="code_history.csv", alpha=0.3, stale_days=30, flaky_rate=0.3, default_sec=30.0):
+        self.path = path
+        self.alpha = alpha            # 新耗時的權重
+        self.stale_days = stale_days  # 超過這麼久沒成功就優先處理
+        self.flaky_rate = flaky_rate  # 失敗率高於此值視為不穩定
+        self.default_sec = default_sec
+        self.entries = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8-sig", newline="") as f:
+                for row in csv.DictReader(f):
+                    self.entries[row["代號"]] = {
+                        "sec": float(row["平均秒數"]), "tries": int(row["嘗試次數"]),
+                        "fails": int(row["失敗次數"]),
+                        "last_ok": row["最後成功"] or None, "last_try": row["最後嘗試"] or None,
+                    }
+        except (OSError, KeyError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.COLUMNS)
+                for code, e in sorted(self.entries.items()):
+                    writer.writerow([code, f"{e['sec']:.2f}", e["tries"], e["fails"],
+                                     e["last_ok"] or "", e["last_try"] or ""])
+            os.replace(tmp, self.path)
+            self._dirty = 0
+
+    def record(self, code, seconds, ok, count_failure=True, save_every=20):
+        """記錄一次抓取；count_failure=False 用於查無資料等不代表不穩定的失敗"""
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            e = self.entries.setdefault(code, {"sec": seconds, "tries": 0, "fails": 0,
+                                               "last_ok": None, "last_try": None})
+            e["sec"] = self.alpha * seconds + (1 - self.alpha) * e["sec"]
+            e["tries"] += 1
+            e["fails"] += 0 if ok or not count_failure else 1
+            e["last_try"] = now
+            if ok:
+                e["last_ok"] = now
+            self._dirty += 1
+            flush = self._dirty >= save_every
+        if flush:
+            self.save()
+
+    def expected_seconds(self, code):
+        e = self.entries.get(code)
+        if e:
+            return e["sec"]
+        known = sorted(x["sec"] for x in self.entries.values())
+        return known[len(known) // 2] if known else self.default_sec
+
+    def fail_rate(self, code):
+        e = self.entries.get(code)
+        return (e["fails"] / e["tries"]) if e and e["tries"] else 0.0
+
+    def is_stale(self, code, now=None):
+        e = self.entries.get(code)
+        if not e or not e["last_ok"]:
+            return True
+        now = now or datetime.now()
+        return now - datetime.fromisoformat(e["last_ok"]) > timedelta(days=self.stale_days)
+
+    def schedule(self, codes):
+        """
+        排定處理順序：
+        1. 過久未成功（或從未抓過）的代號優先；
+        2. 同一群內耗時長的先做（最長工作優先，平行時尾端較整齊）；
+        3. 不穩定的代號平均穿插，避免連續失敗與重試集中在同一段。
+        """
+        now = datetime.now()
+        ordered = []
+        for group in ([c for c in codes if self.is_stale(c, now)], [c for c in codes if not self.is_stale(c, now)]):
+            group = sorted(group, key=self.expected_seconds, reverse=True)
+            flaky = [c for c in group if self.fail_rate(c) > self.flaky_rate]
+            steady = [c for c in group if self.fail_rate(c) <= self.flaky_rate]
+            if flaky and steady:
+                n = len(group)
+                slots = {int((k + 0.5) * n / len(flaky)) for k in range(len(flaky))}
+                flaky_it, steady_it = iter(flaky), iter(steady)
+                group = [next(flaky_it) if i in slots else next(steady_it) for i in range(n)]
+            ordered.extend(group)
+        return ordered
+
+    def estimate(self, codes, workers=1, throttle_sec=0.0):
+        """依歷史估計處理 codes 所需秒數（以 workers 個並行工作者、最長工作優先分配）"""
+        loads = [0.0] * max(workers, 1)
+        for code in codes:
+            i = loads.index(min(loads))
+            loads[i] += self.expected_seconds(code) + throttle_sec
+        return max(loads) if codes else 0.0
+
+
+class FilingSnapshot:
+    """
+    增量模式的快照（filing_snapshot.json）：各代號上次成功抓取時的申報指紋與持股明細。
+    指紋與這次申報清單相同的代號直接沿用明細，不必重新查詢。
+    """
+
+    def __init__(self, path="filing_snapshot.json", save_every=20):
+        self.path = path
+        self.save_every = save_every
+        self.entries = {}  # 代號 -> {"fingerprint", "rows", "crawled_at"}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("codes", {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"updated_at": datetime.now().isoformat(timespec="seconds"), "codes": self.entries},
+                          f, ensure_ascii=False, default=str)
+            os.replace(tmp, self.path)
+            self._dirty = 0
+
+    def split(self, codes, fingerprints):
+        """分成 (需重新查詢, 可沿用)；不在申報清單中的代號無從比對，一律重新查詢"""
+        changed, unchanged = [], []
+        for code in codes:
+            fp = fingerprints.get(code)
+            e = self.entries.get(code)
+            if fp is None or e is None or e.get("fingerprint") != fp or not e.get("rows"):
+                changed.append(code)
+            else:
+                unchanged.append(code)
+        return changed, unchanged
+
+    def frame(self, codes):
+        """沿用代號的上次明細合成一個 DataFrame；沒有資料時回傳 None"""
+        rows = [row for code in codes for row in self.entries.get(code, {}).get("rows", [])]
+        return pd.DataFrame(rows) if rows else None
+
+    def put(self, code, fingerprint, df):
+        """記錄一檔新抓到的明細；fingerprint 為 None（不在申報清單）時只存明細，下次仍會重新查詢"""
+        with self._lock:
+            self.entries[code] = {"fingerprint": fingerprint,
+                                  "rows": json.loads(df.to_json(orient="records", force_ascii=False)),
+                                  "crawled_at": datetime.now().isoformat(timespec="seconds")}
+            self._dirty += 1
+            flush = self._dirty >= self.save_every
+        if flush:
+            self.save()
+
+
+class HoldingsStore:
+    """
+    SQLite 持股資料庫：以 (股票代號, 期別, 姓名) 為鍵 upsert，另以正規化後的姓名建索引，
+    可直接查某人在哪些公司任董監事及持股；Excel 改由此匯出。未分期別的資料期別存為空字串。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS holdings (
+            code       TEXT NOT NULL,
+            period     TEXT NOT NULL DEFAULT '',
+            name       TEXT NOT NULL,
+            name_key   TEXT NOT NULL,
+            company    TEXT,
+            holding    REAL,
+            fields     TEXT,
+            seq        INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (code, period, name)
+        );
+        -- 主鍵已涵蓋以代號（及代號+期別）查詢；持有人查詢走 name_key 索引
+        CREATE INDEX IF NOT EXISTS idx_holdings_name_key ON holdings (name_key, code, period);
+    """
+    UPSERT = """
+        INSERT INTO holdings (code, period, name, name_key, company, holding, fields, seq, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (code, period, name) DO UPDATE SET
+            company = excluded.company, holding = excluded.holding, fields = excluded.fields,
+            seq = excluded.seq, updated_at = excluded.updated_at
+    """
+    DELETE = "DELETE FROM holdings WHERE code = ? AND period = ?"
+    SELECT = "SELECT code, company, period, name, holding, fields FROM holdings"
+
+    def __init__(self, path="holdings.db", batch_size=50000):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        if "fields" not in {row[1] for row in self.conn.execute("PRAGMA table_info(holdings)")}:
+            self.conn.execute("ALTER TABLE holdings ADD COLUMN fields TEXT")  # 舊版資料庫
+
+    @staticmethod
+    def normalize_name(name):
+        """姓名正規化：全形轉半形、去除所有空白、英文字母轉小寫"""
+        return re.sub(r"\s+", "", unicodedata.normalize("NFKC", str(name))).lower()
+
+    def _rows(self, df):
+        now = datetime.now().isoformat(timespec="seconds")
+        periods = df["期別"] if "期別" in df.columns else pd.Series("", index=df.index)
+        companies = df["公司名稱"] if "公司名稱" in df.columns else pd.Series("", index=df.index)
+        holdings = pd.to_numeric(df["目前持股"].astype(str).str.replace(",", ""), errors="coerce") \
+            if "目前持股" in df.columns else pd.Series(float("nan"), index=df.index)
+        # 姓名、目前持股以外的明細欄位以 JSON 存在 fields 欄
+        extra = [c for c in FixedInputCrawler.SCHEMA_FIELDS if c in df.columns and c not in ("姓名", "目前持股")]
+        fields = json.loads(df[extra].to_json(orient="records", force_ascii=False)) if extra else [None] * len(df)
+        seq = {}
+        for code, period, company, name, holding, extras in zip(df["股票代號"], periods, companies, df["姓名"],
+                                                                holdings, fields):
+            if pd.isna(name) or re.search(r"姓名|名稱", str(name)):
+                continue  # 表頭殘留
+            key = (str(code), "" if pd.isna(period) else str(period))
+            seq[key] = seq.get(key, 0) + 1
+            extras = {k: v for k, v in (extras or {}).items() if v is not None}
+            yield (key[0], key[1], str(name).strip(), self.normalize_name(name),
+                   None if pd.isna(company) else str(company),
+                   None if pd.isna(holding) else float(holding),
+                   json.dumps(extras, ensure_ascii=False) if extras else None, seq[key], now)
+
+    @staticmethod
+    def _frame(rows):
+        """查詢結果轉為 DataFrame：持股轉回整數，fields 展開成各明細欄位"""
+        df = pd.DataFrame(rows, columns=["股票代號", "公司名稱", "期別", "姓名", "目前持股", "fields"])
+        df["目前持股"] = pd.to_numeric(df["目前持股"]).round().astype("Int64")
+        extras = pd.DataFrame([json.loads(f) if f else {} for f in df.pop("fields")], index=df.index)
+        return pd.concat([df, extras], axis=1) if len(extras.columns) else df
+
+    def upsert(self, df):
+        """
+        寫入一批資料（整批在同一個交易內，每 batch_size 筆一次 executemany），回傳筆數。
+        每個 (代號, 期別) 第一次出現時先刪掉資料庫裡的舊列，已卸任的董監事不會殘留；
+        因此同一代號、期別的資料須在同一次呼叫中完整寫入。
+        """
+        count = 0
+        rows = self._rows(df)
+        cleared = set()
+        with self._lock, self.conn:
+            while True:
+                batch = [row for _, row in zip(range(self.batch_size), rows)]
+                if not batch:
+                    break
+                keys = {row[:2] for row in batch} - cleared
+                self.conn.executemany(self.DELETE, keys)
+                cleared |= keys
+                self.conn.executemany(self.UPSERT, batch)
+                count += len(batch)
+        return count
+
+    def lookup_holder(self, name, prefix=False):
+        """依姓名查詢任職的公司與持股；prefix=True 時以姓名開頭比對（仍走索引）"""
+        key = self.normalize_name(name)
+        if prefix:
+            where, params = "name_key >= ? AND name_key < ?", (key, key + "\U0010ffff")
+        else:
+            where, params = "name_key = ?", (key,)
+        with self._lock:
+            cur = self.conn.execute(f"{self.SELECT} WHERE {where} ORDER BY code, period", params)
+            rows = cur.fetchall()
+        return self._frame(rows)
+
+    def holdings_of(self, code, period=None):
+        """查詢單一公司（可指定期別）的董監事持股"""
+        sql = f"{self.SELECT} WHERE code = ?"
+        params = [code]
+        if period is not None:
+            sql += " AND period = ?"
+            params.append(period)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY period, seq", params).fetchall()
+        return self._frame(rows)
+
+    def iter_frames(self, codes=None, periods=None, chunk_rows=50000):
+        """依代號、期別、原始順序分批讀出（periods 為 None 時只取未分期別的資料）"""
+        period_sql = "period = ''" if periods is None else \
+            f"period IN ({','.join('?' * len(periods))})"
+        period_params = [] if periods is None else list(periods)
+        code_groups = [None] if codes is None else [codes[i:i + 500] for i in range(0, len(codes), 500)]
+        for group in code_groups:
+            sql = f"{self.SELECT} WHERE {period_sql}"
+            params = list(period_params)
+            if group is not None:
+                sql += f" AND code IN ({','.join('?' * len(group))})"
+                params += group
+            with self._lock:
+                cur = self.conn.execute(sql + " ORDER BY code, period, seq", params)
+                while True:
+                    rows = cur.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    yield self._frame(rows)
+
+    def export_excel(self, out_path, columns, codes=None, periods=None, failures=None,
+                     column_widths=None, logger=None):
+        """把資料庫內容串流匯出成 Excel（合併表 + 失敗記錄），回傳匯出筆數"""
+        writer = StreamingExcelWriter(out_path, columns, column_widths, logger=logger)
+        total = 0
+        for df in self.iter_frames(codes, periods):
+            writer.append(df)
+            total += len(df)
+        if failures is not None and len(failures):
+            writer.write_sheet("失敗記錄", failures)
+        writer.close()
+        return total
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class _ResultPageParser(HTMLParser):
+    """離線解析查詢結果頁：收集所有表格的列與儲存格，以及依文件順序的文字節點"""
+
+    def __init__(self):
+        super().__init__()
+        self.tables = []   # 每個表格: {"text": [...], "rows": [[(tag, text), ...], ...]}
+        self.texts = []
+        self._table_stack = []
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            table = {"text": [], "rows": []}
+            self.tables.append(table)
+            self._table_stack.append(table)
+        elif tag == "tr" and self._table_stack:
+            self._table_stack[-1]["rows"].append([])
+        elif tag in ("td", "th") and self._table_stack and self._table_stack[-1]["rows"]:
+            self._cell = [tag, []]
+            self._table_stack[-1]["rows"][-1].append(self._cell)
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._table_stack:
+            self._table_stack.pop()
+        elif tag in ("td", "th"):
+            self._cell = None
+
+    def handle_data(self, data):
+        text = data.strip()
+        if not text:
+            return
+        self.texts.append(text)
+        for table in self._table_stack:
+            table["text"].append(text)
+        if self._cell is not None:
+            self._cell[1].append(text)
+
+
+class DeadlineExceeded(Exception):
+    """單檔處理超過時限（--code-deadline）"""
+
+
+class Deadline:
+    """單檔的時間預算：流程中的等待、逾時與輪詢都從剩餘時間扣除"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def check(self):
+        """時間已用完時拋出 DeadlineExceeded"""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"超過單檔時限 {self.seconds:g} 秒")
+
+    def cap(self, seconds):
+        """回傳不超過剩餘時間的秒數；時間已用完時拋出 DeadlineExceeded"""
+        self.check()
+        return min(seconds, self.remaining())
+
+    @staticmethod
+    def parse(spec):
+        """把 "45s"、"2m"、"90" 之類的字串轉為秒數"""
+        m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*", str(spec).lower())
+        if not m:
+            raise ValueError(f"無法解析時限: {spec}")
+        return float(m.group(1)) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[m.group(2) or "s"]
+
+
+class _StageStats:
+    """管線各階段的忙碌時間統計，用來找出瓶頸階段"""
+
     def __init__(self):
+        self.busy = {}
+        self.workers = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, workers=1):
+        with self._lock:
+            self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+            self.workers.setdefault(stage, workers)
+
+    def track(self, stage, workers=1):
+        from contextlib import contextmanager
+
+        @contextmanager
+        def _timer():
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.add(stage, time.perf_counter() - start, workers)
+        return _timer()
+
+    def occupancy(self, wall):
+        """各階段忙碌比例 = 忙碌秒數 /（總時間 × 該階段工作者數）"""
+        return {stage: busy / (wall * self.workers[stage]) if wall > 0 else 0.0
+                for stage, busy in self.busy.items()}
+
+
+class DriverTracer:
+    """
+    包住 driver.execute，統計每個 WebDriver 指令（每次都是一趟 chromedriver 往返）的次數與耗時。
+
+    依「指令類型」與「呼叫階段」（本模組中最接近的呼叫函式，例如 find_and_fill_company_input）分組，
+    每檔代號結束時寫一份明細到 CSV 並記錄一行摘要；round_trip_budget 可用來在往返次數退步時警告。
+    """
+
+    CSV_COLUMNS = ["代號", "階段", "指令", "次數", "秒數"]
+    # 共用的輔助函式，本身不是階段：往上略過，把指令算到真正呼叫它們的階段
+    HELPER_FRAMES = frozenset({"_find", "_find_now", "_cdp", "_poll", "probe", "ready", "_pause",
+                               "acquire", "_set_implicit_wait", "_apply_driver_timeouts"})
+
+    def __init__(self, logger, path="driver_trace.csv", round_trip_budget=None):
+        self.logger = logger
+        self.path = path
+        self.round_trip_budget = round_trip_budget
+        self.current = None
+        self.totals = {}        # (階段, 指令) -> [次數, 秒數]，跨代號累計
+        self.codes = []         # [(代號, 往返次數, driver 秒數, 牆鐘秒數)]
+        self.over_budget = []
+        self._counts = {}
+        self._started = None
+        self._lock = threading.Lock()
+
+    def attach(self, driver):
+        """把 driver.execute 換成計時版本；WebElement 的操作也都經由 driver.execute"""
+        if getattr(driver.execute, "_traced", False):
+            return driver
+        original = driver.execute
+
+        def traced(command, params=None):
+            stage = self._stage_of(sys._getframe(1))
+            start = time.perf_counter()
+            try:
+                return original(command, params)
+            finally:
+                self._add(stage, command, time.perf_counter() - start)
+
+        traced._traced = True
+        driver.execute = traced
+        return driver
+
+    @classmethod
+    def _stage_of(cls, frame):
+        """往上找到第一個屬於本模組、且不是輔助函式的呼叫者，以其函式名稱作為階段"""
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename == __file__ and code.co_name not in cls.HELPER_FRAMES:
+                return code.co_name
+            frame = frame.f_back
+        return "?"
+
+    def _add(self, stage, command, seconds):
+        with self._lock:
+            for bucket in (self._counts, self.totals):
+                entry = bucket.setdefault((stage, command), [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+
+    def begin(self, code):
+        with self._lock:
+            self.current = code
+            self._counts = {}
+            self._started = time.perf_counter()
+
+    def end(self):
+        """結束目前代號：寫出明細並記錄摘要"""
+        with self._lock:
+            code, counts = self.current, self._counts
+            wall = time.perf_counter() - self._started if self._started else 0.0
+            self.current, self._counts, self._started = None, {}, None
+        if code is None:
+            return
+        trips = sum(n for n, _ in counts.values())
+        driver_sec = sum(sec for _, sec in counts.values())
+        self.codes.append((code, trips, driver_sec, wall))
+
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", encoding="utf-8-sig" if new_file else "utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(self.CSV_COLUMNS)
+            for (stage, command), (n, sec) in sorted(counts.items(), key=lambda kv: -kv[1][0]):
+                writer.writerow([code, stage, command, n, f"{sec:.4f}"])
+
+        by_stage = {}
+        for (stage, _), (n, _) in counts.items():
+            by_stage[stage] = by_stage.get(stage, 0) + n
+        top = "、".join(f"{stage} {n}" for stage, n in sorted(by_stage.items(), key=lambda kv: -kv[1])[:4])
+        self.logger.info(f"🔎 {code}: {trips} 次往返，driver {driver_sec:.2f}s / 總計 {wall:.2f}s；{top}")
+        if self.round_trip_budget and trips > self.round_trip_budget:
+            self.over_budget.append(code)
+            self.logger.warning(f"⚠️ {code} 往返 {trips} 次，超過上限 {self.round_trip_budget}")
+
+    def summary(self, top=15):
+        """整批摘要：每檔平均往返次數與最耗往返的 (階段, 指令)；超過上限時回傳 False"""
+        if not self.codes:
+            return True
+        n = len(self.codes)
+        trips = sum(c[1] for c in self.codes)
+        driver_sec = sum(c[2] for c in self.codes)
+        wall = sum(c[3] for c in self.codes)
+        self.logger.info(f"📊 WebDriver 往返：{n} 檔，平均每檔 {trips/n:.1f} 次、driver {driver_sec/n:.2f}s、"
+                         f"總計 {wall/n:.2f}s；明細: {self.path}")
+        for (stage, command), (count, sec) in sorted(self.totals.items(), key=lambda kv: -kv[1][0])[:top]:
+            self.logger.info(f"   {stage:32s} {command:24s} {count:6d} 次 {sec:8.2f}s")
+        if self.over_budget:
+            self.logger.warning(f"⚠️ {len(self.over_budget)} 檔超過往返上限 {self.round_trip_budget}: "
+                                f"{', '.join(self.over_budget[:20])}")
+        return not self.over_budget
+
+
+class FixedInputCrawler:
+    # 輸出欄位（合併表與各代號分頁共用）
+    OUTPUT_COLUMNS = ["股票代號", "公司名稱", "姓名", "目前持股"]
+    PERIOD_COLUMNS = ["股票代號", "公司名稱", "期別", "姓名", "目前持股"]
+    COLUMN_WIDTHS = {"股票代號": 14, "公司名稱": 20, "期別": 10, "姓名": 30, "目前持股": 20,
+                     "職稱": 14, "選任時持股": 16, "設質股數": 16, "設質比例": 12, "配偶未成年子女持股": 20,
+                     "關係人持股合計": 18, "關係人設質股數": 18, "關係人設質比例": 16}
+
+    # 辨識姓名欄與目前持股欄的關鍵詞
+    NAME_KEYWORDS = ["姓名","名稱","姓名/名稱","董監事姓名"]
+    HOLDING_KEYWORDS = ["目前持股","目前持股數","目前持股(股)","現有持股"]
+
+    # 持股明細欄位：(欄名, 表頭關鍵詞, 型別)。表頭對應到「所含關鍵詞最長」的欄位，
+    # 所以「內部人關係人目前持股合計」不會被當成「目前持股」。型別 int 為股數、pct 為百分比數值
+    HOLDINGS_SCHEMA = [
+        ("職稱", ["職稱", "身分別"], "text"),
+        ("姓名", NAME_KEYWORDS, "text"),
+        ("選任時持股", ["選任時持股"], "int"),
+        ("目前持股", HOLDING_KEYWORDS, "int"),
+        ("設質股數", ["設質股數"], "int"),
+        ("設質比例", ["設質股數佔持股比例", "設質比例"], "pct"),
+        ("配偶未成年子女持股", ["配偶", "未成年子女"], "int"),
+        ("關係人持股合計", ["內部人關係人目前持股合計", "關係人目前持股"], "int"),
+        ("關係人設質股數", ["內部人關係人設質股數", "關係人設質股數"], "int"),
+        ("關係人設質比例", ["內部人關係人設質股數比例", "關係人設質股數比例", "關係人設質比例"], "pct"),
+    ]
+    SCHEMA_FIELDS = [field for field, _, _ in HOLDINGS_SCHEMA]
+    DEFAULT_FIELDS = ["姓名", "目前持股"]
+    # 不屬於明細、但會含到上面關鍵詞的欄位（例如「公司名稱」含「名稱」）
+    SCHEMA_IGNORED = ["公司代號", "公司名稱", "資料年月", "出表日期"]
+
+    # 上市、上櫃、興櫃公司清單來源（TWSE 證券編碼公告）
+    COMPANY_INDEX_SOURCES = {
+        "上市": "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2",
+        "上櫃": "https://isin.twse.com.tw/isin/C_public.jsp?strMode=4",
+        "興櫃": "https://isin.twse.com.tw/isin/C_public.jsp?strMode=5",
+    }
+
+    # 董監事持股餘額明細公開資料（整個市場一次下載）
+    BULK_SOURCES = {
+        "上市": "https://mopsfin.twse.com.tw/opendata/t187ap11_L.csv",
+        "上櫃": "https://mopsfin.twse.com.tw/opendata/t187ap11_O.csv",
+        "興櫃": "https://mopsfin.twse.com.tw/opendata/t187ap11_R.csv",
+    }
+
+    # 頁面載入時以 CDP 擋掉的資源（圖片、字型、分析追蹤等非必要請求）
+    BLOCKED_URL_PATTERNS = [
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico", "*.bmp",
+        "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+        "*.mp4", "*.webm",
+        "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+        "*facebook.net*", "*connect.facebook*", "*hotjar.com*", "*clarity.ms*",
+    ]
+
+    # 目標頁是否已就緒：不序列化整頁，只檢查路由、查詢表單文字與輸入框
+    TARGET_PAGE_PROBE = """
+        if (!document.body || /#\\/web\\/home/.test(location.hash)) return false;
+        const text = document.body.textContent || '';
+        return (text.includes(arguments[0]) || text.includes('查詢條件'))
+            && document.querySelector('input[type=text], input:not([type])') !== null;
+    """
+
+    # 查詢後的結果狀態：依序比對頁面文字（或跳出的 alert），比對不到且無資料表時為 unknown
+    RESULT_PATTERNS = [
+        ("invalid_code", r"公司代號.{0,6}(不存在|錯誤|有誤)|查無(此)?公司|請輸入正確"),
+        ("no_data", r"查無(相關)?資料|無(符合|相關)資料|資料不存在"),
+        ("site_error", r"系統(忙碌|錯誤|維護)|稍後再(試|查詢)|服務暫停|Internal Server Error|Service Unavailable|Bad Gateway"),
+    ]
+    RESULT_REASONS = {"no_data": "查無資料", "invalid_code": "查無此公司代號", "site_error": "網站錯誤"}
+    TERMINAL_RESULT_STATES = ("no_data", "invalid_code")  # 重試也不會有結果
+
+    DEADLINE_REASON = "超過單檔時限"
+
+    # 各階段失敗時在原地重試的次數（不回到主頁重新開始），以及用盡後的失敗原因
+    STAGE_RETRIES = {"navigate": 2, "fill": 2, "query": 2, "download": 2, "parse": 1}
+    # 沒有單檔時限約束時的重試上限：每個階段最多兩次嘗試，與原本整檔重試一次（--retry 1）的最壞耗時相同
+    UNBOUNDED_STAGE_RETRIES = {"navigate": 1, "fill": 1, "query": 1, "download": 1}
+    STAGE_FAILURE_REASONS = {
+        "navigate": "無法進入查詢頁", "fill": "找不到代號輸入框", "query": "查詢送出失敗",
+        "download": "CSV 下載失敗", "parse": "數據提取失敗",
+    }
+    # 查詢前記下標記：之後只看這次查詢新增或改變的節點，避免頁面上原有的「查無資料」、
+    # 上一檔殘留的結果或無關的載入提示被當成這次的結果；內容相同的重繪也能偵測到
+    RESULT_MARK_SCRIPT = """
+        if (window.__queryObserver) window.__queryObserver.disconnect();
+        const changed = window.__queryChanged = [];
+        if (!document.body) return;
+        window.__queryObserver = new MutationObserver(records => {
+            for (const r of records) {
+                if (r.type === 'characterData') changed.push(r.target.parentNode);
+                else changed.push(...r.addedNodes);
+            }
+        });
+        window.__queryObserver.observe(document.body, {childList: true, subtree: true, characterData: true});
+    """
+    RESULT_STATE_PROBE = """
+        const body = document.body;
+        if (!body) return null;
+        // 標記不見了表示查詢後整頁重新載入，整頁都算這次的結果
+        let nodes = window.__queryChanged === undefined ? [body] : window.__queryChanged;
+        nodes = nodes.filter(n => n && n.isConnected);
+        if (!nodes.length) return null;  // 頁面尚未因這次查詢而改變
+        const sel = 'table td, a[href*=".csv" i]';
+        let text = '', hasData = false;
+        for (const n of nodes) {
+            if (n.nodeType !== 1) { text += '\\n' + (n.textContent || ''); continue; }
+            text += '\\n' + (n.innerText || '');
+            hasData = hasData || n.matches(sel) || n.querySelector(sel) !== null;
+        }
+        if (hasData && body.innerText.includes('目前持股')) return 'data';
+        for (const [state, pattern] of arguments[0]) {
+            if (new RegExp(pattern).test(text)) return state;
+        }
+        return null;
+    """
+
+    def __init__(self, block_resources=True, capture_xhr=False, archive_dir=None, download_dir=None,
+                 trace_driver=False, round_trip_budget=None, store_path=None, code_deadline=None,
+                 profile_dir=None, columns=None):
         """初始化修复输入框的爬虫"""
         self.setup_logging()
         self.driver = None
+        # 沿用的 Chrome 設定檔（含磁碟快取）；None 表示每次啟動都用拋棄式設定檔
+        self.profile = ChromeProfile(profile_dir) if profile_dir else None
+        self.store = HoldingsStore(store_path) if store_path else None  # 有指定時結果寫入 SQLite，Excel 由此匯出
+        self._history = None              # 各代號耗時與失敗歷史，第一次用到時才載入（見 history）
+        self.schedule_by_history = True   # False 時依輸入檔順序處理
+        self.code_deadline = code_deadline  # 單檔時限（秒），None 表示不限
+        self._deadline = None
+        self._implicit_applied = None       # 最後一次送出的隱式等待秒數，未變時不再重送 setTimeouts
+        # WebDriver 往返統計（選用）
+        self.tracer = DriverTracer(self.logger, round_trip_budget=round_trip_budget) if trace_driver else None
+        self.archive = RawArchive(archive_dir) if archive_dir else None  # 原始回應封存
+        self._current_code = None
+        self._current_period = None
+        self._crawl_id = None
+        self.block_resources = block_resources  # 網站異常時可關閉資源阻擋與 eager 載入
+        self.capture_xhr = capture_xhr          # 直接從網路回應擷取查詢結果
         self.all_data = {}
         self.failed_codes = []
+        self.failure_reasons = {}  # 代號 -> 失敗原因
+        self._failure_lock = threading.Lock()  # 管線模式下寫入執行緒與主執行緒都會記錄失敗
+        self._tab = None           # 多分頁模式下此實例負責的分頁（見 TabGroup）
+        self.result_state = None   # 最近一次查詢的結果狀態（見 _classify_result）
+        self.last_failure_reason = None
+        self.period_reasons = {}
+        self.stage_retry_counts = {}  # 階段 -> 本輪重試次數
+        self.stage_exhausted = None   # 本輪用盡原地重試的階段（外層據此不再整檔重試）
+        self._stage_lock = threading.Lock()
+        self.company_index = {}    # 代號 -> (公司名稱, 市場別)
+        self.holding_fields = list(columns or self.DEFAULT_FIELDS)  # 輸出的明細欄位（見 --columns）
+        self.output_columns = self._columns(self.OUTPUT_COLUMNS)
+        self._http_session = None  # 沿用同一個 requests session，保持連線
         self.processed_count = 0  # 已處理的股票數量計數器
 
         # 设置下载目录
-        self.download_dir = os.path.join(os.getcwd(), "downloads")
+        self.download_dir = download_dir or os.path.join(os.getcwd(), "downloads")
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
             self.logger.info(f"📁 创建下载目录: {self.download_dir}")
@@ -43,6 +1170,72 @@ class FixedInputCrawler:
         # 导航信息
         self.main_url = "https://mops.twse.com.tw/mops/#/web/home"
         self.target_menu_text = "董監事持股餘額"
+        self.route_cache_path = "route_cache.json"  # 學到的目標頁路由，下次直接開啟
+        self._route_url = None
+
+    @classmethod
+    def parse_columns(cls, spec):
+        """解析 --columns：all 或以逗號分隔的明細欄位；姓名一定輸出（合併去重以它為鍵）"""
+        if str(spec).strip().lower() == "all":
+            return list(cls.SCHEMA_FIELDS)
+        fields = [f.strip() for f in re.split(r"[,，]", str(spec)) if f.strip()]
+        unknown = [f for f in fields if f not in cls.SCHEMA_FIELDS]
+        if unknown:
+            raise ValueError(f"未知的欄位: {', '.join(unknown)}（可用: {', '.join(cls.SCHEMA_FIELDS)}）")
+        if "姓名" not in fields:
+            fields.insert(0, "姓名")
+        return list(dict.fromkeys(fields))
+
+    def _columns(self, base):
+        """輸出欄位：代號、公司名稱（、期別）之後接選定的明細欄位"""
+        return [c for c in base if c not in self.DEFAULT_FIELDS] + self.holding_fields
+
+    @classmethod
+    def _schema_field(cls, header):
+        """表頭對應的明細欄位（所含關鍵詞最長者為準），不屬於明細時回傳 None"""
+        header = str(header).strip()
+        best, best_len = None, 0
+        for field, keywords, _ in cls.HOLDINGS_SCHEMA + [(None, cls.SCHEMA_IGNORED, None)]:
+            for keyword in keywords:
+                if keyword in header and len(keyword) > best_len:
+                    best, best_len = field, len(keyword)
+        return best
+
+    @classmethod
+    def _schema_columns(cls, headers):
+        """{明細欄位: 表頭位置}；同一欄位以第一個對應到的表頭為準"""
+        found = {}
+        for pos, header in enumerate(headers):
+            field = cls._schema_field(header)
+            if field and field not in found:
+                found[field] = pos
+        return found
+
+    def _labelled_fields(self, texts):
+        """從「欄名：值」形式的文字（值可能在下一個文字節點）取出明細欄位，同一欄位以第一次出現為準"""
+        fields = {}
+        for k, text in enumerate(texts):
+            if "：" not in text:
+                continue
+            label, value = text.split("：", 1)
+            field = self._schema_field(label)
+            if field is None or field in fields:
+                continue
+            value = value.strip()
+            if not value and k + 1 < len(texts) and "：" not in texts[k + 1]:
+                value = texts[k + 1].strip()
+            fields[field] = value
+        return fields
+
+    def _coerce_schema(self, df):
+        """依 HOLDINGS_SCHEMA 轉型：股數去千分位轉整數、比例轉百分比數值；無法轉換的值留空"""
+        for field, _, kind in self.HOLDINGS_SCHEMA:
+            if kind == "text" or field not in df.columns:
+                continue
+            text = df[field].astype(str).str.replace(r"[,\s%股]", "", regex=True)
+            values = pd.to_numeric(text, errors="coerce")
+            df[field] = values.round().astype("Int64") if kind == "int" else values
+        return df
 
     def read_stock_codes(self, path="股票代號.txt"):
         """讀取股票代號清單文件"""
@@ -70,58 +1263,157 @@ class FixedInputCrawler:
         self.logger.info(f"📋 讀到 {len(uniq)} 個代號")
         return uniq
 
+    def load_company_index(self, path="company_index.csv", max_age_days=7, refresh=False):
+        """載入上市櫃公司清單（代號、名稱、市場別），本地快取過期才重新抓取"""
+        fresh = os.path.exists(path) and (time.time() - os.path.getmtime(path)) < max_age_days * 86400
+        if fresh and not refresh:
+            self.company_index = self._read_company_index(path)
+            self.logger.info(f"📇 使用本地公司清單快取: {path}（{len(self.company_index)} 家）")
+            return self.company_index
+
+        index = {}
+        for market, url in self.COMPANY_INDEX_SOURCES.items():
+            rows = self._fetch_company_list(url)
+            self.logger.info(f"📇 {market}: 取得 {len(rows)} 家公司")
+            for code, name in rows:
+                index.setdefault(code, (name, market))
+
+        if index:
+            with open(path, "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["代號", "名稱", "市場別"])
+                for code, (name, market) in sorted(index.items()):
+                    writer.writerow([code, name, market])
+            self.company_index = index
+            self.logger.info(f"✅ 公司清單已更新: {path}（{len(index)} 家）")
+        elif os.path.exists(path):
+            # 抓取失敗時退回舊快取，避免整批代號被誤判為無效
+            self.company_index = self._read_company_index(path)
+            self.logger.warning(f"⚠️ 公司清單更新失敗，沿用舊快取（{len(self.company_index)} 家）")
+        else:
+            self.company_index = {}
+            self.logger.warning("⚠️ 無法取得公司清單，將略過代號檢查")
+        return self.company_index
+
+    def _read_company_index(self, path):
+        """讀取本地公司清單快取"""
+        index = {}
+        try:
+            with open(path, "r", encoding="utf-8-sig", newline="") as f:
+                for row in csv.DictReader(f):
+                    if row.get("代號"):
+                        index[row["代號"]] = (row.get("名稱", ""), row.get("市場別", ""))
+        except Exception as e:
+            self.logger.warning(f"⚠️ 讀取公司清單快取失敗: {e}")
+        return index
+
+    def _fetch_company_list(self, url):
+        """抓取證券編碼公告頁面，只保留「股票」區段的 (代號, 名稱)"""
+        try:
+            r = requests.get(url, timeout=30, verify=False)
+            r.raise_for_status()
+            html = r.content.decode("cp950", errors="replace")
+        except Exception as e:
+            self.logger.warning(f"⚠️ 抓取公司清單失敗 {url}: {e}")
+            return []
+
+        rows = []
+        section = None
+        for tr in re.findall(r"<tr[^>]*>(.*?)</tr>", html, re.S | re.I):
+            cells = [re.sub(r"<[^>]+>", "", c).strip() for c in re.findall(r"<td[^>]*>(.*?)</td>", tr, re.S | re.I)]
+            if len(cells) == 1:
+                # 區段標題列，例如「股票」、「上市認購(售)權證」
+                section = cells[0]
+                continue
+            if not cells or (section is not None and section != "股票"):
+                continue
+            m = re.match(r"^(\d{4,6})[\s\u3000]+(.+)$", cells[0])
+            if m:
+                rows.append((m.group(1), m.group(2).strip()))
+        return rows
+
+    def validate_codes(self, codes):
+        """以公司清單檢查代號，回傳 (有效代號, 未知代號)；清單為空時不檢查"""
+        if not self.company_index:
+            return list(codes), []
+        valid = [c for c in codes if c in self.company_index]
+        unknown = [c for c in codes if c not in self.company_index]
+        if unknown:
+            self.logger.warning(f"⚠️ {len(unknown)} 個代號不在上市櫃公司清單中: {unknown[:20]}")
+        return valid, unknown
+
+    def company_name(self, stock_code):
+        """查詢公司名稱（清單中沒有則回傳空字串）"""
+        return self.company_index.get(stock_code, ("", ""))[0]
+
+    def record_failure(self, stock_code, reason):
+        """記錄失敗代號與原因（可由多個執行緒呼叫）"""
+        with self._failure_lock:
+            if stock_code not in self.failure_reasons:
+                self.failed_codes.append(stock_code)
+            self.failure_reasons[stock_code] = reason
+
+    def _failures_df(self):
+        """失敗記錄工作表內容"""
+        return pd.DataFrame({
+            "失敗的股票代號": self.failed_codes,
+            "原因": [self.failure_reasons.get(c, "") for c in self.failed_codes],
+        })
+
+    def _format_sheet(self, ws, columns):
+        """套用表頭樣式與欄寬"""
+        from openpyxl.styles import Font, PatternFill, Alignment
+        from openpyxl.utils import get_column_letter
+
+        header_font = Font(bold=True, color="FFFFFF")
+        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        for cell in ws[1]:
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = Alignment(horizontal="center")
+        for i, col in enumerate(columns, 1):
+            ws.column_dimensions[get_column_letter(i)].width = self.COLUMN_WIDTHS.get(col, 16)
+
     def append_to_master_excel(self, out_path, df_chunk):
         """
-        將 df_chunk（欄位必為 股票代號, 姓名, 目前持股）追加到 out_path 的「合併」工作表。
-        若檔案不存在或沒有「合併」，就新建。
+        將 df_chunk（欄位為 self.output_columns）追加到 out_path 的「合併」工作表。
+        若檔案不存在或沒有「合併」，就新建。啟用資料庫時改為 upsert 到資料庫，Excel 於結束時匯出。
         """
         import pandas as pd
-        from openpyxl.styles import Font, PatternFill, Alignment
         import os
 
-        df_chunk = df_chunk[["股票代號","姓名","目前持股"]].copy()
+        if self.store is not None:
+            n = self.store.upsert(df_chunk)
+            self.logger.info(f"✅ 寫入資料庫 {self.store.path}: {n} 筆")
+            return
+
+        columns = self.output_columns
+        df_chunk = df_chunk.reindex(columns=columns).copy()
 
         if not os.path.exists(out_path):
             # 新建：直接寫入並套表頭樣式
             with pd.ExcelWriter(out_path, engine="openpyxl") as writer:
                 df_chunk.to_excel(writer, sheet_name="合併", index=False)
-                ws = writer.sheets["合併"]
-                header_font = Font(bold=True, color="FFFFFF")
-                header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                for cell in ws[1]:
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.alignment = Alignment(horizontal="center")
-                ws.column_dimensions['A'].width = 14
-                ws.column_dimensions['B'].width = 30
-                ws.column_dimensions['C'].width = 20
+                self._format_sheet(writer.sheets["合併"], columns)
             self.logger.info(f"✅ 新建 Excel 並寫入: {out_path}")
             return
 
         # 已存在：讀舊合併、合併後整張重寫
         try:
-            old = pd.read_excel(out_path, sheet_name="合併", engine="openpyxl")
+            old = pd.read_excel(out_path, sheet_name="合併", engine="openpyxl", dtype={"股票代號": str})
         except Exception:
-            old = pd.DataFrame(columns=["股票代號","姓名","目前持股"])
+            old = pd.DataFrame(columns=columns)
 
-        merged = pd.concat([old, df_chunk], ignore_index=True)
+        merged = pd.concat([old.reindex(columns=columns), df_chunk], ignore_index=True)
         # 移除明顯表頭殘留與重複
         merged = merged.dropna(subset=["姓名"])
         merged = merged[~merged["姓名"].astype(str).str.contains("姓名|名稱", na=False)]
-        merged = merged.drop_duplicates(subset=["股票代號","姓名"], keep="last")
+        key = ["股票代號","期別","姓名"] if "期別" in columns else ["股票代號","姓名"]
+        merged = merged.drop_duplicates(subset=key, keep="last")
 
         with pd.ExcelWriter(out_path, engine="openpyxl", mode="w") as writer:
             merged.to_excel(writer, sheet_name="合併", index=False)
-            ws = writer.sheets["合併"]
-            header_font = Font(bold=True, color="FFFFFF")
-            header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            for cell in ws[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = Alignment(horizontal="center")
-            ws.column_dimensions['A'].width = 14
-            ws.column_dimensions['B'].width = 30
-            ws.column_dimensions['C'].width = 20
+            self._format_sheet(writer.sheets["合併"], columns)
         self.logger.info(f"✅ 追加資料至 Excel: {out_path} (目前共 {len(merged)} 筆)")
 
     def load_processed_codes(self, path="processed_codes.txt"):
@@ -160,8 +1452,6 @@ class FixedInputCrawler:
         options.add_argument('--disable-features=VizDisplayCompositor')
         options.add_argument('--disable-extensions')
         options.add_argument('--disable-plugins')
-        options.add_argument('--disable-images')  # 關閉圖片載入
-        options.add_argument('--disable-javascript')
         options.add_argument('--disable-background-timer-throttling')
         options.add_argument('--disable-renderer-backgrounding')
         options.add_argument('--disable-backgrounding-occluded-windows')
@@ -175,6 +1465,10 @@ class FixedInputCrawler:
         # 記憶體優化
         options.add_argument('--max_old_space_size=4096')
         options.add_argument('--memory-pressure-off')
+        if self.profile:
+            # 沿用設定檔：重啟後 JS/CSS/字型與 Code Cache 直接從磁碟讀取
+            for arg in self.profile.arguments():
+                options.add_argument(arg)
 
         # 设置自动下载选项
         prefs = {
@@ -185,25 +1479,250 @@ class FixedInputCrawler:
             "profile.default_content_setting_values.automatic_downloads": 1,
             "profile.default_content_setting_values.popups": 1
         }
+        if self.capture_xhr:
+            # 開啟 performance log，才能從 Network 事件找到查詢 API 的回應
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        if self.block_resources:
+            # 圖片改以偏好設定關閉；DOMContentLoaded 後就交回控制，不等所有資源
+            prefs["profile.managed_default_content_settings.images"] = 2
+            options.page_load_strategy = "eager"
         options.add_experimental_option("prefs", prefs)
 
         return options
 
+    def _cdp(self, cmd, params=None):
+        """執行 Chrome DevTools Protocol 指令"""
+        return self.driver.execute_cdp_cmd(cmd, params or {})
+
+    def apply_resource_blocking(self, enabled=True):
+        """以 Network.setBlockedURLs 擋掉非必要資源（enabled=False 則解除）"""
+        try:
+            self._cdp("Network.enable")
+            self._cdp("Network.setBlockedURLs", {"urls": self.BLOCKED_URL_PATTERNS if enabled else []})
+            if enabled:
+                self.logger.info(f"🚫 已啟用資源阻擋（{len(self.BLOCKED_URL_PATTERNS)} 條規則）")
+            return True
+        except Exception as e:
+            self.logger.warning(f"⚠️ 設定資源阻擋失敗: {e}")
+            return False
+
+    def _page_load_stats(self):
+        """從 Performance API 取得目前頁面的傳輸量與載入時間"""
+        return self.driver.execute_script("""
+            const nav = performance.getEntriesByType('navigation')[0] || {};
+            const res = performance.getEntriesByType('resource');
+            let bytes = nav.transferSize || 0;
+            for (const r of res) { bytes += r.transferSize || 0; }
+            return {bytes: bytes, requests: res.length + 1,
+                    dom_ms: Math.round(nav.domContentLoadedEventEnd || 0),
+                    load_ms: Math.round(nav.loadEventEnd || 0)};
+        """)
+
+    def measure_page_load(self, runs=3, settle_sec=5):
+        """
+        量測模式：同一個瀏覽器交替以「不阻擋」與「阻擋」載入主頁 runs 次，
+        每次載入前清除快取，回報平均傳輸量、請求數與載入時間，以及阻擋後節省的量。
+        """
+        if self.driver is None and not self.init_driver():
+            return None
+        totals = {False: [], True: []}
+        try:
+            for i in range(runs):
+                for blocked in (False, True):
+                    self._cdp("Network.clearBrowserCache")
+                    self.apply_resource_blocking(blocked)
+                    start = time.time()
+                    self.driver.get(self.main_url)
+                    get_sec = time.time() - start
+                    time.sleep(settle_sec)  # 讓 SPA 的後續請求完成
+                    stats = self._page_load_stats()
+                    stats["get_sec"] = get_sec
+                    totals[blocked].append(stats)
+                    label = "阻擋" if blocked else "不阻擋"
+                    self.logger.info(f"📏 第{i+1}次 {label}: {stats['bytes']/1024:.0f} KB, "
+                                     f"{stats['requests']} 個請求, driver.get {get_sec:.2f}s, "
+                                     f"DOMContentLoaded {stats['dom_ms']}ms, load {stats['load_ms']}ms")
+        finally:
+            self.apply_resource_blocking(self.block_resources)
+
+        def avg(rows, key):
+            return sum(r[key] for r in rows) / len(rows)
+
+        report = {}
+        for key in ("bytes", "requests", "get_sec", "dom_ms", "load_ms"):
+            report[key] = (avg(totals[False], key), avg(totals[True], key))
+        off, on = report["bytes"]
+        self.logger.info(f"📊 平均傳輸量: 不阻擋 {off/1024:.0f} KB → 阻擋 {on/1024:.0f} KB（節省 {(off-on)/1024:.0f} KB）")
+        off, on = report["get_sec"]
+        self.logger.info(f"📊 平均 driver.get: 不阻擋 {off:.2f}s → 阻擋 {on:.2f}s（節省 {off-on:.2f}s）")
+        off, on = report["load_ms"]
+        self.logger.info(f"📊 平均 load 事件: 不阻擋 {off:.0f}ms → 阻擋 {on:.0f}ms（節省 {off-on:.0f}ms）")
+        return report
+
+    def _restart_and_query(self, code):
+        """重新啟動瀏覽器後立即查詢 code，回傳啟動與第一次查詢的耗時及傳輸量"""
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+        start = time.time()
+        if not self.init_driver():
+            raise RuntimeError("瀏覽器無法啟動")
+        start_sec = time.time() - start
+        ok = self.process_single_stock(code)
+        total_sec = time.time() - start
+        try:
+            transferred = self._page_load_stats()["bytes"]
+        except Exception:
+            transferred = 0
+        return {"start_sec": start_sec, "query_sec": total_sec - start_sec, "first_query_sec": total_sec,
+                "bytes": transferred, "ok": bool(ok)}
+
+    def measure_restart(self, code="2330", runs=3):
+        """
+        量測模式：重啟瀏覽器後第一檔查詢的延遲。交替以「全新設定檔」（無快取）與「沿用設定檔」
+        （已暖機的磁碟快取）各重啟 runs 次，回報平均啟動秒數、查詢秒數與傳輸量。
+        未指定 --chrome-profile-dir 時，沿用設定檔改用暫存目錄，結束後刪除。
+        """
+        import shutil
+        import tempfile
+
+        original = self.profile
+        persistent = original or ChromeProfile(tempfile.mkdtemp(prefix="mops_profile_"))
+        totals = {False: [], True: []}
+        try:
+            self.profile = persistent
+            self._restart_and_query(code)  # 暖機：讓 SPA 的資源進入磁碟快取
+            for i in range(runs):
+                for cached in (False, True):
+                    cold_dir = None if cached else tempfile.mkdtemp(prefix="mops_profile_cold_")
+                    self.profile = persistent if cached else ChromeProfile(cold_dir)
+                    try:
+                        stats = self._restart_and_query(code)
+                    finally:
+                        if self.driver:
+                            self.driver.quit()
+                            self.driver = None
+                        if cold_dir:
+                            shutil.rmtree(cold_dir, ignore_errors=True)
+                    totals[cached].append(stats)
+                    label = "沿用快取" if cached else "無快取"
+                    self.logger.info(f"📏 第{i+1}次 {label}: 啟動 {stats['start_sec']:.2f}s, "
+                                     f"第一次查詢 {stats['query_sec']:.2f}s, 傳輸 {stats['bytes']/1024:.0f} KB"
+                                     f"{'' if stats['ok'] else '（查詢失敗）'}")
+        finally:
+            self.profile = original
+            if self.driver:
+                self.driver.quit()
+                self.driver = None
+            if original is None:
+                shutil.rmtree(persistent.path, ignore_errors=True)
+
+        report = {}
+        for key in ("start_sec", "query_sec", "first_query_sec", "bytes"):
+            report[key] = tuple(sum(r[key] for r in totals[c]) / len(totals[c]) for c in (False, True))
+        cold, warm = report["first_query_sec"]
+        self.logger.info(f"📊 重啟後第一檔平均: 無快取 {cold:.2f}s → 沿用快取 {warm:.2f}s（節省 {cold-warm:.2f}s）")
+        cold, warm = report["bytes"]
+        self.logger.info(f"📊 重啟後平均傳輸量: 無快取 {cold/1024:.0f} KB → 沿用快取 {warm/1024:.0f} KB")
+        return report
+
+    def _timeout(self, seconds):
+        """依單檔時限縮短等待或逾時秒數；時限已到時拋出 DeadlineExceeded"""
+        return self._deadline.cap(seconds) if self._deadline else seconds
+
+    def _start_deadline(self):
+        """開始一檔的時間預算，並把 driver 的隱式等待與頁面載入逾時縮到預算內"""
+        self._deadline = Deadline(self.code_deadline) if self.code_deadline else None
+        self._apply_driver_timeouts()
+
+    def _apply_driver_timeouts(self, force=False):
+        """
+        把隱式等待與頁面載入逾時縮到單檔時限的剩餘時間內（沒有時限時不做事）。
+        force=True 用於多分頁模式輪到本分頁時：逾時屬於整個 session，上一個分頁可能已改成它自己的時限，
+        因此不論有無時限都重新套用，且不沿用隱式等待的快取。
+        """
+        if self.driver is None or (self._deadline is None and not force):
+            return
+        if force:
+            self._implicit_applied = None
+        self._set_implicit_wait(self._implicit_wait())
+        self.driver.set_page_load_timeout(min(30, self._deadline.remaining()) if self._deadline else 30)
+
+    def _implicit_wait(self):
+        """
+        隱式等待秒數：平常 10 秒，有單檔時限時取不超過剩餘時間的整秒數（跨過整秒才需要重設）；
+        剩不到 1 秒時用實際剩餘時間。
+        """
+        if self._deadline is None:
+            return 10
+        wait = min(10, self._deadline.remaining())
+        return wait if wait < 1 else int(wait)
+
+    def _set_implicit_wait(self, seconds):
+        """設定隱式等待；與上次送出的值相同時省下一趟 setTimeouts 往返"""
+        if seconds != self._implicit_applied:
+            self.driver.implicitly_wait(seconds)
+            self._implicit_applied = seconds
+
+    def _pause(self, seconds):
+        """等待 seconds 秒；多分頁模式下等待期間把瀏覽器讓給其他分頁，醒來後切回自己的分頁"""
+        seconds = self._timeout(seconds)
+        if self._tab is None:
+            time.sleep(seconds)
+            return
+        self._tab.release()
+        time.sleep(seconds)
+        self._tab.acquire()
+
+    def _poll(self, probe, timeout, interval=0.25):
+        """每 interval 秒呼叫 probe，直到回傳真值（並回傳該值）或逾時（回傳 None）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            value = probe()
+            if value:
+                return value
+            if time.monotonic() >= deadline:
+                return None
+            self._pause(interval)
+
     def init_driver(self):
         """初始化浏览器驱动"""
         try:
             options = self.setup_chrome()
-            self.driver = webdriver.Chrome(options=options)
+            if self.profile:
+                self.profile.prepare()
+            self.driver = self._launch_chrome(options)
+            if self.tracer:
+                self.tracer.attach(self.driver)
             self.driver.set_page_load_timeout(30)
             self.driver.implicitly_wait(10)
+            self._implicit_applied = 10
+            if self.block_resources:
+                self.apply_resource_blocking()
             self.logger.info("✅ Chrome浏览器初始化成功")
             return True
         except Exception as e:
             self.logger.error(f"❌ 浏览器初始化失败: {e}")
             return False
 
+    def _launch_chrome(self, options):
+        """以快取的 chromedriver 路徑與共用服務開新的瀏覽器 session；失敗時退回由 Selenium 自行解析"""
+        try:
+            return webdriver.Chrome(options=options, service=chromedriver_cache.service(options))
+        except Exception as e:
+            # 共用服務不關閉（其他瀏覽器仍在使用），這次改由 Selenium 自行解析啟動
+            self.logger.warning(f"⚠️ 共用 chromedriver 無法啟動瀏覽器，改由 Selenium 重新解析: {e}")
+            chromedriver_cache.revalidate()
+            options.binary_location = ""
+            return webdriver.Chrome(options=options)
+
     def restart_driver(self):
-        """重啟瀏覽器驅動"""
+        """重啟瀏覽器驅動（多分頁模式下只重開自己的分頁）"""
+        if self._tab is not None:
+            return self._tab.reopen()
         try:
             self.logger.info("♻️ 正在重啟瀏覽器...")
             if self.driver:
@@ -239,7 +1758,9 @@ class FixedInputCrawler:
             return False
 
     def ensure_single_tab(self):
-        """確保只有一個分頁開啟"""
+        """確保只有一個分頁開啟（多分頁模式下不處理）"""
+        if self._tab is not None:
+            return
         try:
             if self.driver and len(self.driver.window_handles) > 1:
                 # 關閉除了第一個之外的所有分頁
@@ -253,13 +1774,67 @@ class FixedInputCrawler:
         except Exception as e:
             self.logger.warning(f"⚠️ 清理分頁時發生錯誤: {e}")
 
+    def _load_route(self):
+        """讀取已學到的目標頁 SPA 路由（route_cache.json）"""
+        try:
+            with open(self.route_cache_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("url")
+        except (OSError, ValueError):
+            return None
+
+    def _save_route(self, url):
+        """記住目標頁網址，下次直接開啟；url 為 None 時清除"""
+        self._route_url = url
+        try:
+            if url is None:
+                if os.path.exists(self.route_cache_path):
+                    os.remove(self.route_cache_path)
+                return
+            tmp = self.route_cache_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"url": url, "learned_at": datetime.now().isoformat(timespec="seconds")}, f,
+                          ensure_ascii=False)
+            os.replace(tmp, self.route_cache_path)
+        except OSError as e:
+            self.logger.warning(f"⚠️ 無法寫入路由快取: {e}")
+
+    def _wait_target_page(self, timeout=15):
+        """輪詢目標頁是否載入完成，取代固定等待與 page_source 檢查"""
+        def ready():
+            try:
+                return self.driver.execute_script(self.TARGET_PAGE_PROBE, self.target_menu_text)
+            except WebDriverException:
+                return False  # 頁面切換中
+        return bool(self._poll(ready, timeout))
+
     def navigate_to_target_page(self):
-        """导航到董監事持股餘額页面"""
+        """导航到董監事持股餘額页面（優先直接開啟已快取的路由，失敗才從主頁點選菜单）"""
+        if self._route_url is None:
+            self._route_url = self._load_route()
+        if self._route_url:
+            try:
+                if self.driver.current_url == self._route_url:
+                    self.driver.refresh()  # 同一路由需重新載入才會得到乾淨的查詢表單
+                else:
+                    self.driver.get(self._route_url)
+                if self._wait_target_page():
+                    self.logger.info("✅ 直接開啟董監事持股餘額页面")
+                    return True
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                self.logger.warning(f"⚠️ 開啟快取路由失敗: {e}")
+            self.logger.warning(f"⚠️ 快取路由已失效，改由主頁菜单導航: {self._route_url}")
+            self._save_route(None)
+        return self._navigate_via_menu()
+
+    def _navigate_via_menu(self):
+        """从主页点击菜单导航到董監事持股餘額页面，成功後記住路由"""
         try:
             # 步骤1: 进入主页
             self.logger.info(f"📖 步骤1: 访问主页 {self.main_url}")
             self.driver.get(self.main_url)
-            time.sleep(5)
+            self._pause(5)
 
             self.logger.info(f"   页面标题: {self.driver.title}")
 
@@ -276,7 +1851,7 @@ class FixedInputCrawler:
             menu_element = None
             for selector in menu_selectors:
                 try:
-                    menu_elements = self.driver.find_elements(By.XPATH, selector)
+                    menu_elements = self._find(selector)
                     for element in menu_elements:
                         if element.is_displayed() and element.is_enabled():
                             menu_element = element
@@ -284,6 +1859,8 @@ class FixedInputCrawler:
                             break
                     if menu_element:
                         break
+                except DeadlineExceeded:
+                    raise
                 except:
                     continue
 
@@ -295,23 +1872,25 @@ class FixedInputCrawler:
             self.logger.info(f"👆 点击'{self.target_menu_text}'菜单")
             try:
                 menu_element.click()
+            except DeadlineExceeded:
+                raise
             except:
                 self.driver.execute_script("arguments[0].click();", menu_element)
 
-            # 等待页面加载
-            time.sleep(8)
-
-            # 验证是否到达正确页面
-            current_url = self.driver.current_url
-            page_source = self.driver.page_source
-
-            if "董監事持股餘額" in page_source or "查詢條件" in page_source:
+            # 等待页面加载并验证是否到达正确页面
+            if self._wait_target_page():
                 self.logger.info("✅ 成功导航到董監事持股餘額页面")
+                current_url = self.driver.current_url
+                if "#/" in current_url and current_url != self.main_url:
+                    self.logger.info(f"🧭 記住目標頁路由: {current_url}")
+                    self._save_route(current_url)
                 return True
             else:
                 self.logger.error("❌ 未能成功导航到目标页面")
                 return False
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(f"❌ 导航失败: {e}")
             return False
@@ -322,7 +1901,7 @@ class FixedInputCrawler:
             self.logger.info(f"📝 步骤3: 寻找'公司代號或簡稱'输入框")
 
             # 等待页面完全加载
-            time.sleep(3)
+            self._pause(3)
 
             # 多种策略寻找输入框
             input_strategies = [
@@ -358,7 +1937,7 @@ class FixedInputCrawler:
             for i, strategy in enumerate(input_strategies, 1):
                 try:
                     self.logger.info(f"   尝试策略{i}: {strategy[:50]}...")
-                    elements = self.driver.find_elements(By.XPATH, strategy)
+                    elements = self._find(strategy)
 
                     for element in elements:
                         if element.is_displayed() and element.is_enabled():
@@ -386,6 +1965,8 @@ class FixedInputCrawler:
                     if input_element:
                         break
 
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     self.logger.info(f"   策略{i}失败: {e}")
                     continue
@@ -396,7 +1977,7 @@ class FixedInputCrawler:
                 # 调试信息：显示页面中所有input元素
                 self.logger.info("🔍 调试信息 - 页面中所有input元素:")
                 try:
-                    all_inputs = self.driver.find_elements(By.TAG_NAME, "input")
+                    all_inputs = self._find("input", By.TAG_NAME)
                     for j, inp in enumerate(all_inputs):
                         try:
                             if inp.is_displayed():
@@ -406,6 +1987,8 @@ class FixedInputCrawler:
                                 self.logger.info(f"   Input{j+1}: type='{type_attr}', placeholder='{placeholder}', name='{name}'")
                         except:
                             pass
+                except DeadlineExceeded:
+                    raise
                 except:
                     pass
 
@@ -417,11 +2000,11 @@ class FixedInputCrawler:
             try:
                 # 清空输入框
                 input_element.clear()
-                time.sleep(1)
+                self._pause(1)
 
                 # 输入股票代号
                 input_element.send_keys(stock_code)
-                time.sleep(1)
+                self._pause(1)
 
                 # 验证输入
                 current_value = input_element.get_attribute('value')
@@ -432,16 +2015,20 @@ class FixedInputCrawler:
                     self.logger.warning(f"⚠️ 输入验证失败: 期望'{stock_code}', 实际'{current_value}'")
                     return True  # 仍然继续，可能是显示延迟
 
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 self.logger.error(f"❌ 输入股票代号失败: {e}")
                 return False
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(f"❌ 寻找输入框过程失败: {e}")
             return False
 
-    def click_query_button(self):
-        """点击查询按钮"""
+    def click_query_button(self, wait=True):
+        """点击查询按钮（wait=False 時不等待結果渲染）"""
         try:
             self.logger.info("🔍 步骤4: 寻找并点击'查詢'按钮")
 
@@ -469,7 +2056,7 @@ class FixedInputCrawler:
             for i, strategy in enumerate(button_strategies, 1):
                 try:
                     self.logger.info(f"   尝试按钮策略{i}: {strategy[:50]}...")
-                    elements = self.driver.find_elements(By.XPATH, strategy)
+                    elements = self._find(strategy)
 
                     for element in elements:
                         if element.is_displayed() and element.is_enabled():
@@ -484,6 +2071,8 @@ class FixedInputCrawler:
                     if button_element:
                         break
 
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     self.logger.info(f"   按钮策略{i}失败: {e}")
                     continue
@@ -497,33 +2086,373 @@ class FixedInputCrawler:
             try:
                 button_element.click()
                 self.logger.info("   直接点击成功")
+            except DeadlineExceeded:
+                raise
             except:
                 try:
                     self.driver.execute_script("arguments[0].click();", button_element)
                     self.logger.info("   JavaScript点击成功")
+                except DeadlineExceeded:
+                    raise
                 except:
                     self.logger.error("   所有点击方式都失败")
                     return False
 
             # 等待查询结果
-            self.logger.info("⏳ 等待查询结果加载...")
-            time.sleep(8)
+            if wait:
+                self.logger.info("⏳ 等待查询结果加载...")
+                self._pause(8)
 
             return True
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(f"❌ 点击查询按钮失败: {e}")
             return False
 
+    def _submit_query(self, stock_code):
+        """
+        點擊查詢。擷取模式下不等渲染，直接從查詢 API 的網路回應解析資料。
+        未取得資料時以 self.result_state 記錄結果狀態（見 _classify_result）。
+        回傳 (是否成功送出, 擷取到的 DataFrame 或 None)。
+        """
+        self.result_state = None
+        self._mark_result_baseline()
+        if not self.capture_xhr:
+            if not self.click_query_button(wait=False):
+                return False, None
+            self.result_state = self._classify_result()
+            return True, None
+        self._drain_performance_log()
+        if not self.click_query_button(wait=False):
+            return False, None
+        data = self.capture_query_response(stock_code)
+        if data is None:
+            self.result_state = self._classify_result(timeout=2)
+        return True, data
+
+    def _mark_result_baseline(self):
+        """查詢前開始記錄頁面變動（見 RESULT_MARK_SCRIPT），結果狀態只依這次查詢改變的節點判斷"""
+        try:
+            self.driver.execute_script(self.RESULT_MARK_SCRIPT)
+        except WebDriverException:
+            pass
+
+    def _classify_result(self, timeout=8):
+        """
+        查詢後輪詢一個輕量的 execute_script，判斷結果狀態：
+        data / no_data / invalid_code / site_error；逾時仍無法判斷為 unknown。
+        """
+        def probe():
+            return self.driver.execute_script(self.RESULT_STATE_PROBE, self.RESULT_PATTERNS)
+        try:
+            state = self._poll(probe, timeout) or "unknown"
+        except UnexpectedAlertPresentException:
+            state = self._classify_alert()
+        self.logger.info(f"🔎 查詢結果狀態: {state}")
+        return state
+
+    def _classify_alert(self):
+        """查詢跳出 alert 時，依 alert 文字判斷狀態並關閉它"""
+        try:
+            alert = self.driver.switch_to.alert
+            text = alert.text or ""
+            alert.accept()
+        except WebDriverException:
+            return "unknown"
+        self.logger.info(f"   網站提示: {text}")
+        for state, pattern in self.RESULT_PATTERNS:
+            if re.search(pattern, text):
+                return state
+        return "unknown"
+
+    def _no_result(self, stock_code):
+        """結果狀態為查無資料、代號無效或網站錯誤時記錄原因並回傳 True，不必再跑提取流程"""
+        reason = self.RESULT_REASONS.get(self.result_state)
+        if reason:
+            self.last_failure_reason = reason
+            self.logger.warning(f"⚠️ 股票 {stock_code}: {reason}，略過數據提取")
+        return reason is not None
+
+    def _drain_performance_log(self):
+        """清空目前累積的 performance log，避免讀到上一次查詢的回應"""
+        try:
+            self.driver.get_log("performance")
+        except Exception as e:
+            self.logger.warning(f"⚠️ 讀取 performance log 失敗: {e}")
+
+    def capture_query_response(self, stock_code, timeout=8):
+        """輪詢 performance log，找到查詢 API 的 JSON 回應後以 Network.getResponseBody 取回並解析"""
+        import json
+
+        responses = {}   # requestId -> url
+        finished = []
+        tried = set()
+        start = time.time()
+        while time.time() - start < timeout:
+            self._pause(0.3)
+            try:
+                entries = self.driver.get_log("performance")
+            except Exception as e:
+                self.logger.warning(f"⚠️ 讀取 performance log 失敗: {e}")
+                return None
+            for entry in entries:
+                try:
+                    msg = json.loads(entry["message"])["message"]
+                except Exception:
+                    continue
+                method, params = msg.get("method"), msg.get("params", {})
+                if method == "Network.responseReceived":
+                    resp = params.get("response", {})
+                    url = resp.get("url", "")
+                    mime = resp.get("mimeType", "")
+                    if params.get("type") in ("XHR", "Fetch") and ("json" in mime or "/api/" in url):
+                        responses[params["requestId"]] = url
+                elif method == "Network.loadingFinished" and params.get("requestId") in responses:
+                    finished.append(params["requestId"])
+
+            # 由最新的回應往回試，第一個解析得出資料的就是查詢結果
+            for request_id in reversed(finished):
+                if request_id in tried:
+                    continue
+                tried.add(request_id)
+                try:
+                    body = self._cdp("Network.getResponseBody", {"requestId": request_id})
+                    text = body.get("body", "")
+                    if body.get("base64Encoded"):
+                        import base64
+                        text = base64.b64decode(text).decode("utf-8", errors="replace")
+                    payload = json.loads(text)
+                except Exception as e:
+                    self.logger.info(f"   略過無法解析的回應 {responses[request_id][:80]}: {e}")
+                    continue
+                data = self._parse_xhr_payload(payload)
+                if data is not None:
+                    self._archive("json", text)
+                    self.logger.info(f"✅ 從網路回應擷取 {stock_code} 資料 {len(data)} 筆: {responses[request_id][:80]}")
+                    return data
+
+        self.logger.info("ℹ️ 未從網路回應擷取到查詢結果，改用原本的解析流程")
+        return None
+
+    def _parse_xhr_payload(self, payload):
+        """在 JSON 中尋找含姓名與目前持股的表格（欄名+列陣列，或 dict 列）"""
+        tables = []
+
+        def title_of(h):
+            if isinstance(h, dict):
+                return next((str(v) for v in h.values() if isinstance(v, str)), "")
+            return str(h)
+
+        def walk(node):
+            if isinstance(node, dict):
+                header = next((node[k] for k in ("titles", "fields", "header", "headers", "columns")
+                               if isinstance(node.get(k), list)), None)
+                rows = next((node[k] for k in ("data", "rows", "list")
+                             if isinstance(node.get(k), list)), None)
+                if header and rows and all(isinstance(r, list) for r in rows):
+                    names = [title_of(h) for h in header]
+                    width = len(names)
+                    body = [(list(r) + [None] * width)[:width] for r in rows]
+                    tables.append(pd.DataFrame(body, columns=names))
+                for v in node.values():
+                    walk(v)
+            elif isinstance(node, list):
+                if node and all(isinstance(r, dict) for r in node):
+                    tables.append(pd.DataFrame(node))
+                for v in node:
+                    walk(v)
+
+        walk(payload)
+        for df in tables:
+            df, name_col, hold_col = self._pick_columns(df)
+            if name_col and hold_col:
+                out = self._finalize_holdings(df, name_col, hold_col)
+                if not out.empty:
+                    return out
+        return None
+
+    def _find(self, value, by=By.XPATH, root=None):
+        """
+        帶單檔時限的 find_elements：每次尋找前先檢查時限，並把隱式等待重新縮到剩餘時間內，
+        避免多個尋找策略各自耗滿隱式等待而遠超時限。
+        """
+        if self._deadline is not None:
+            self._deadline.check()
+            self._set_implicit_wait(self._implicit_wait())
+        return (root or self.driver).find_elements(by, value)
+
+    def _find_now(self, xpath):
+        """不套用隱式等待的 find_elements，用於可能不存在的元素"""
+        if self._deadline is not None:
+            self._deadline.check()
+        self._set_implicit_wait(0)
+        try:
+            return self.driver.find_elements(By.XPATH, xpath)
+        finally:
+            self._set_implicit_wait(self._implicit_wait())
+
+    def select_query_period(self, period):
+        """在已載入的查詢表單中設定年度（民國年）與月份，period 格式 YYYY-MM"""
+        year, month = period.split("-")
+        roc_year = str(int(year) - 1911)
+        ok_year = self._set_form_field("年度", "year", roc_year)
+        ok_month = self._set_form_field("月份", "month", month)
+        if ok_year and ok_month:
+            self.logger.info(f"📅 查詢期別設定為 {period}（民國 {roc_year} 年 {month} 月）")
+        else:
+            self.logger.warning(f"⚠️ 設定查詢期別失敗: {period}（年度={ok_year}, 月份={ok_month}）")
+        return ok_year and ok_month
+
+    def _set_form_field(self, label, attr_key, value):
+        """依欄位標籤或 id/name 找到 select 或 input 並填入值"""
+        from selenium.webdriver.support.ui import Select
+
+        xpaths = [
+            f"//select[contains(@id,'{attr_key}') or contains(@name,'{attr_key}')]",
+            f"//*[contains(text(),'{label}')]/following::select[1]",
+            f"//input[contains(@id,'{attr_key}') or contains(@name,'{attr_key}')]",
+            f"//*[contains(text(),'{label}')]/following::input[1]",
+        ]
+        target = value.lstrip("0")
+        for xp in xpaths:
+            for el in self._find_now(xp):
+                if not (el.is_displayed() and el.is_enabled()):
+                    continue
+                if el.tag_name.lower() == "select":
+                    select = Select(el)
+                    for opt in select.options:
+                        opt_value = (opt.get_attribute("value") or "").strip().lstrip("0")
+                        opt_text = re.sub(r"[^\d]", "", opt.text).lstrip("0")
+                        if target in (opt_value, opt_text):
+                            opt.click()
+                            return True
+                else:
+                    el.clear()
+                    el.send_keys(value)
+                    return True
+        return False
+
+    @staticmethod
+    def parse_periods(spec):
+        """解析期別參數：「2023-01..2026-09」或「2024-01,2024-03」→ ['2023-01', ...]"""
+        periods = []
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if ".." in part:
+                start, end = part.split("..")
+                y, m = map(int, start.split("-"))
+                end_y, end_m = map(int, end.split("-"))
+                while (y, m) <= (end_y, end_m):
+                    periods.append(f"{y:04d}-{m:02d}")
+                    y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+            else:
+                y, m = map(int, part.split("-"))
+                periods.append(f"{y:04d}-{m:02d}")
+        return sorted(set(periods))
+
+    def _find_csv_href(self):
+        """回傳查詢結果的 CSV 下載網址（沒有 href 時回傳 None）"""
+        for el in self._find_csv_candidates():
+            href = el.get_attribute("href")
+            if href and ".csv" in href.lower():
+                return href
+        return None
+
+    def process_stock_periods(self, stock_code, periods):
+        """
+        同一檔代號只導航、填寫一次，在已載入的查詢表單中依序查詢多個期別。
+        有 CSV 連結時下載與解析交給背景執行緒，瀏覽器直接進行下一個期別。
+        回傳 {期別: DataFrame}，失敗的期別不會出現在結果中。
+        有單檔時限時，開啟表單與每個期別各自計時。
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        results = {}
+        self.period_reasons = {}  # 查無資料、代號無效或超過時限的期別 -> 原因，這些期別不再重試
+        self.ensure_single_tab()
+        if not self.check_driver_alive():
+            self.logger.error(f"❌ 瀏覽器驅動已斷線，處理股票 {stock_code} 失敗")
+            return results
+        self._start_deadline()
+        try:
+            if not self._open_query_form(stock_code):
+                return results
+        except DeadlineExceeded as e:
+            self.logger.warning(f"⏰ 股票 {stock_code} 開啟查詢表單{e}")
+            return results
+        finally:
+            self._deadline = None
+        self.clear_old_downloads()
+
+        futures = {}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for period in periods:
+                self._start_deadline()
+                try:
+                    self.logger.info(f"📈 {stock_code} 期別 {period}")
+                    self._begin_crawl(stock_code, period)
+                    if not self.select_query_period(period):
+                        continue
+                    submitted, data = self._query_stage(stock_code)
+                    if not submitted:
+                        continue
+                    if data is not None:
+                        results[period] = data
+                        continue
+                    if self._no_result(stock_code):
+                        if self.result_state in self.TERMINAL_RESULT_STATES:
+                            self.period_reasons[period] = self.last_failure_reason
+                        continue
+                    href = self._find_csv_href()
+                    if href:
+                        futures[period] = pool.submit(self._fetch_and_parse_csv, href,
+                                                      self._requests_session_from_driver(),
+                                                      stock_code, period, self._crawl_id, self._deadline)
+                    else:
+                        data = self._extract_query_result(stock_code)
+                        if data is not None:
+                            results[period] = data
+                except DeadlineExceeded as e:
+                    self.logger.warning(f"⏰ {stock_code} 期別 {period} {e}，放棄此期別")
+                    self.period_reasons[period] = self.DEADLINE_REASON
+                except Exception as e:
+                    self.logger.error(f"❌ {stock_code} 期別 {period} 查詢異常: {e}")
+                finally:
+                    self._deadline = None
+
+            for period, future in futures.items():
+                try:
+                    data = future.result()
+                except DeadlineExceeded as e:
+                    self.logger.warning(f"⏰ {stock_code} 期別 {period} CSV 下載{e}，放棄此期別")
+                    self.period_reasons[period] = self.DEADLINE_REASON
+                    continue
+                if data is not None and len(data) > 0:
+                    results[period] = data
+
+        for period, data in results.items():
+            self._tag_result(data, stock_code)
+            if "期別" not in data.columns:
+                data.insert(2, "期別", period)
+        self.logger.info(f"✅ {stock_code} 完成 {len(results)}/{len(periods)} 個期別")
+        return results
+
     def _requests_session_from_driver(self):
-        """將 Selenium cookies 轉成 requests 可用的 session"""
-        s = requests.Session()
+        """將 Selenium cookies 轉成 requests 可用的 session（同一個 session 重複使用以保持連線）"""
+        if self._http_session is None:
+            s = requests.Session()
+            # 帶上 UA
+            s.headers.update({
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+            })
+            self._http_session = s
+        s = self._http_session
         for c in self.driver.get_cookies():
             s.cookies.set(c["name"], c["value"], domain=c.get("domain"))
-        # 帶上 UA
-        s.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        })
         return s
 
     def clear_old_downloads(self):
@@ -556,21 +2485,10 @@ class FixedInputCrawler:
         from datetime import datetime
         self.logger.info("📥 步骤4a: 嘗試下載CSV檔案")
         self.clear_old_downloads()
-        time.sleep(1)
+        self._pause(1)
 
         # 1) 先找 a[href*=.csv] 或 下載CSV 按鈕
-        candidates = []
-        xpaths = [
-            "//a[contains(@href,'.csv')]",
-            "//button[contains(normalize-space(.),'下載CSV')]",
-            "//span[contains(normalize-space(.),'下載CSV')]/ancestor::a",
-            "//span[contains(normalize-space(.),'下載CSV')]/ancestor::button"
-        ]
-        for xp in xpaths:
-            els = self.driver.find_elements(By.XPATH, xp)
-            for el in els:
-                if el.is_displayed() and el.is_enabled():
-                    candidates.append(el)
+        candidates = self._find_csv_candidates()
         if not candidates:
             self.logger.warning("⚠️ 未找到CSV下載元素")
             return None
@@ -579,34 +2497,30 @@ class FixedInputCrawler:
         for el in candidates:
             href = el.get_attribute("href")
             if href and ".csv" in href.lower():
-                try:
-                    self.logger.info(f"🔗 直接請求 CSV: {href[:120]}...")
-                    sess = self._requests_session_from_driver()
-                    r = sess.get(href, timeout=20)
-                    content_type = r.headers.get("Content-Type", "").lower()
-                    self.logger.info(f"📄 回應 Content-Type: {content_type}, 內容長度: {len(r.content)} bytes")
-
-                    # 如果回應成功且有內容，就嘗試解析 (不限制 Content-Type)
-                    if r.status_code == 200 and len(r.content) > 0:
-                        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        csv_path = os.path.join(self.download_dir, f"mops_{ts}.csv")
-                        with open(csv_path, "wb") as f:
-                            f.write(r.content)
-                        self.logger.info(f"✅ 以 requests 下載檔案成功: {os.path.basename(csv_path)}")
-                        return self._read_and_filter_csv(csv_path)
-                except Exception as e:
-                    self.logger.warning(f"⚠️ 直接請求 CSV 失敗: {e}")
+                sess = self._requests_session_from_driver()
+                raw = self._run_stage("download", lambda: self._fetch_csv(href, sess))
+                if raw:
+                    ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+                    csv_path = os.path.join(self.download_dir, f"mops_{ts}.csv")
+                    with open(csv_path, "wb") as f:
+                        f.write(raw)
+                    self.logger.info(f"✅ 以 requests 下載檔案成功: {os.path.basename(csv_path)}")
+                    return self._read_and_filter_csv(csv_path)
 
         # 3) 沒有 href（或 requests 失敗）→ 退回點擊 + 目錄監看
         try:
             target = candidates[0]
             self.driver.execute_script("arguments[0].scrollIntoView(true);", target)
-            time.sleep(0.5)
+            self._pause(0.5)
             try:
                 self.driver.execute_script("arguments[0].click();", target)
+            except DeadlineExceeded:
+                raise
             except:
                 target.click()
             self.logger.info("🖱️ 已點擊下載CSV按鈕，開始監看下載資料夾（30秒）...")
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(f"❌ 點擊下載CSV失敗: {e}")
             return None
@@ -615,7 +2529,7 @@ class FixedInputCrawler:
         latest_file = None
         start = time.time()
         while time.time() - start < 30:
-            time.sleep(1)
+            self._pause(1)
             files = [f for f in glob.glob(os.path.join(self.download_dir, "*")) if not f.endswith(".crdownload")]
             if files:
                 latest = max(files, key=os.path.getmtime)
@@ -631,25 +2545,97 @@ class FixedInputCrawler:
         self.logger.info(f"✅ 使用 Python engine + on_bad_lines='skip' 解析檔案")
         return self._read_and_filter_csv(latest_file)
 
-    def _read_and_filter_csv(self, path):
-        import csv
-        import re
-        import pandas as pd
-
-        # ---- A. 讀檔 & 編碼容錯 ----
-        encodings = ["utf-8-sig", "utf-8", "big5", "cp950"]
-        text = None
-        last_err = None
-        for enc in encodings:
-            try:
-                with open(path, "r", encoding=enc, errors="replace") as f:
-                    text = f.read()
+    def _find_csv_candidates(self):
+        """尋找可見的 CSV 下載連結或按鈕"""
+        candidates = []
+        xpaths = [
+            "//a[contains(@href,'.csv')]",
+            "//button[contains(normalize-space(.),'下載CSV')]",
+            "//span[contains(normalize-space(.),'下載CSV')]/ancestor::a",
+            "//span[contains(normalize-space(.),'下載CSV')]/ancestor::button"
+        ]
+        for xp in xpaths:
+            els = self._find(xp)
+            for el in els:
+                if el.is_displayed() and el.is_enabled():
+                    candidates.append(el)
+        return candidates
+
+    def _fetch_csv(self, href, sess, timeout=None):
+        """以 requests 直接下載 CSV，回傳內容 bytes（失敗回傳 None）；timeout 預設 20 秒並受單檔時限約束"""
+        try:
+            self.logger.info(f"🔗 直接請求 CSV: {href[:120]}...")
+            r = sess.get(href, timeout=timeout or self._timeout(20))
+            content_type = r.headers.get("Content-Type", "").lower()
+            self.logger.info(f"📄 回應 Content-Type: {content_type}, 內容長度: {len(r.content)} bytes")
+
+            # 如果回應成功且有內容，就嘗試解析 (不限制 Content-Type)
+            if r.status_code == 200 and len(r.content) > 0:
+                return r.content
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            self.logger.warning(f"⚠️ 直接請求 CSV 失敗: {e}")
+        return None
+
+    def _fetch_and_parse_csv(self, href, sess, code=None, period=None, crawl_id=None, deadline=None):
+        """下載並解析 CSV（不落地，供背景執行緒使用）；deadline 為送出時該期別的時限"""
+        raw = self._run_stage("download",
+                              lambda: self._fetch_csv(href, sess, timeout=deadline.cap(20) if deadline else 20),
+                              background=True, deadline=deadline)
+        if not raw:
+            return None
+        self._archive("csv", raw, code=code, period=period, crawl_id=crawl_id)
+        return self._parse_csv_bytes(raw)
+
+    def _read_and_filter_csv(self, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        self._archive("csv", raw)
+        return self._parse_csv_bytes(raw)
+
+    def _begin_crawl(self, stock_code, period=None):
+        """標記目前處理中的代號與期別，封存時用來建立索引"""
+        self._current_code = stock_code
+        self._current_period = period
+        self._crawl_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S.%f')}:{stock_code}:{period or ''}"
+
+    def _archive(self, kind, raw, code=None, period=None, crawl_id=None):
+        """把原始回應存入封存（未啟用封存時不做事）"""
+        if self.archive is None or not raw:
+            return
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        if code is None:
+            code, period, crawl_id = self._current_code, self._current_period, self._crawl_id
+        try:
+            self.archive.put(code, kind, raw, period=period, crawl_id=crawl_id)
+        except Exception as e:
+            self.logger.warning(f"⚠️ 封存原始回應失敗: {e}")
+
+    def _parse_csv_bytes(self, raw):
+        import csv
+        import re
+        import pandas as pd
+
+        # ---- A. 讀檔 & 編碼容錯 ----
+        encodings = ["utf-8-sig", "utf-8", "big5", "cp950"]
+        text = None
+        last_err = None
+        for enc in encodings:
+            try:
+                # 嚴格解碼：用 errors="replace" 時 utf-8 永遠「成功」，Big5 檔會變成亂碼而找不到表頭
+                text = raw.decode(enc)
                 if text:
                     self.logger.info(f"🔤 成功以 {enc} 編碼讀取檔案")
                     break
             except Exception as e:
                 last_err = e
                 continue
+        if text is None and raw:
+            # 都解不開（例如檔案中夾雜壞位元組）才容錯替換，以 MOPS 常用的 cp950 為準
+            text = raw.decode("cp950", errors="replace")
+            self.logger.warning(f"⚠️ 無法以常見編碼嚴格讀取，改以 cp950 容錯讀取: {last_err}")
         if not text:
             self.logger.error(f"❌ 無法以常見編碼讀取檔案: {last_err}")
             return None
@@ -746,30 +2732,9 @@ class FixedInputCrawler:
             return None
 
         # ---- E. 嘗試從候選 df 中挑出含關鍵欄位者 ----
-        def _pick_columns(df):
-            cols = list(map(str, df.columns))
-            # 清理欄名空白
-            df = df.rename(columns={c: str(c).strip() for c in df.columns})
-
-            name_col = next((c for c in df.columns if any(k in str(c) for k in ["姓名","名稱","姓名/名稱","董監事姓名"])), None)
-            hold_col = next((c for c in df.columns if any(k in str(c) for k in ["目前持股","目前持股數","目前持股(股)","現有持股"])), None)
-
-            # 若第一列其實是表頭，欄名在第一列內容，再提升一行為欄名
-            if not name_col or not hold_col:
-                if len(df) >= 1:
-                    first_row = df.iloc[0].astype(str).tolist()
-                    if any("姓名" in x or "名稱" in x for x in first_row):
-                        df2 = df[1:].copy()
-                        df2.columns = first_row
-                        df = df2
-                        name_col = next((c for c in df.columns if any(k in str(c) for k in ["姓名","名稱","姓名/名稱","董監事姓名"])), None)
-                        hold_col = next((c for c in df.columns if any(k in str(c) for k in ["目前持股","目前持股數","目前持股(股)","現有持股"])), None)
-
-            return df, name_col, hold_col
-
         chosen = None
         for i, df in enumerate(candidates):
-            df2, name_col, hold_col = _pick_columns(df)
+            df2, name_col, hold_col = self._pick_columns(df)
             self.logger.info(f"📋 候選{i+1}: 姓名欄='{name_col}', 持股欄='{hold_col}'")
             if name_col and hold_col:
                 chosen = (df2, name_col, hold_col)
@@ -780,7 +2745,7 @@ class FixedInputCrawler:
             # 再嘗試把所有欄名/內容去空白後重試一次
             for i, df in enumerate(candidates):
                 df.columns = [str(c).strip() for c in df.columns]
-                df2, name_col, hold_col = _pick_columns(df)
+                df2, name_col, hold_col = self._pick_columns(df)
                 if name_col and hold_col:
                     chosen = (df2, name_col, hold_col)
                     self.logger.info(f"✅ 清理空白後選中候選{i+1}")
@@ -790,18 +2755,53 @@ class FixedInputCrawler:
             self.logger.error("❌ 無法識別「姓名」與「目前持股」欄位")
             return None
 
-        df, name_col, hold_col = chosen
-        out = df[[name_col, hold_col]].copy()
-        out.columns = ["姓名", "目前持股"]
+        out = self._finalize_holdings(*chosen)
+        self.logger.info(f"✅ CSV 數據處理完成：{len(out)} 筆")
+        return out if not out.empty else None
+
+    def _pick_columns(self, df):
+        """找出姓名欄與目前持股欄；若欄名其實在第一列，則提升為欄名"""
+        # 清理欄名空白
+        df = df.rename(columns={c: str(c).strip() for c in df.columns})
+
+        name_col, hold_col = self._key_columns(df)
+
+        # 若第一列其實是表頭，欄名在第一列內容，再提升一行為欄名
+        if not name_col or not hold_col:
+            if len(df) >= 1:
+                first_row = df.iloc[0].astype(str).tolist()
+                if any("姓名" in x or "名稱" in x for x in first_row):
+                    df2 = df[1:].copy()
+                    df2.columns = first_row
+                    df = df2
+                    name_col, hold_col = self._key_columns(df)
+
+        return df, name_col, hold_col
+
+    def _key_columns(self, df):
+        """依明細欄位對應找出姓名欄與目前持股欄（「公司名稱」等不會被當成姓名）"""
+        found = self._schema_columns(df.columns)
+        cols = list(df.columns)
+        return (cols[found["姓名"]] if "姓名" in found else None,
+                cols[found["目前持股"]] if "目前持股" in found else None)
+
+    def _finalize_holdings(self, df, name_col, hold_col):
+        """取出姓名、目前持股及其他認得的明細欄位，並清掉表頭殘留、空白與重複"""
+        cols = list(df.columns)
+        picked = {"姓名": cols.index(name_col), "目前持股": cols.index(hold_col)}
+        for field, pos in self._schema_columns(cols).items():
+            if field not in picked and pos not in picked.values():
+                picked[field] = pos
+        fields = [f for f in self.SCHEMA_FIELDS if f in picked]
+        out = df.iloc[:, [picked[f] for f in fields]].copy()
+        out.columns = fields
 
         # 去掉明顯的表頭/空白列
         out = out.dropna(subset=["姓名"])
         out = out[~out["姓名"].astype(str).str.contains("姓名|名稱")]
         out["目前持股"] = out["目前持股"].astype(str).str.strip()
         out = out.drop_duplicates(subset=["姓名"])
-
-        self.logger.info(f"✅ CSV 數據處理完成：{len(out)} 筆")
-        return out if not out.empty else None
+        return out
 
     def extract_data_from_divs(self, stock_code):
         """從 div/span 區塊提取姓名和目前持股數據"""
@@ -809,10 +2809,10 @@ class FixedInputCrawler:
             self.logger.info(f"🔍 嘗試從 div/span 區塊提取股票 {stock_code} 的數據")
 
             # 等待數據完全加載
-            time.sleep(3)
+            self._pause(3)
 
             # 尋找所有包含「姓名：」的元素
-            name_elements = self.driver.find_elements(By.XPATH, "//*[contains(text(), '姓名：')]")
+            name_elements = self._find("//*[contains(text(), '姓名：')]")
             self.logger.info(f"📋 找到 {len(name_elements)} 個包含「姓名：」的元素")
 
             if not name_elements:
@@ -835,7 +2835,7 @@ class FixedInputCrawler:
 
                         # 策略1: 在同一個父元素中尋找
                         parent = name_element.find_element(By.XPATH, "./..")
-                        holdings_elements = parent.find_elements(By.XPATH, ".//*[contains(text(), '目前持股：')]")
+                        holdings_elements = self._find(".//*[contains(text(), '目前持股：')]", root=parent)
 
                         if holdings_elements:
                             holdings_text = holdings_elements[0].text.strip()
@@ -843,14 +2843,14 @@ class FixedInputCrawler:
                                 holdings = holdings_text.split("目前持股：")[1].strip()
                         else:
                             # 策略2: 在整個頁面中尋找緊鄰的「目前持股：」元素
-                            following_elements = name_element.find_elements(By.XPATH, "./following::*[contains(text(), '目前持股：')][1]")
+                            following_elements = self._find("./following::*[contains(text(), '目前持股：')][1]", root=name_element)
                             if following_elements:
                                 holdings_text = following_elements[0].text.strip()
                                 if "目前持股：" in holdings_text:
                                     holdings = holdings_text.split("目前持股：")[1].strip()
                             else:
                                 # 策略3: 尋找下一個兄弟元素或鄰近元素
-                                siblings = name_element.find_elements(By.XPATH, "./following-sibling::*")
+                                siblings = self._find("./following-sibling::*", root=name_element)
                                 for sibling in siblings[:5]:  # 只檢查前5個兄弟元素
                                     if "目前持股：" in sibling.text:
                                         holdings_text = sibling.text.strip()
@@ -858,14 +2858,16 @@ class FixedInputCrawler:
                                         break
 
                         if name and holdings is not None:
-                            extracted_data.append({
-                                "姓名": name,
-                                "目前持股": holdings
-                            })
+                            # 同一區塊內的其他明細（職稱、選任時持股、設質股數…）
+                            record = self._labelled_fields(self._block_lines(parent.text, name))
+                            record.update({"姓名": name, "目前持股": holdings})
+                            extracted_data.append(record)
                             self.logger.info(f"   ✅ 提取成功: 姓名={name}, 目前持股={holdings}")
                         else:
                             self.logger.info(f"   ⚠️ 無法找到對應的持股數據: 姓名={name}")
 
+                except DeadlineExceeded:
+                    raise
                 except Exception as e:
                     self.logger.info(f"   ⚠️ 處理元素時出錯: {e}")
                     continue
@@ -878,17 +2880,26 @@ class FixedInputCrawler:
                 self.logger.info("ℹ️ div/span 區塊中未提取到有效數據")
                 return None
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(f"❌ div/span 數據提取失敗: {e}")
             return None
 
+    @staticmethod
+    def _block_lines(text, name):
+        """父元素文字中屬於這位董監事的那一段（從其「姓名：」到下一個「姓名：」），逐行回傳"""
+        segments = text.split("姓名：")
+        segment = next((seg for seg in segments[1:] if seg.strip().startswith(name)), text)
+        return [ln.strip() for ln in segment.splitlines() if ln.strip()]
+
     def extract_data_from_table(self, stock_code):
         """從表格提取姓名和目前持股數據（原始邏輯）"""
         try:
             self.logger.info(f"📊 從表格提取股票 {stock_code} 的數據")
 
             # 寻找数据表格
-            tables = self.driver.find_elements(By.TAG_NAME, "table")
+            tables = self._find("table", By.TAG_NAME)
             self.logger.info(f"📋 页面中找到 {len(tables)} 个表格")
 
             if not tables:
@@ -901,13 +2912,8 @@ class FixedInputCrawler:
 
             for i, table in enumerate(tables):
                 try:
-                    table_text = table.text
-                    keywords = ["姓名", "持股", "董事", "監事", "目前", "現任"]
-                    score = sum(1 for keyword in keywords if keyword in table_text)
-
-                    rows = table.find_elements(By.TAG_NAME, "tr")
-                    if len(rows) < 2:
-                        score = 0
+                    rows = self._find("tr", By.TAG_NAME, root=table)
+                    score = self._score_table(table.text, len(rows))
 
                     self.logger.info(f"   表格{i+1}: 评分{score}, 行数{len(rows)}")
 
@@ -915,6 +2921,8 @@ class FixedInputCrawler:
                         max_score = score
                         target_table = table
 
+                except DeadlineExceeded:
+                    raise
                 except:
                     continue
 
@@ -923,15 +2931,15 @@ class FixedInputCrawler:
                 return None
 
             # 提取表格数据
-            rows = target_table.find_elements(By.TAG_NAME, "tr")
+            rows = self._find("tr", By.TAG_NAME, root=target_table)
             headers = []
             data_rows = []
 
             for row in rows:
                 try:
-                    cells = row.find_elements(By.TAG_NAME, "td")
+                    cells = self._find("td", By.TAG_NAME, root=row)
                     if not cells:
-                        cells = row.find_elements(By.TAG_NAME, "th")
+                        cells = self._find("th", By.TAG_NAME, root=row)
                         if cells and not headers:
                             headers = [cell.text.strip() for cell in cells if cell.text.strip()]
 
@@ -939,89 +2947,160 @@ class FixedInputCrawler:
                         row_data = [cell.text.strip() for cell in cells]
                         data_rows.append(row_data)
 
+                except DeadlineExceeded:
+                    raise
                 except:
                     continue
 
-            if not data_rows:
-                self.logger.warning("⚠️ 没有提取到有效数据")
-                return None
+            return self._holdings_from_rows(headers, data_rows)
 
-            self.logger.info(f"📊 表头: {headers}")
-            self.logger.info(f"📊 数据行: {len(data_rows)}")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            self.logger.error(f"❌ 表格数据提取失败: {e}")
+            return None
 
-            # 智能识别姓名和持股列
-            name_col_index = None
-            holdings_col_index = None
+    @staticmethod
+    def _score_table(table_text, n_rows):
+        """依關鍵詞為表格評分，少於兩列的表格不列入考慮"""
+        keywords = ["姓名", "持股", "董事", "監事", "目前", "現任"]
+        score = sum(1 for keyword in keywords if keyword in table_text)
+        return score if n_rows >= 2 else 0
+
+    def _holdings_from_rows(self, headers, data_rows):
+        """由表頭與資料列推斷姓名欄、持股欄並取出資料（不需瀏覽器）"""
+        if not data_rows:
+            self.logger.warning("⚠️ 没有提取到有效数据")
+            return None
 
-            # 寻找姓名列
-            for i, header in enumerate(headers):
-                if any(keyword in header for keyword in ["姓名", "名稱"]):
-                    name_col_index = i
-                    break
-            if name_col_index is None and len(headers) >= 2:
-                name_col_index = 1
+        self.logger.info(f"📊 表头: {headers}")
+        self.logger.info(f"📊 数据行: {len(data_rows)}")
+
+        # 智能识别姓名和持股列
+        name_col_index = None
+        holdings_col_index = None
 
-            # 寻找持股列
-            for i, header in enumerate(headers):
-                if any(keyword in header for keyword in ["目前持股", "目前"]):
-                    holdings_col_index = i
+        # 寻找姓名列
+        for i, header in enumerate(headers):
+            if any(keyword in header for keyword in ["姓名", "名稱"]):
+                name_col_index = i
+                break
+        if name_col_index is None and len(headers) >= 2:
+            name_col_index = 1
+
+        # 寻找持股列
+        for i, header in enumerate(headers):
+            if any(keyword in header for keyword in ["目前持股", "目前"]):
+                holdings_col_index = i
+                break
+        if holdings_col_index is None:
+            for col in range(2, min(len(headers), 6)):
+                has_numbers = False
+                for row in data_rows[:3]:
+                    if col < len(row):
+                        cell_text = row[col].replace(',', '').replace(' ', '')
+                        if cell_text.isdigit() and len(cell_text) > 2:
+                            has_numbers = True
+                            break
+                if has_numbers:
+                    holdings_col_index = col
                     break
-            if holdings_col_index is None:
-                for col in range(2, min(len(headers), 6)):
-                    has_numbers = False
-                    for row in data_rows[:3]:
-                        if col < len(row):
-                            cell_text = row[col].replace(',', '').replace(' ', '')
-                            if cell_text.isdigit() and len(cell_text) > 2:
-                                has_numbers = True
-                                break
-                    if has_numbers:
-                        holdings_col_index = col
-                        break
 
-            if name_col_index is None or holdings_col_index is None:
-                self.logger.error(f"❌ 无法识别姓名列({name_col_index})或持股列({holdings_col_index})")
-                return None
+        if name_col_index is None or holdings_col_index is None:
+            self.logger.error(f"❌ 无法识别姓名列({name_col_index})或持股列({holdings_col_index})")
+            return None
 
-            # 提取数据
-            extracted_data = []
-            for row in data_rows:
-                try:
-                    if name_col_index < len(row) and holdings_col_index < len(row):
-                        name = row[name_col_index].strip()
-                        holdings = row[holdings_col_index].strip()
-
-                        if (name and holdings and name not in ["姓名", "名稱"] and
-                            not any(keyword in name for keyword in ["職稱", "姓名"])):
-                            extracted_data.append({
-                                "姓名": name,
-                                "目前持股": holdings
-                            })
-                except:
-                    continue
+        # 其他認得的明細欄位（職稱、選任時持股、設質股數…）
+        extra_cols = {field: i for field, i in self._schema_columns(headers).items()
+                      if field not in self.DEFAULT_FIELDS and i not in (name_col_index, holdings_col_index)}
 
-            if extracted_data:
-                df = pd.DataFrame(extracted_data)
-                self.logger.info(f"✅ 從表格成功提取 {len(extracted_data)} 行数据")
-                return df
-            else:
-                self.logger.warning("⚠️ 表格中没有提取到有效的姓名和持股数据")
-                return None
+        # 提取数据
+        extracted_data = []
+        for row in data_rows:
+            try:
+                if name_col_index < len(row) and holdings_col_index < len(row):
+                    name = row[name_col_index].strip()
+                    holdings = row[holdings_col_index].strip()
+
+                    if (name and holdings and name not in ["姓名", "名稱"] and
+                        not any(keyword in name for keyword in ["職稱", "姓名"])):
+                        record = {field: row[i].strip() for field, i in extra_cols.items() if i < len(row)}
+                        record.update({"姓名": name, "目前持股": holdings})
+                        extracted_data.append(record)
+            except:
+                continue
 
-        except Exception as e:
-            self.logger.error(f"❌ 表格数据提取失败: {e}")
+        if extracted_data:
+            df = pd.DataFrame(extracted_data)
+            self.logger.info(f"✅ 從表格成功提取 {len(extracted_data)} 行数据")
+            return df
+        else:
+            self.logger.warning("⚠️ 表格中没有提取到有效的姓名和持股数据")
             return None
 
+    def _parse_html_payload(self, html):
+        """離線解析結果頁 HTML：先找「姓名：/目前持股：」區塊，再找評分最高的表格（與線上流程相同順序）"""
+        parser = _ResultPageParser()
+        parser.feed(html if isinstance(html, str) else html.decode("utf-8", errors="replace"))
+
+        # div/span 區塊：姓名後面、下一個姓名之前的第一個「目前持股：」
+        texts = parser.texts
+        extracted = []
+        for i, text in enumerate(texts):
+            if "姓名：" not in text:
+                continue
+            name = text.split("姓名：")[1].strip() or (texts[i + 1] if i + 1 < len(texts) else "")
+            if not name or "：" in name:
+                continue
+            end = next((j for j in range(i + 1, min(i + 40, len(texts))) if "姓名：" in texts[j]),
+                       min(i + 40, len(texts)))
+            fields = self._labelled_fields(texts[i + 1:end])
+            if "目前持股" in fields:
+                fields["姓名"] = name
+                extracted.append(fields)
+        if extracted:
+            return pd.DataFrame(extracted)
+
+        # 表格
+        target, max_score = None, 0
+        for table in parser.tables:
+            score = self._score_table(" ".join(table["text"]), len(table["rows"]))
+            if score > max_score and score >= 2:
+                max_score, target = score, table
+        if target is None:
+            return None
+        headers, data_rows = [], []
+        for row in target["rows"]:
+            cells = [" ".join(texts_).strip() for tag, texts_ in row if tag == "td"]
+            if not cells:
+                cells = [" ".join(texts_).strip() for tag, texts_ in row if tag == "th"]
+                if cells and not headers:
+                    headers = [c for c in cells if c]
+            if len(cells) >= 2 and any(cells):
+                data_rows.append(cells)
+        return self._holdings_from_rows(headers, data_rows)
+
+    def parse_archived(self, kind, raw):
+        """依封存種類解析原始內容"""
+        if kind == "csv":
+            return self._parse_csv_bytes(raw)
+        if kind == "json":
+            return self._parse_xhr_payload(json.loads(raw.decode("utf-8", errors="replace")))
+        if kind == "html":
+            return self._parse_html_payload(raw)
+        return None
+
     def extract_name_and_holdings_data(self, stock_code):
         """提取姓名和目前持股数据（優先使用 div/span，其次使用表格）"""
         try:
             self.logger.info(f"📊 步骤5: 提取股票 {stock_code} 的姓名和持股数据")
 
             # 等待数据完全加载
-            time.sleep(3)
+            self._pause(3)
 
             # 验证是否有查询结果
             page_source = self.driver.page_source
+            self._archive("html", page_source)
             if stock_code not in page_source and "股份有限公司" not in page_source:
                 self.logger.warning("⚠️ 页面中可能没有查询结果")
 
@@ -1041,10 +3120,117 @@ class FixedInputCrawler:
             self.logger.warning("⚠️ 所有提取方式都未能獲得有效數據")
             return None
 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             self.logger.error(f"❌ 数据提取失败: {e}")
             return None
 
+    def _tag_result(self, data, stock_code):
+        """在存入 self.all_data 之前，依明細欄位轉型並加入股票代號與公司名稱欄位（如果尚未插入）"""
+        data = self._coerce_schema(data)
+        if "股票代號" not in data.columns:
+            data.insert(0, "股票代號", stock_code)
+        if "公司名稱" not in data.columns:
+            data.insert(1, "公司名稱", self.company_name(stock_code))
+        return data
+
+    def _extract_query_result(self, stock_code):
+        """數據提取（優先順序：CSV下載 > div/span解析 > 表格解析）"""
+        # 步骤4a: 优先尝试CSV下载
+        data = self.download_csv_and_parse()
+        if data is not None and len(data) > 0:
+            self.logger.info(f"✅ 股票 {stock_code} 通過CSV下載處理成功")
+            return data
+
+        # 步骤4b: 如果CSV下载失败，退回到原有的解析逻辑
+        self.logger.info("📋 CSV下載失敗，使用備援解析方式")
+        data = self._run_stage("parse", lambda: self.extract_name_and_holdings_data(stock_code))
+        if data is not None and len(data) > 0:
+            self.logger.info(f"✅ 股票 {stock_code} 通過備援解析處理成功")
+            return data
+        return None
+
+    @staticmethod
+    def _is_crash(error):
+        """瀏覽器本身已失效的例外，階段重試無效，交給上層重啟瀏覽器"""
+        msg = str(error).lower()
+        return any(k in msg for k in ("chrome not reachable", "session deleted", "invalid session id"))
+
+    def _run_stage(self, stage, fn, background=False, deadline=None):
+        """
+        執行一個階段，失敗（回傳 None/False/空表或拋出非崩潰例外）時只重試這個階段，
+        不回到主頁重來；重試次數見 STAGE_RETRIES（沒有單檔時限時另受 UNBOUNDED_STAGE_RETRIES 限制）。
+        重試用盡時記在 stage_exhausted，外層不再整檔重試，避免兩層重試相乘拉長最壞耗時。
+        background=True 用於不操作瀏覽器的背景執行緒：以 time.sleep 等待，不調整 driver 逾時，
+        時限由 deadline 明確傳入（self._deadline 屬於瀏覽器執行緒，已換成下一個期別的時限）。
+        """
+        if not background:
+            deadline = self._deadline
+        retries = self.STAGE_RETRIES.get(stage, 0)
+        if deadline is None and stage in self.UNBOUNDED_STAGE_RETRIES:
+            retries = min(retries, self.UNBOUNDED_STAGE_RETRIES[stage])
+        attempts = retries + 1
+        result = None
+        for i in range(attempts):
+            if i:
+                with self._stage_lock:
+                    self.stage_retry_counts[stage] = self.stage_retry_counts.get(stage, 0) + 1
+                self.logger.info(f"🔁 重試「{stage}」階段（{i}/{attempts - 1}）")
+                if background:
+                    time.sleep(deadline.cap(min(2 ** (i - 1), 4)) if deadline else min(2 ** (i - 1), 4))
+                else:
+                    self._pause(min(2 ** (i - 1), 4))
+            if not background:
+                self._apply_driver_timeouts()
+            try:
+                result = fn()
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded) or self._is_crash(e):
+                    raise
+                self.logger.warning(f"⚠️ 「{stage}」階段異常: {e}")
+                result = None
+            ok = len(result) > 0 if isinstance(result, pd.DataFrame) else bool(result)
+            if ok:
+                return result
+        if retries:
+            self.stage_exhausted = stage
+        return None
+
+    def _open_query_form(self, stock_code):
+        """導航到查詢頁並填入代號（各自可重試），失敗時記錄原因"""
+        for stage, fn in (("navigate", self.navigate_to_target_page),
+                          ("fill", lambda: self.find_and_fill_company_input(stock_code))):
+            if not self._run_stage(stage, fn):
+                self.last_failure_reason = self.STAGE_FAILURE_REASONS[stage]
+                return False
+        return True
+
+    def _query_stage(self, stock_code):
+        """
+        送出查詢；送出失敗或網站錯誤時在已填好的表單上重新查詢。
+        回傳 (是否成功送出, DataFrame 或 None)；網站錯誤用盡重試時回傳 (True, None) 交由 _no_result 記錄。
+        """
+        def attempt():
+            submitted, data = self._submit_query(stock_code)
+            if not submitted or (data is None and self.result_state == "site_error"):
+                return None
+            return submitted, data
+
+        result = self._run_stage("query", attempt)
+        if result is not None:
+            return result
+        if self.result_state == "site_error":
+            return True, None
+        self.last_failure_reason = self.STAGE_FAILURE_REASONS["query"]
+        return False, None
+
+    def _log_stage_retries(self):
+        if self.stage_retry_counts:
+            detail = "、".join(f"{stage} {n} 次" for stage, n in sorted(self.stage_retry_counts.items(),
+                                                                      key=lambda kv: -kv[1]))
+            self.logger.info(f"🔁 各階段重試次數: {detail}")
+
     def process_single_stock(self, stock_code, is_retry=False):
         """处理单个股票的完整流程"""
         try:
@@ -1053,6 +3239,9 @@ class FixedInputCrawler:
             self.logger.info(f"📈 开始处理股票: {stock_code} {retry_msg}")
             self.logger.info(f"{'='*60}")
 
+            self._begin_crawl(stock_code)
+            self.last_failure_reason = None
+
             # 確保只有一個分頁
             self.ensure_single_tab()
 
@@ -1061,45 +3250,31 @@ class FixedInputCrawler:
                 self.logger.error(f"❌ 瀏覽器驅動已斷線，處理股票 {stock_code} 失敗")
                 return False
 
-            # 导航到目标页面
-            if not self.navigate_to_target_page():
-                return False
-
-            # 寻找并填写输入框
-            if not self.find_and_fill_company_input(stock_code):
+            # 导航到目标页面并填写输入框（各階段失敗時原地重試）
+            if not self._open_query_form(stock_code):
                 return False
 
             # 点击查询按钮
-            if not self.click_query_button():
+            submitted, data = self._query_stage(stock_code)
+            if not submitted:
                 return False
 
-            # 數據提取（優先順序：CSV下載 > div/span解析 > 表格解析）
-            data = None
-
-            # 步骤4a: 优先尝试CSV下载
-            data = self.download_csv_and_parse()
-            if data is not None and len(data) > 0:
-                # 在存入 self.all_data 之前，加入股票代號欄位（如果尚未插入）
-                if "股票代號" not in data.columns:
-                    data.insert(0, "股票代號", stock_code)
-                self.all_data[stock_code] = data
-                self.logger.info(f"✅ 股票 {stock_code} 通過CSV下載處理成功")
-                return True
-
-            # 步骤4b: 如果CSV下载失败，退回到原有的解析逻辑
-            self.logger.info("📋 CSV下載失敗，使用備援解析方式")
-            data = self.extract_name_and_holdings_data(stock_code)
-            if data is not None and len(data) > 0:
-                # 在存入 self.all_data 之前，加入股票代號欄位（如果尚未插入）
-                if "股票代號" not in data.columns:
-                    data.insert(0, "股票代號", stock_code)
-                self.all_data[stock_code] = data
-                self.logger.info(f"✅ 股票 {stock_code} 通過備援解析處理成功")
+            if data is None:
+                if self._no_result(stock_code):
+                    return False
+                data = self._extract_query_result(stock_code)
+            if data is not None:
+                self.all_data[stock_code] = self._tag_result(data, stock_code)
                 return True
             else:
                 self.logger.error(f"❌ 股票 {stock_code} 所有數據提取方式都失敗")
+                self.last_failure_reason = self.STAGE_FAILURE_REASONS["parse"]
                 return False
 
+        except DeadlineExceeded as e:
+            self.logger.warning(f"⏰ 股票 {stock_code} {e}，放棄此檔")
+            self.last_failure_reason = self.DEADLINE_REASON
+            return False
         except (WebDriverException, Exception) as e:
             if "chrome not reachable" in str(e).lower() or "session deleted" in str(e).lower():
                 self.logger.error(f"⚠️ Chrome 崩潰檢測到: {e}")
@@ -1110,53 +3285,16 @@ class FixedInputCrawler:
     def save_to_excel(self, output_path, make_per_sheet=False):
         """保存到Excel"""
         try:
-            with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                # 合併表
-                merged = []
-                for stock_code, df in self.all_data.items():
-                    merged.append(df[["股票代號", "姓名", "目前持股"]].copy())
-
-                if merged:
-                    merged_df = pd.concat(merged, ignore_index=True)
-                    merged_df.to_excel(writer, sheet_name="合併", index=False)
-
-                    # 簡單格式
-                    ws = writer.sheets["合併"]
-                    from openpyxl.styles import Font, PatternFill, Alignment
-                    header_font = Font(bold=True, color="FFFFFF")
-                    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                    for cell in ws[1]:
-                        cell.font = header_font
-                        cell.fill = header_fill
-                        cell.alignment = Alignment(horizontal="center")
-                    ws.column_dimensions['A'].width = 14  # 股票代號
-                    ws.column_dimensions['B'].width = 30  # 姓名
-                    ws.column_dimensions['C'].width = 20  # 目前持股
-
-                # 依代號各自一張分頁（可選）
-                if make_per_sheet:
-                    for stock_code, data in self.all_data.items():
-                        sheet_name = f"股票_{stock_code}"[:31]  # Excel 名稱長度限制
-                        data.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                        # 格式化
-                        worksheet = writer.sheets[sheet_name]
-                        from openpyxl.styles import Font, PatternFill, Alignment
-
-                        header_font = Font(bold=True, color="FFFFFF")
-                        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-
-                        for cell in worksheet[1]:
-                            cell.font = header_font
-                            cell.fill = header_fill
-                            cell.alignment = Alignment(horizontal="center")
-
-                        worksheet.column_dimensions['A'].width = 14  # 股票代號
-                        worksheet.column_dimensions['B'].width = 30  # 姓名
-                        worksheet.column_dimensions['C'].width = 20  # 目前持股
-
-                if self.failed_codes:
-                    pd.DataFrame({"失敗的股票代號": self.failed_codes}).to_excel(writer, sheet_name="失敗記錄", index=False)
+            writer = StreamingExcelWriter(output_path, self.output_columns, self.COLUMN_WIDTHS, logger=self.logger)
+            for stock_code, df in self.all_data.items():
+                writer.append(df)
+            # 依代號各自一張分頁（可選）
+            if make_per_sheet:
+                for stock_code, data in self.all_data.items():
+                    writer.write_sheet(f"股票_{stock_code}", data)
+            if self.failed_codes:
+                writer.write_sheet("失敗記錄", self._failures_df())
+            writer.close()
 
             self.logger.info(f"✅ Excel文件保存成功: {output_path}")
             return True
@@ -1165,38 +3303,228 @@ class FixedInputCrawler:
             self.logger.error(f"❌ Excel保存失败: {e}")
             return False
 
-    def run_batch(self, codes_file="股票代號.txt", make_per_sheet=False, throttle_sec=1.5, retry=1):
+    def iter_holdings(self, codes, periods=None, retry=1, throttle_sec=1.5, done=None):
+        """
+        逐檔查詢並在每檔完成時立即產出結果（generator）。
+
+        呼叫端取下一筆之前不會開始查詢下一檔，因此消費端慢時爬蟲會自動停下（背壓），
+        結果也不會累積在 self.all_data。每個代號（或每組代號、期別）恰好產出一筆 dict：
+        {"code", "period", "ok", "data"(DataFrame 或 None), "reason"}；單期別查詢另含耗時 "seconds"。
+        若呼叫前尚未啟動瀏覽器，會在第一筆時啟動並於結束時關閉。
+        done 為已完成的「代號@期別」集合，多期別模式下這些組合會被略過。
+        """
+        own_driver = self.driver is None
+        total = len(codes)
+        self.processed_count = 0  # 重置計數器
+        restarted_at = 0
+        try:
+            for idx, code in enumerate(codes, 1):
+                if idx > 1:
+                    self._pause(throttle_sec)  # 節流，避免過快
+
+                # 每處理 200 個股票就自動重啟瀏覽器
+                if self.processed_count - restarted_at >= 200:
+                    self.logger.info(f"♻️ 已處理 {self.processed_count} 個股票，自動重啟瀏覽器")
+                    restarted_at = self.processed_count
+                    if not self.restart_driver():
+                        self.logger.error("♻️ 瀏覽器重啟失敗，終止程序")
+                        yield from self._driver_failure_records(codes[idx - 1:], periods)
+                        return
+
+                if self.driver is None and not self.init_driver():
+                    yield from self._driver_failure_records(codes[idx - 1:], periods)
+                    return
+
+                if periods:
+                    todo = [p for p in periods if f"{code}@{p}" not in (done or ())]
+                    self._trace_begin(code)
+                    yield from self._crawl_code_periods(idx, total, code, todo, retry)
+                    self._trace_end()
+                else:
+                    self._trace_begin(code)
+                    started = time.monotonic()
+                    record = self._crawl_code(idx, total, code, retry)
+                    record["seconds"] = time.monotonic() - started
+                    self._trace_end()
+                    yield record
+        finally:
+            if own_driver and self.driver:
+                self.driver.quit()
+                self.driver = None
+
+    @property
+    def history(self):
+        """
+        各代號耗時與失敗歷史（code_history.csv），用來排程與估計完成時間。
+        只有排程的 runner 會用到，第一次存取時才載入；瀏覽器池、分頁與重新解析的實例不讀檔。
+        """
+        if self._history is None:
+            self._history = CodeHistory()
+        return self._history
+
+    @history.setter
+    def history(self, value):
+        self._history = value
+
+    def _schedule(self, pending, workers=1, throttle_sec=0.0):
+        """依歷史排定待處理代號的順序，並記錄預估完成時間"""
+        if self.schedule_by_history and len(pending) > 1:
+            pending = self.history.schedule(pending)
+            stale = sum(1 for c in pending if self.history.is_stale(c))
+            self.logger.info(f"🗓️ 依歷史排程：{stale} 檔久未更新優先，耗時長者先做，不穩定的代號分散穿插")
+        if pending:
+            eta = self.history.estimate(pending, workers, throttle_sec)
+            finish = datetime.now() + timedelta(seconds=eta)
+            self.logger.info(f"⏱️ 依歷史估計需時約 {eta/60:.0f} 分鐘，預計 {finish:%m-%d %H:%M} 完成")
+        return pending
+
+    def _record_history(self, code, seconds, ok, reason=None):
+        """記錄一檔的耗時與成敗；查無資料、代號無效等確定結果不算不穩定"""
+        if seconds is None:
+            return
+        terminal = reason in {self.RESULT_REASONS[s] for s in self.TERMINAL_RESULT_STATES}
+        self.history.record(code, seconds, ok, count_failure=not terminal)
+
+    def _trace_begin(self, code):
+        if self.tracer:
+            self.tracer.begin(code)
+
+    def _trace_end(self):
+        if self.tracer:
+            self.tracer.end()
+
+    def _driver_failure_records(self, codes, periods):
+        """瀏覽器無法啟動時，為剩餘代號產出失敗結果"""
+        for code in codes:
+            for period in (periods or [None]):
+                yield {"code": code, "period": period, "ok": False, "data": None, "reason": "瀏覽器無法啟動"}
+
+    def _crawl_code(self, idx, total, code, retry):
+        """單一代號含重試與崩潰重啟，回傳一筆結果；有單檔時限時重試也在同一個預算內"""
+        ok = False
+        self.result_state = None
+        self.last_failure_reason = None
+        self._start_deadline()
+        try:
+            self._crawl_code_attempts(idx, total, code, retry)
+        except DeadlineExceeded as e:
+            self.logger.warning(f"⏰ 股票 {code} {e}，放棄此檔")
+            self.last_failure_reason = self.DEADLINE_REASON
+        finally:
+            self._deadline = None
+
+        # 取出後即從 self.all_data 移除，由消費端決定保留與否
+        data = self.all_data.pop(code, None)
+        if data is not None:
+            self.processed_count += 1
+            return {"code": code, "period": None, "ok": True, "data": data, "reason": None}
+        return {"code": code, "period": None, "ok": False, "data": None,
+                "reason": self.last_failure_reason or "查詢或解析失敗"}
+
+    def _crawl_code_attempts(self, idx, total, code, retry):
+        """_crawl_code 的重試迴圈"""
+        for r in range(retry + 1):
+            is_retry = r > 0
+            if is_retry:
+                self.logger.info(f"[{idx}/{total}] ▶︎ {code}（重試 {r}/{retry}）")
+            else:
+                self.logger.info(f"[{idx}/{total}] ▶︎ {code}")
+
+            # 檢查瀏覽器狀態，如果崩潰則重啟
+            if not self.check_driver_alive():
+                self.logger.warning(f"⚠️ Chrome 崩潰檢測到，正在重啟瀏覽器...")
+                if not self.restart_driver():
+                    self.logger.error(f"⚠️ Chrome 重啟失敗，跳過股票 {code}")
+                    break
+
+            try:
+                self.stage_exhausted = None
+                ok = self.process_single_stock(code, is_retry=is_retry)  # 內含 CSV/備援解析
+                if ok and code in self.all_data:
+                    break
+                if self.result_state in self.TERMINAL_RESULT_STATES:
+                    break  # 查無資料或代號無效，重試也不會有結果
+                if self.last_failure_reason == self.DEADLINE_REASON:
+                    break
+                if self.stage_exhausted:
+                    self.logger.info(f"   「{self.stage_exhausted}」階段已用盡原地重試，不再整檔重試")
+                    break
+            except (WebDriverException, Exception) as e:
+                if "chrome not reachable" in str(e).lower() or "session deleted" in str(e).lower():
+                    self.logger.warning(f"⚠️ Chrome 崩潰，準備重試: {e}")
+                    if not self.restart_driver():
+                        self.logger.error(f"⚠️ Chrome 重啟失敗")
+                        break
+                else:
+                    self.logger.error(f"❌ 處理股票 {code} 時發生異常: {e}")
+                    break
+
+            self._pause(2)
+
+    def _crawl_code_periods(self, idx, total, code, periods, retry):
+        """單一代號的多個期別，失敗的期別重試；每個期別產出一筆結果"""
+        todo = list(periods)
+        for r in range(retry + 1):
+            self.logger.info(f"[{idx}/{total}] ▶︎ {code}（{len(todo)} 期，重試 {r}/{retry}）")
+            if not self.check_driver_alive() and not self.restart_driver():
+                self.logger.error(f"⚠️ Chrome 重啟失敗，跳過股票 {code}")
+                break
+
+            self.stage_exhausted = None
+            results = self.process_stock_periods(code, todo)
+            for period in todo:
+                if period in results:
+                    yield {"code": code, "period": period, "ok": True, "data": results[period], "reason": None}
+                elif period in self.period_reasons:
+                    yield {"code": code, "period": period, "ok": False, "data": None,
+                           "reason": self.period_reasons[period]}
+            todo = [p for p in todo if p not in results and p not in self.period_reasons]
+            if not todo or self.stage_exhausted:
+                break
+            self._pause(2)
+
+        for period in todo:
+            yield {"code": code, "period": period, "ok": False, "data": None, "reason": "查詢或解析失敗"}
+        self.processed_count += 1
+
+    def run_batch(self, codes_file="股票代號.txt", make_per_sheet=False, throttle_sec=1.5, retry=1, validate=True):
         """批次處理股票清單"""
         try:
             self.logger.info("="*80)
             self.logger.info("🚀 批次抓取開始")
             self.logger.info("="*80)
 
-            if not self.init_driver():
-                return False
-
             codes = self.read_stock_codes(codes_file)
             if not codes:
                 self.logger.error("❌ 沒有可用的代號")
                 return False
 
-            for idx, code in enumerate(codes, 1):
-                ok = False
-                for r in range(retry + 1):
-                    self.logger.info(f"\n[{idx}/{len(codes)}] ▶︎ 處理 {code}（重試 {r}/{retry}）")
-                    ok = self.process_single_stock(code)
-                    if ok:
-                        break
-                    time.sleep(2)
-                if not ok:
-                    self.failed_codes.append(code)
-                time.sleep(throttle_sec)  # 節流，避免過快
+            if validate:
+                self.load_company_index()
+                codes, unknown = self.validate_codes(codes)
+                for code in unknown:
+                    self.record_failure(code, "代號不在上市櫃公司清單")
 
-            if self.all_data:
-                ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                out = f"董監事持股_批次_{ts}.xlsx"
-                self.save_to_excel(out, make_per_sheet=make_per_sheet)
-                self.logger.info(f"🎯 批次完成！成功 {len(self.all_data)} 檔，失敗 {len(self.failed_codes)} 檔")
+            # 每檔結果直接寫入 write-only 工作簿，不保留在記憶體
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out = f"董監事持股_批次_{ts}.xlsx"
+            writer = StreamingExcelWriter(out, self.output_columns, self.COLUMN_WIDTHS, logger=self.logger)
+            success_cnt = 0
+            for rec in self.iter_holdings(codes, retry=retry, throttle_sec=throttle_sec):
+                if rec["ok"]:
+                    writer.append(rec["data"])
+                    if make_per_sheet:
+                        writer.write_sheet(f"股票_{rec['code']}", rec["data"])
+                    success_cnt += 1
+                else:
+                    self.record_failure(rec["code"], rec["reason"])
+
+            if success_cnt:
+                if self.failed_codes:
+                    writer.write_sheet("失敗記錄", self._failures_df())
+                paths = writer.close()
+                self.logger.info(f"✅ Excel文件保存成功: {', '.join(paths)}")
+                self.logger.info(f"🎯 批次完成！成功 {success_cnt} 檔，失敗 {len(self.failed_codes)} 檔")
                 return True
             else:
                 self.logger.error("❌ 無任何成功資料")
@@ -1206,10 +3534,12 @@ class FixedInputCrawler:
             self.logger.error(f"❌ 批次執行發生例外: {e}")
             return False
         finally:
+            self._log_stage_retries()
             if self.driver:
                 self.driver.quit()
 
-    def run_batch_resume(self, codes_file="股票代號.txt", out_path=None, throttle_sec=1.5, retry=1):
+    def run_batch_resume(self, codes_file="股票代號.txt", out_path=None, throttle_sec=1.5, retry=1,
+                         validate=True, refresh_index=False):
         """批次處理股票清單（可續跑版本）"""
         import os
         from datetime import datetime
@@ -1218,14 +3548,17 @@ class FixedInputCrawler:
         self.logger.info("🚀 批次抓取（可續跑）開始")
         self.logger.info("="*80)
 
-        if not self.init_driver():
-            return False
-
         codes = self.read_stock_codes(codes_file)
         if not codes:
             self.logger.error("❌ 沒有可用的代號")
             return False
 
+        if validate:
+            self.load_company_index(refresh=refresh_index)
+            codes, unknown = self.validate_codes(codes)
+            for code in unknown:
+                self.record_failure(code, "代號不在上市櫃公司清單")
+
         done = self.load_processed_codes()
         pending = [c for c in codes if c not in done]
         self.logger.info(f"✅ 已完成 {len(done)} 檔，待處理 {len(pending)} 檔")
@@ -1233,75 +3566,639 @@ class FixedInputCrawler:
         if out_path is None:
             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
             out_path = f"董監事持股_合併_{ts}.xlsx"
+        return self._crawl_pending(codes, pending, out_path, throttle_sec=throttle_sec, retry=retry)
 
+    def _crawl_pending(self, codes, pending, out_path, throttle_sec=1.5, retry=1):
+        """逐檔查詢已驗證過的待處理代號，即時寫入合併檔並標記 processed（run_batch_resume、run_bulk 共用）"""
+        pending = self._schedule(pending, throttle_sec=throttle_sec)
         success_cnt = 0
-        self.processed_count = 0  # 重置計數器
+        # 全部已完成時 iter_holdings 不會啟動瀏覽器
+        for rec in self.iter_holdings(pending, retry=retry, throttle_sec=throttle_sec):
+            self._record_history(rec["code"], rec.get("seconds"), rec["ok"], rec["reason"])
+            if rec["ok"]:
+                # 立刻寫入 Excel（合併表），並標記 processed
+                self.append_to_master_excel(out_path, rec["data"])
+                self.append_processed_code(rec["code"])
+                success_cnt += 1
+            else:
+                self.record_failure(rec["code"], rec["reason"])
 
-        for idx, code in enumerate(pending, 1):
-            # 每處理 200 個股票就自動重啟瀏覽器
-            if self.processed_count > 0 and self.processed_count % 200 == 0:
-                self.logger.info(f"♻️ 已處理 {self.processed_count} 個股票，自動重啟瀏覽器")
-                if not self.restart_driver():
-                    self.logger.error("♻️ 瀏覽器重啟失敗，終止程序")
-                    break
+        # 最後把失敗清單寫入到同一份 Excel 的「失敗記錄」sheet（覆蓋或新建）
+        self._finish_output(out_path, codes)
+        self.history.save()
 
-            ok = False
-            for r in range(retry + 1):
-                is_retry = r > 0
-                if is_retry:
-                    self.logger.info(f"[{idx}/{len(pending)}] ▶︎ {code}（重試 {r}/{retry}）")
-                else:
-                    self.logger.info(f"[{idx}/{len(pending)}] ▶︎ {code}")
+        self.logger.info(f"🎯 完成：成功 {success_cnt} 檔，失敗 {len(self.failed_codes)} 檔；輸出：{out_path}")
+        if self.driver:
+            self.driver.quit()
+        return success_cnt > 0
 
-                # 檢查瀏覽器狀態，如果崩潰則重啟
-                if not self.check_driver_alive():
-                    self.logger.warning(f"⚠️ Chrome 崩潰檢測到，正在重啟瀏覽器...")
-                    if not self.restart_driver():
-                        self.logger.error(f"⚠️ Chrome 重啟失敗，跳過股票 {code}")
-                        break
+    def run_tabs(self, tabs=3, codes_file="股票代號.txt", out_path=None, throttle_sec=1.5, retry=1,
+                 validate=True, refresh_index=False):
+        """多分頁模式（可續跑）：單一 Chrome 內以 tabs 個分頁同時查詢，結果由本執行緒寫入 Excel"""
+        self.logger.info("="*80)
+        self.logger.info(f"🚀 多分頁模式開始（{tabs} 個分頁）")
+        self.logger.info("="*80)
 
-                try:
-                    ok = self.process_single_stock(code, is_retry=is_retry)  # 內含 CSV/備援解析
-                    if ok and code in self.all_data:
-                        # 立刻寫入 Excel（合併表），並標記 processed
-                        df = self.all_data[code][["股票代號","姓名","目前持股"]].copy()
-                        self.append_to_master_excel(out_path, df)
-                        self.append_processed_code(code)
-                        # 釋放該代號的暫存以省記憶體
-                        del self.all_data[code]
-                        success_cnt += 1
-                        self.processed_count += 1
-                        break
-                except (WebDriverException, Exception) as e:
-                    if "chrome not reachable" in str(e).lower() or "session deleted" in str(e).lower():
-                        self.logger.warning(f"⚠️ Chrome 崩潰，準備重試: {e}")
-                        if not self.restart_driver():
-                            self.logger.error(f"⚠️ Chrome 重啟失敗")
-                            break
-                    else:
-                        self.logger.error(f"❌ 處理股票 {code} 時發生異常: {e}")
-                        break
+        codes = self.read_stock_codes(codes_file)
+        if not codes:
+            self.logger.error("❌ 沒有可用的代號")
+            return False
 
-                time.sleep(2)
+        if validate:
+            self.load_company_index(refresh=refresh_index)
+            codes, unknown = self.validate_codes(codes)
+            for code in unknown:
+                self.record_failure(code, "代號不在上市櫃公司清單")
 
-            if not ok:
-                self.failed_codes.append(code)
+        done = self.load_processed_codes()
+        pending = [c for c in codes if c not in done]
+        self.logger.info(f"✅ 已完成 {len(done)} 檔，待處理 {len(pending)} 檔")
 
-            time.sleep(throttle_sec)
+        if out_path is None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"董監事持股_合併_{ts}.xlsx"
 
-        # 最後把失敗清單寫入到同一份 Excel 的「失敗記錄」sheet（覆蓋或新建）
+        pending = self._schedule(pending, workers=tabs, throttle_sec=throttle_sec)
+        success_cnt = 0
+        group = TabGroup(min(tabs, max(len(pending), 1)), block_resources=self.block_resources,
+                         capture_xhr=self.capture_xhr, archive_dir=self.archive.root if self.archive else None,
+                         code_deadline=self.code_deadline, profile_dir=self.profile.path if self.profile else None)
+        try:
+            if pending and not group.start(company_index=self.company_index):
+                for code in pending:
+                    self.record_failure(code, "瀏覽器無法啟動")
+                pending = []
+            for rec in group.run(pending, retry=retry, throttle_sec=throttle_sec):
+                self._record_history(rec["code"], rec.get("seconds"), rec["ok"], rec["reason"])
+                if rec["ok"]:
+                    self.append_to_master_excel(out_path, rec["data"])
+                    self.append_processed_code(rec["code"])
+                    success_cnt += 1
+                else:
+                    self.record_failure(rec["code"], rec["reason"])
+        finally:
+            for tab in group.crawlers:
+                for stage, n in tab.stage_retry_counts.items():
+                    self.stage_retry_counts[stage] = self.stage_retry_counts.get(stage, 0) + n
+            group.close()
+
+        self._finish_output(out_path, codes)
+        self.history.save()
+        self.logger.info(f"🎯 完成：成功 {success_cnt} 檔，失敗 {len(self.failed_codes)} 檔；輸出：{out_path}")
+        return success_cnt > 0
+
+    def _finish_output(self, out_path, codes, periods=None):
+        """一輪結束時的輸出：啟用資料庫時由資料庫匯出 Excel（含失敗記錄），否則只補寫失敗記錄"""
+        self._log_stage_retries()
+        if self.store is None:
+            self._write_failures_sheet(out_path)
+            return
+        failures = self._failures_df() if self.failed_codes else None
+        total = self.store.export_excel(out_path, self.output_columns, codes=codes, periods=periods,
+                                        failures=failures, column_widths=self.COLUMN_WIDTHS, logger=self.logger)
+        self.logger.info(f"📤 由資料庫匯出 {total} 筆至 {out_path}")
+
+    def _write_failures_sheet(self, out_path):
+        """把失敗清單寫入 out_path 的「失敗記錄」工作表"""
         try:
             import pandas as pd
             mode = "a" if os.path.exists(out_path) else "w"
             with pd.ExcelWriter(out_path, engine="openpyxl", mode="a" if mode=="a" else "w") as writer:
                 if self.failed_codes:
-                    pd.DataFrame({"失敗的股票代號": self.failed_codes}).to_excel(writer, sheet_name="失敗記錄", index=False)
+                    self._failures_df().to_excel(writer, sheet_name="失敗記錄", index=False)
         except Exception as e:
             self.logger.warning(f"⚠️ 寫入失敗記錄時發生例外：{e}")
 
-        self.logger.info(f"🎯 完成：成功 {success_cnt} 檔，失敗 {len(self.failed_codes)} 檔；輸出：{out_path}")
+    def run_periods(self, periods, codes_file="股票代號.txt", out_path=None, throttle_sec=1.5, retry=1,
+                    validate=True, refresh_index=False):
+        """多期別回補：依代號排序、每檔在同一個查詢表單內跑完所有期別（可續跑）"""
+        self.logger.info("="*80)
+        self.logger.info(f"🚀 多期別回補開始：{periods[0]} ~ {periods[-1]}（{len(periods)} 期）")
+        self.logger.info("="*80)
+        self.output_columns = self._columns(self.PERIOD_COLUMNS)
+
+        codes = self.read_stock_codes(codes_file)
+        if not codes:
+            self.logger.error("❌ 沒有可用的代號")
+            return False
+
+        if validate:
+            self.load_company_index(refresh=refresh_index)
+            codes, unknown = self.validate_codes(codes)
+            for code in unknown:
+                self.record_failure(code, "代號不在上市櫃公司清單")
+
+        # 已完成的 (代號, 期別) 以「代號@期別」記錄在 processed_codes.txt
+        done = self.load_processed_codes()
+        pending = [c for c in codes if any(f"{c}@{p}" not in done for p in periods)]
+        self.logger.info(f"✅ 待處理 {len(pending)} 檔")
+
+        if out_path is None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"董監事持股_回補_{ts}.xlsx"
+
+        # 同一代號的期別會連續產出，累積到換代號時再一次寫入
+        success_cnt = 0
+        buffer = []
+
+        def flush():
+            if buffer:
+                self.append_to_master_excel(out_path, pd.concat([r["data"] for r in buffer], ignore_index=True))
+                for r in buffer:
+                    self.append_processed_code(f"{r['code']}@{r['period']}")
+                buffer.clear()
+
+        for rec in self.iter_holdings(pending, periods=periods, retry=retry, throttle_sec=throttle_sec, done=done):
+            if buffer and buffer[-1]["code"] != rec["code"]:
+                flush()
+            key = f"{rec['code']}@{rec['period']}"
+            if rec["ok"]:
+                buffer.append(rec)
+                success_cnt += 1
+            else:
+                self.record_failure(key, rec["reason"])
+        flush()
+
+        self._finish_output(out_path, codes, periods)
+        self.logger.info(f"🎯 回補完成：成功 {success_cnt} 組，失敗 {len(self.failed_codes)} 組；輸出：{out_path}")
+        return success_cnt > 0
+
+    def fetch_market_bulk(self, market, codes, period=None, fingerprints=None):
+        """
+        下載整個市場的董監事持股餘額明細，邊下載邊解析，只保留 codes 中的代號。
+        period 為 "YYYY-MM"，不符合的資料年月會被略過。回傳 {代號: DataFrame}。
+        有傳入 fingerprints（dict）時，同一趟下載順便算出各代號的申報指紋寫入其中：
+        該公司所有明細列的雜湊，不含資料年月等日期欄；指紋改變代表公司新申報了不同的持股或更正了申報。
+        """
+        url = self.BULK_SOURCES.get(market)
+        if not url:
+            self.logger.warning(f"⚠️ 未知的市場別: {market}")
+            return {}
+
+        wanted = set(codes)
+        rows = {}
+        lines = {}  # 代號 -> 去掉日期欄的明細列，用來算指紋
+        try:
+            self.logger.info(f"📦 下載{market}整體資料: {url}")
+            header = None
+            for rec in self._stream_bulk_csv(url):
+                if header is None:
+                    header = [h.strip() for h in rec]
+                    code_idx = self._find_col(header, ["公司代號"])
+                    comp_idx = self._find_col(header, ["公司名稱"])
+                    name_idx = self._find_col(header, ["姓名"])
+                    hold_idx = self._find_col(header, ["目前持股"])
+                    period_idx = self._find_col(header, ["資料年月"])
+                    if code_idx is None or name_idx is None or hold_idx is None:
+                        self.logger.error(f"❌ {market}整體資料缺少必要欄位: {header}")
+                        return {}
+                    extra_cols = {field: i for field, i in self._schema_columns(header).items()
+                                  if field not in self.DEFAULT_FIELDS and i not in (name_idx, hold_idx)}
+                    # 每月重新申報但持股不變時，只有日期欄不同，不算異動
+                    keep = [i for i, h in enumerate(header) if "年月" not in h and "日期" not in h]
+                    continue
+                if len(rec) <= max(code_idx, name_idx, hold_idx):
+                    continue
+                code = rec[code_idx].strip()
+                if code not in wanted:
+                    continue
+                if fingerprints is not None:
+                    lines.setdefault(code, []).append("\x1f".join(rec[i].strip() for i in keep if i < len(rec)))
+                if period and period_idx is not None and self._roc_to_period(rec[period_idx]) != period:
+                    continue
+                name = rec[name_idx].strip()
+                if not name:
+                    continue
+                company = rec[comp_idx].strip() if comp_idx is not None else self.company_name(code)
+                rows.setdefault(code, []).append({
+                    "股票代號": code,
+                    "公司名稱": company or self.company_name(code),
+                    "姓名": name,
+                    "目前持股": rec[hold_idx].strip(),
+                    **{field: rec[i].strip() for field, i in extra_cols.items() if i < len(rec)},
+                })
+        except Exception as e:
+            self.logger.warning(f"⚠️ 下載{market}整體資料失敗: {e}")
+            return {}
+
+        result = {code: self._coerce_schema(pd.DataFrame(recs).drop_duplicates(subset=["姓名"]))
+                  for code, recs in rows.items()}
+        if fingerprints is not None:
+            fingerprints.update({code: hashlib.sha1("\x1e".join(sorted(recs)).encode("utf-8")).hexdigest()
+                                 for code, recs in lines.items()})
+        self.logger.info(f"✅ {market}整體資料命中 {len(result)} 檔")
+        return result
+
+    def _stream_bulk_csv(self, url):
+        """串流下載整體資料 CSV，逐列產出（第一列為表頭）"""
+        with requests.get(url, stream=True, timeout=60, verify=False) as r:
+            r.raise_for_status()
+            lines = (self._decode_line(ln) for ln in r.iter_lines() if ln)
+            yield from csv.reader(lines)
+
+    @staticmethod
+    def _decode_line(raw):
+        """逐行解碼，UTF-8 失敗時退回 Big5(cp950)"""
+        try:
+            return raw.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            return raw.decode("cp950", errors="replace")
+
+    @staticmethod
+    def _find_col(header, keywords):
+        """回傳第一個包含關鍵字的欄位索引"""
+        return next((i for i, h in enumerate(header) if any(k in h for k in keywords)), None)
+
+    @staticmethod
+    def _roc_to_period(value):
+        """民國年月（例如 11309）轉為 YYYY-MM"""
+        digits = re.sub(r"[^\d]", "", str(value))
+        if len(digits) < 4:
+            return None
+        return f"{int(digits[:-2]) + 1911:04d}-{digits[-2:]}"
+
+    def run_bulk(self, codes_file="股票代號.txt", out_path=None, markets=None, period=None,
+                 throttle_sec=1.5, retry=1, validate=True, refresh_index=False):
+        """整體市場模式：先以整體資料過濾出代號，未命中的再逐檔查詢"""
+        self.logger.info("="*80)
+        self.logger.info("🚀 整體市場模式開始")
+        self.logger.info("="*80)
+
+        codes = self.read_stock_codes(codes_file)
+        if not codes:
+            self.logger.error("❌ 沒有可用的代號")
+            return False
+
+        if validate:
+            self.load_company_index(refresh=refresh_index)
+            codes, unknown = self.validate_codes(codes)
+            for code in unknown:
+                self.record_failure(code, "代號不在上市櫃公司清單")
+
+        done = self.load_processed_codes()
+        pending = [c for c in codes if c not in done]
+
+        if out_path is None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"董監事持股_合併_{ts}.xlsx"
+
+        if markets is None:
+            # 依公司清單只下載需要的市場；沒有清單時全部下載
+            markets = sorted({self.company_index[c][1] for c in pending if c in self.company_index}) \
+                or list(self.BULK_SOURCES)
+
+        found = {}
+        for market in markets:
+            remaining = [c for c in pending if c not in found]
+            if not remaining:
+                break
+            found.update(self.fetch_market_bulk(market, remaining, period=period))
+
+        if found:
+            self.append_to_master_excel(out_path, pd.concat(found.values(), ignore_index=True))
+            for code in found:
+                self.append_processed_code(code)
+        remaining = [c for c in pending if c not in found]
+        self.logger.info(f"📦 整體資料命中 {len(found)} 檔，剩餘 {len(remaining)} 檔改逐檔查詢")
+
+        # 未命中的代號走原本的逐檔流程（沿用已驗證的清單，不再重新讀檔與驗證）
+        ok = self._crawl_pending(codes, remaining, out_path, throttle_sec=throttle_sec, retry=retry)
+        return ok or bool(found)
+
+    def run_incremental(self, codes_file="股票代號.txt", out_path=None, markets=None, throttle_sec=1.5, retry=1,
+                        validate=True, refresh_index=False, snapshot_path="filing_snapshot.json"):
+        """
+        增量模式：下載整體資料（每個市場一次），同一趟算出各公司的申報指紋並與上次快照比對。
+        指紋未變的代號沿用快照中的上次結果；有異動（或從未成功抓過）的代號直接取用整體資料中的明細，
+        只有整體資料裡沒有的代號才開瀏覽器逐檔查詢。
+        """
+        self.logger.info("="*80)
+        self.logger.info("🚀 增量模式開始")
+        self.logger.info("="*80)
+
+        codes = self.read_stock_codes(codes_file)
+        if not codes:
+            self.logger.error("❌ 沒有可用的代號")
+            return False
+
+        if validate:
+            self.load_company_index(refresh=refresh_index)
+            codes, unknown = self.validate_codes(codes)
+            for code in unknown:
+                self.record_failure(code, "代號不在上市櫃公司清單")
+
+        if out_path is None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"董監事持股_合併_{ts}.xlsx"
+
+        if markets is None:
+            markets = sorted({self.company_index[c][1] for c in codes if c in self.company_index}) \
+                or list(self.BULK_SOURCES)
+        fingerprints, bulk = {}, {}
+        for market in markets:
+            bulk.update(self.fetch_market_bulk(market, [c for c in codes if c not in fingerprints],
+                                               fingerprints=fingerprints))
+        if not fingerprints:
+            self.logger.warning("⚠️ 取不到整體資料，所有代號改為重新查詢")
+
+        snapshot = FilingSnapshot(snapshot_path)
+        changed, unchanged = snapshot.split(codes, fingerprints)
+        from_bulk = [c for c in changed if c in bulk]
+        pending = [c for c in changed if c not in bulk]
+        self.logger.info(f"🔁 申報有異動或沒有快照 {len(changed)} 檔（整體資料取得 {len(from_bulk)} 檔、"
+                         f"逐檔查詢 {len(pending)} 檔），沿用上次結果 {len(unchanged)} 檔")
+
+        carried = snapshot.frame(unchanged)
+        if carried is not None:
+            self.append_to_master_excel(out_path, self._coerce_schema(carried))
+
+        pending = self._schedule(pending, throttle_sec=throttle_sec)
+        success_cnt = 0
+        try:
+            if from_bulk:
+                self.append_to_master_excel(out_path, pd.concat([bulk[c] for c in from_bulk], ignore_index=True))
+                for code in from_bulk:
+                    snapshot.put(code, fingerprints[code], bulk[code])
+                success_cnt += len(from_bulk)
+            for rec in self.iter_holdings(pending, retry=retry, throttle_sec=throttle_sec):
+                self._record_history(rec["code"], rec.get("seconds"), rec["ok"], rec["reason"])
+                if rec["ok"]:
+                    self.append_to_master_excel(out_path, rec["data"])
+                    snapshot.put(rec["code"], fingerprints.get(rec["code"]), rec["data"])
+                    success_cnt += 1
+                else:
+                    # 快照保留舊指紋，下次仍會重新查詢
+                    self.record_failure(rec["code"], rec["reason"])
+        finally:
+            snapshot.save()
+
+        self._finish_output(out_path, codes)
+        self.history.save()
+
+        self.logger.info(f"🎯 完成：更新成功 {success_cnt} 檔、沿用 {len(unchanged)} 檔，"
+                         f"失敗 {len(self.failed_codes)} 檔；輸出：{out_path}")
         if self.driver:
             self.driver.quit()
+        return success_cnt + len(unchanged) > 0
+
+    def _capture_raw_payload(self, stock_code):
+        """
+        管線的瀏覽器階段：只負責導航、查詢並收集原始內容，不做解析。
+        回傳 {"code", "crawl_id", "payloads": [(種類, 內容), …], "session", "deadline"}，失敗回傳 None。
+        """
+        self._begin_crawl(stock_code)
+        self.last_failure_reason = None
+        self.ensure_single_tab()
+        if not self.check_driver_alive():
+            return None
+        if not self._open_query_form(stock_code):
+            return None
+        submitted, data = self._query_stage(stock_code)
+        if not submitted:
+            return None
+        if data is None and self._no_result(stock_code):
+            return None
+
+        payloads, session = [], None
+        if data is not None:
+            payloads.append(("frame", data))
+        else:
+            href = self._find_csv_href()
+            if href:
+                payloads.append(("csv_url", href))
+                session = self._requests_session_from_driver()
+            # 同時保留結果頁，CSV 失敗時解析階段可直接改用 HTML，不必重新查詢
+            html = self.driver.page_source
+            self._archive("html", html)
+            payloads.append(("html", html))
+        return {"code": stock_code, "crawl_id": self._crawl_id, "payloads": payloads, "session": session,
+                "deadline": self._deadline}
+
+    def _parse_payloads(self, item):
+        """管線的解析階段：依序嘗試各原始內容，第一個解析成功者為準"""
+        code = item["code"]
+        for kind, value in item["payloads"]:
+            try:
+                if kind == "frame":
+                    data = value
+                elif kind == "csv_url":
+                    data = self._fetch_and_parse_csv(value, item["session"], code, None, item["crawl_id"],
+                                                     item.get("deadline"))
+                else:
+                    data = self._parse_html_payload(value)
+            except Exception as e:
+                self.logger.warning(f"⚠️ {code} 解析 {kind} 失敗: {e}")
+                continue
+            if data is not None and len(data) > 0:
+                return self._tag_result(data, code)
+        return None
+
+    def run_pipeline(self, codes_file="股票代號.txt", out_path=None, parse_workers=2, queue_size=8,
+                     throttle_sec=1.5, retry=1, validate=True, refresh_index=False):
+        """
+        管線模式（可續跑）：瀏覽器階段只產出原始內容就換下一檔，
+        解析交給 parse_workers 個工作執行緒，寫檔由專用寫入執行緒負責，階段之間以有界佇列銜接。
+        結束時回報各階段忙碌比例。
+        """
+        import queue
+        from collections import deque
+
+        self.logger.info("="*80)
+        self.logger.info(f"🚀 管線模式開始（解析工作者 {parse_workers}，佇列上限 {queue_size}）")
+        self.logger.info("="*80)
+
+        codes = self.read_stock_codes(codes_file)
+        if not codes:
+            self.logger.error("❌ 沒有可用的代號")
+            return False
+
+        if validate:
+            self.load_company_index(refresh=refresh_index)
+            codes, unknown = self.validate_codes(codes)
+            for code in unknown:
+                self.record_failure(code, "代號不在上市櫃公司清單")
+
+        done = self.load_processed_codes()
+        pending = [c for c in codes if c not in done]
+        self.logger.info(f"✅ 已完成 {len(done)} 檔，待處理 {len(pending)} 檔")
+
+        if out_path is None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"董監事持股_合併_{ts}.xlsx"
+
+        raw_q = queue.Queue(maxsize=queue_size)
+        out_q = queue.Queue(maxsize=queue_size)
+        retry_q = queue.Queue()
+        stats = _StageStats()
+        attempts = {}
+        browser_sec = {}  # 代號 -> 最近一次瀏覽器階段耗時，記入歷史
+        inflight = [0]
+        inflight_lock = threading.Lock()
+        success_cnt = [0]
+        terminal_reasons = {self.RESULT_REASONS[s] for s in self.TERMINAL_RESULT_STATES}
+
+        def parse_worker():
+            while True:
+                item = raw_q.get()
+                if item is None:
+                    break
+                with stats.track("parse", parse_workers):
+                    data = self._parse_payloads(item)
+                out_q.put((item["code"], data, None))
+
+        def writer():
+            while True:
+                item = out_q.get()
+                if item is None:
+                    break
+                code, data, reason = item
+                self._record_history(code, browser_sec.get(code), data is not None, reason)
+                with stats.track("write"):
+                    if data is not None:
+                        self.append_to_master_excel(out_path, data)
+                        self.append_processed_code(code)
+                        success_cnt[0] += 1
+                    elif attempts[code] <= retry and reason not in terminal_reasons:
+                        retry_q.put(code)
+                    else:
+                        self.record_failure(code, reason or "查詢或解析失敗")
+                with inflight_lock:
+                    inflight[0] -= 1
+
+        threads = [threading.Thread(target=parse_worker, daemon=True) for _ in range(parse_workers)]
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        for t in threads + [writer_thread]:
+            t.start()
+
+        start = time.perf_counter()
+        work = deque(self._schedule(pending, throttle_sec=throttle_sec))
+        restarted_at = 0
+        try:
+            if pending and not self.init_driver():
+                for code in pending:
+                    self.record_failure(code, "瀏覽器無法啟動")
+                work.clear()
+
+            while True:
+                while not retry_q.empty():
+                    work.append(retry_q.get())
+                if not work:
+                    with inflight_lock:
+                        idle = inflight[0] == 0
+                    if idle and retry_q.empty():
+                        break
+                    # 還有代號在解析/寫入中，等它們決定是否需要重試
+                    try:
+                        work.append(retry_q.get(timeout=0.5))
+                    except queue.Empty:
+                        continue
+
+                code = work.popleft()
+                attempts[code] = attempts.get(code, 0) + 1
+                if self.processed_count - restarted_at >= 200:
+                    restarted_at = self.processed_count
+                    self.logger.info(f"♻️ 已處理 {self.processed_count} 個股票，自動重啟瀏覽器")
+                    self.restart_driver()
+                if not self.check_driver_alive() and not self.restart_driver():
+                    self.logger.error("⚠️ Chrome 重啟失敗，終止管線")
+                    self.record_failure(code, "瀏覽器無法啟動")
+                    for rest in work:
+                        self.record_failure(rest, "瀏覽器無法啟動")
+                    work.clear()
+                    continue
+
+                self.logger.info(f"▶︎ {code}（第 {attempts[code]} 次）")
+                browser_start = time.perf_counter()
+                with stats.track("browser"):
+                    self._trace_begin(code)
+                    self._start_deadline()
+                    try:
+                        item = self._capture_raw_payload(code)
+                    except DeadlineExceeded as e:
+                        self.logger.warning(f"⏰ 股票 {code} {e}，放棄此檔")
+                        self.last_failure_reason = self.DEADLINE_REASON
+                        item = None
+                    except Exception as e:
+                        self.logger.error(f"❌ 處理股票 {code} 時發生異常: {e}")
+                        item = None
+                    finally:
+                        self._deadline = None
+                    self._trace_end()
+                browser_sec[code] = time.perf_counter() - browser_start
+                self.processed_count += 1
+
+                with inflight_lock:
+                    inflight[0] += 1
+                if item is None:
+                    out_q.put((code, None, self.last_failure_reason))
+                else:
+                    wait_start = time.perf_counter()
+                    raw_q.put(item)  # 佇列滿時在此等待，避免原始內容無限堆積
+                    stats.add("browser_blocked", time.perf_counter() - wait_start)
+                time.sleep(throttle_sec)
+        finally:
+            for _ in threads:
+                raw_q.put(None)
+            for t in threads:
+                t.join()
+            out_q.put(None)
+            writer_thread.join()
+            if self.driver:
+                self.driver.quit()
+                self.driver = None
+
+        wall = time.perf_counter() - start
+        self._finish_output(out_path, codes)
+        self.history.save()
+        self.logger.info(f"📊 各階段忙碌比例（總時間 {wall:.1f}s）:")
+        for stage, ratio in sorted(stats.occupancy(wall).items(), key=lambda kv: -kv[1]):
+            self.logger.info(f"   {stage:16s} {ratio*100:5.1f}%")
+        self.logger.info(f"🎯 完成：成功 {success_cnt[0]} 檔，失敗 {len(self.failed_codes)} 檔；輸出：{out_path}")
+        return success_cnt[0] > 0
+
+    def reparse(self, out_path=None, codes=None, workers=None):
+        """不開瀏覽器、不連網：以多程序從封存的原始回應重新解析並輸出 Excel"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self.archive is None:
+            self.logger.error("❌ 未指定封存目錄")
+            return False
+        groups = self.archive.latest_groups(codes)
+        if not groups:
+            self.logger.error(f"❌ 封存中沒有可重新解析的資料: {self.archive.root}")
+            return False
+
+        if os.path.exists("company_index.csv"):
+            self.company_index = self._read_company_index("company_index.csv")
+        has_period = any(period for _, period, _ in groups)
+        self.output_columns = self._columns(self.PERIOD_COLUMNS if has_period else self.OUTPUT_COLUMNS)
+        if out_path is None:
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_path = f"董監事持股_重新解析_{ts}.xlsx"
+
+        workers = workers or os.cpu_count() or 1
+        self.logger.info(f"🔁 重新解析 {len(groups)} 組 (代號, 期別)，使用 {workers} 個程序")
+        writer = StreamingExcelWriter(out_path, self.output_columns, self.COLUMN_WIDTHS, logger=self.logger)
+        success_cnt = 0
+        tasks = [(self.archive.root, code, period, entries) for code, period, entries in groups]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_reparse_worker) as pool:
+            for code, period, records in pool.map(_reparse_group, tasks, chunksize=16):
+                key = f"{code}@{period}" if period else code
+                if not records:
+                    self.record_failure(key, "封存內容無法解析")
+                    continue
+                df = self._tag_result(pd.DataFrame(records), code)
+                if period:
+                    df.insert(2, "期別", period)
+                writer.append(df)
+                if self.store is not None:
+                    self.store.upsert(df)
+                success_cnt += 1
+
+        if self.failed_codes:
+            writer.write_sheet("失敗記錄", self._failures_df())
+        writer.close()
+        self.logger.info(f"🎯 重新解析完成：成功 {success_cnt} 組，失敗 {len(self.failed_codes)} 組；輸出：{out_path}")
         return success_cnt > 0
 
     def run_fixed_test(self, stock_codes=['1235']):
@@ -1311,14 +4208,11 @@ class FixedInputCrawler:
             self.logger.info("🔧 修复输入框定位的爬虫测试")
             self.logger.info("=" * 80)
 
-            if not self.init_driver():
-                return False
-
-            for stock_code in stock_codes:
-                success = self.process_single_stock(stock_code)
-                if not success:
-                    self.failed_codes.append(stock_code)
-                time.sleep(3)
+            for rec in self.iter_holdings(stock_codes, retry=0, throttle_sec=3):
+                if rec["ok"]:
+                    self.all_data[rec["code"]] = rec["data"]
+                else:
+                    self.record_failure(rec["code"], rec["reason"])
 
             if self.all_data:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1335,9 +4229,670 @@ class FixedInputCrawler:
             self.logger.error(f"❌ 测试运行异常: {e}")
             return False
         finally:
+            self._log_stage_retries()
             if self.driver:
                 self.driver.quit()
 
+
+def _run_workers(leases, codes, retry, throttle_sec, logger, label):
+    """
+    BrowserPool.run 與 TabGroup.run 共用的工作者迴圈：每組 (借出, 歸還) 一條執行緒，
+    借到爬蟲實例後從同一個待辦佇列取代號查詢，結果依完成順序產出（格式同 iter_holdings）。
+    每檔之間以 _pause 等待 throttle_sec（多分頁模式下等待期間讓出瀏覽器）。
+    """
+    import queue
+
+    todo = queue.Queue()
+    for code in codes:
+        todo.put(code)
+    results = queue.Queue()
+
+    def worker(acquire, release):
+        crawler = acquire()
+        try:
+            while True:
+                try:
+                    code = todo.get_nowait()
+                except queue.Empty:
+                    break
+                for rec in crawler.iter_holdings([code], retry=retry, throttle_sec=0):
+                    results.put(rec)
+                crawler._pause(throttle_sec)
+        except Exception as e:
+            logger.error(f"❌ {label}執行緒異常: {e}")
+        finally:
+            release(crawler)
+            results.put(None)
+
+    threads = [threading.Thread(target=worker, args=lease, daemon=True) for lease in leases]
+    for t in threads:
+        t.start()
+    finished = 0
+    while finished < len(threads):
+        rec = results.get()
+        if rec is None:
+            finished += 1
+        else:
+            yield rec
+    # 執行緒異常結束時，未處理的代號回報為失敗
+    while not todo.empty():
+        yield {"code": todo.get(), "period": None, "ok": False, "data": None, "reason": f"{label}異常中止"}
+
+
+class BrowserPool:
+    """一組各自持有暖機瀏覽器的爬蟲實例，以借出/歸還方式使用；每個實例有獨立下載目錄"""
+
+    def __init__(self, size=1, **crawler_kwargs):
+        import queue
+
+        profile_root = crawler_kwargs.pop("profile_dir", None)
+        self.crawlers = []
+        for i in range(size):
+            download_dir = os.path.join(os.getcwd(), "downloads", f"worker_{i+1}")
+            profile_dir = os.path.join(profile_root, f"worker_{i+1}") if profile_root else None
+            self.crawlers.append(FixedInputCrawler(download_dir=download_dir, profile_dir=profile_dir,
+                                                   **crawler_kwargs))
+        self.logger = self.crawlers[0].logger
+        self._idle = queue.Queue()
+        self.started = 0
+
+    def start(self, company_index=None, warm=True):
+        """啟動所有瀏覽器並預先載入查詢頁，回傳成功啟動的數量"""
+        started = 0
+        for i, crawler in enumerate(self.crawlers, 1):
+            crawler.company_index = company_index or {}
+            if not crawler.init_driver():
+                self.logger.error(f"❌ 瀏覽器 {i} 啟動失敗")
+                continue
+            if warm:
+                crawler.navigate_to_target_page()
+            self._idle.put(crawler)
+            started += 1
+        self.started = started
+        self.logger.info(f"🔥 瀏覽器池已就緒: {started}/{len(self.crawlers)}")
+        return started
+
+    def acquire(self, timeout=None):
+        """借出一個閒置的爬蟲實例（逾時拋出 queue.Empty）"""
+        return self._idle.get(timeout=timeout)
+
+    def release(self, crawler):
+        self._idle.put(crawler)
+
+    def run(self, codes, retry=1, throttle_sec=1.5):
+        """
+        每個已啟動的瀏覽器一條執行緒，從同一個待辦佇列取代號查詢，結果依完成順序產出（格式同 iter_holdings）。
+        與 TabGroup.run 共用工作者迴圈；執行期間瀏覽器都被借出。
+        """
+        leases = [(self.acquire, self.release)] * self.started
+        return _run_workers(leases, codes, retry, throttle_sec, self.logger, "工作者")
+
+    def close(self):
+        for crawler in self.crawlers:
+            if crawler.driver:
+                try:
+                    crawler.driver.quit()
+                except Exception:
+                    pass
+                crawler.driver = None
+
+
+class _TabSlot:
+    """多分頁模式中的一個分頁：記住 window handle，借用共用瀏覽器前先切換到此分頁"""
+
+    def __init__(self, group, crawler, handle):
+        self.group = group
+        self.crawler = crawler
+        self.handle = handle
+
+    def acquire(self):
+        self.group.lock.acquire()
+        if self.group.active != self.handle:
+            self.group.driver.switch_to.window(self.handle)
+            self.group.active = self.handle
+        if self.group.holder is not self.crawler:
+            self.group.holder = self.crawler
+            self.crawler._apply_driver_timeouts(force=True)
+
+    def release(self):
+        self.group.lock.release()
+
+    def reopen(self):
+        """關閉此分頁並開一個新的取代（呼叫時須持有瀏覽器）"""
+        driver = self.group.driver
+        try:
+            try:
+                driver.close()
+            except WebDriverException:
+                pass
+            driver.switch_to.new_window("tab")
+            self.handle = self.group.active = driver.current_window_handle
+            self.group.setup_tab(self.crawler)
+            self.crawler.logger.info("♻️ 分頁已重開")
+            return True
+        except Exception as e:
+            self.crawler.logger.error(f"♻️ 重開分頁失敗: {e}")
+            return False
+
+
+class TabGroup:
+    """
+    單一 Chrome 內開 tabs 個分頁，每個分頁由自己的爬蟲實例與執行緒負責一檔代號。
+
+    WebDriver 同一時間只能操作一個分頁，因此分頁之間以一把鎖輪流使用瀏覽器：
+    持有鎖的分頁下指令，等待頁面（_pause / _poll）時讓出，其他分頁趁空檔送出查詢。
+    每個分頁以 CDP 設定自己的下載目錄（downloads/tab_N）。
+    """
+
+    def __init__(self, tabs=3, **crawler_kwargs):
+        if crawler_kwargs.pop("capture_xhr", False):
+            # performance log 由所有分頁共用，無法分辨回應屬於哪個分頁
+            logging.getLogger(__name__).warning("⚠️ 多分頁模式不支援 --xhr，已停用")
+        profile_dir = crawler_kwargs.pop("profile_dir", None)  # 只有第一個分頁負責啟動 Chrome
+        self.crawlers = []
+        for i in range(tabs):
+            download_dir = os.path.join(os.getcwd(), "downloads", f"tab_{i+1}")
+            self.crawlers.append(FixedInputCrawler(download_dir=download_dir,
+                                                   profile_dir=profile_dir if i == 0 else None, **crawler_kwargs))
+        self.logger = self.crawlers[0].logger
+        self.driver = None
+        self.lock = threading.Lock()
+        self.active = None
+        self.holder = None  # 最後持有瀏覽器的爬蟲實例（其逾時設定仍在生效）
+
+    def setup_tab(self, crawler):
+        """新分頁的初始設定：下載目錄、資源阻擋（CDP 設定只作用在目前分頁）"""
+        crawler._cdp("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": crawler.download_dir})
+        if crawler.block_resources:
+            crawler.apply_resource_blocking()
+
+    def start(self, company_index=None):
+        """啟動瀏覽器並開好分頁，回傳可用的分頁數"""
+        first = self.crawlers[0]
+        if not first.init_driver():
+            return 0
+        self.driver = first.driver
+        for i, crawler in enumerate(self.crawlers):
+            try:
+                if i > 0:
+                    self.driver.switch_to.new_window("tab")
+                crawler.driver = self.driver
+                crawler.company_index = company_index or {}
+                crawler._tab = _TabSlot(self, crawler, self.driver.current_window_handle)
+                self.active = crawler._tab.handle
+                self.setup_tab(crawler)
+            except Exception as e:
+                self.logger.error(f"❌ 開啟分頁 {i+1} 失敗: {e}")
+                crawler.driver = None
+                crawler._tab = None
+        self.crawlers = [c for c in self.crawlers if c._tab is not None]
+        self.logger.info(f"🗂️ 單一瀏覽器內已開啟 {len(self.crawlers)} 個分頁")
+        return len(self.crawlers)
+
+    def run(self, codes, retry=1, throttle_sec=1.5):
+        """
+        各分頁執行緒從同一個待辦佇列取代號查詢，結果依完成順序產出（格式同 iter_holdings）。
+        寫檔等工作由呼叫端在主執行緒處理，不佔用瀏覽器。
+        """
+        def lease(crawler):
+            crawler._tab.acquire()
+            return crawler
+
+        leases = [(lambda c=c: lease(c), lambda c: c._tab.release()) for c in self.crawlers]
+        return _run_workers(leases, codes, retry, throttle_sec, self.logger, "分頁")
+
+    def close(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+        for crawler in self.crawlers:
+            crawler.driver = None
+        self.driver = None
+
+
+DAEMON_PORT = 8765   # 常駐模式接收臨時代號清單
+SERVICE_PORT = 8766  # HTTP/JSON 查詢服務；與常駐模式錯開，兩者可同時執行
+
+
+class CrawlerDaemon:
+    """
+    常駐模式：保持暖機的瀏覽器池，依每月申報期限排程重抓，並從本機 socket 接收臨時代號清單。
+
+    - 每月 deadline_day（董監事持股於每月 15 日前申報）後一天的 run_hour 點重抓整份代號清單。
+    - 之後的 late_days 天（例如 +3、+7 天）只重抓上一輪失敗或查無資料的代號，補上晚申報的公司。
+    - 臨時清單：連到 127.0.0.1:port 送出代號（以空白、逗號或換行分隔），收到後排入佇列。
+    所有結果寫入同一份合併 Excel。
+    """
+
+    def __init__(self, codes_file="股票代號.txt", out_path="董監事持股_合併_常駐.xlsx", browsers=1,
+                 port=DAEMON_PORT, deadline_day=15, run_hour=6, late_days=(3, 7), retry=1, throttle_sec=1.5,
+                 **crawler_kwargs):
+        import queue
+
+        self.codes_file = codes_file
+        self.out_path = out_path
+        self.port = port
+        self.deadline_day = deadline_day
+        self.run_hour = run_hour
+        self.late_days = tuple(late_days)
+        self.retry = retry
+        self.throttle_sec = throttle_sec
+        self.pool = BrowserPool(browsers, **crawler_kwargs)
+        self.logger = self.pool.logger
+        self.code_q = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.late_codes = set()  # 本輪失敗、待晚申報補抓的代號
+        self._server = None
+
+    # ---- 排程 ----
+    def next_run(self, now=None):
+        """下一次排程時間與種類（"full" 整份重抓 / "late" 只補抓失敗代號）"""
+        now = now or datetime.now()
+        candidates = []
+        for month_offset in (0, 1):
+            year, month = now.year, now.month + month_offset
+            if month > 12:
+                year, month = year + 1, month - 12
+            full = datetime(year, month, self.deadline_day, self.run_hour) + timedelta(days=1)
+            candidates.append((full, "full"))
+            for d in self.late_days:
+                candidates.append((full + timedelta(days=d), "late"))
+        return min((c for c in candidates if c[0] > now), key=lambda c: c[0])
+
+    def _scheduler(self):
+        while not self._stop.is_set():
+            when, kind = self.next_run()
+            self.logger.info(f"🗓️ 下次排程: {when:%Y-%m-%d %H:%M}（{'整份重抓' if kind == 'full' else '補抓晚申報'}）")
+            while not self._stop.is_set() and datetime.now() < when:
+                self._stop.wait(min(60, max(1, (when - datetime.now()).total_seconds())))
+            if self._stop.is_set():
+                break
+            if kind == "full":
+                self.enqueue_codes_file()
+            else:
+                with self._write_lock:  # 工作者執行緒在同一把鎖下增刪 late_codes
+                    late, self.late_codes = self.late_codes, set()
+                late = sorted(late)
+                self.logger.info(f"🕒 補抓晚申報代號 {len(late)} 檔")
+                self.enqueue(late)
+
+    def enqueue_codes_file(self):
+        crawler = self.pool.crawlers[0]
+        codes = crawler.read_stock_codes(self.codes_file)
+        if crawler.company_index:
+            codes, _ = crawler.validate_codes(codes)
+        self.enqueue(codes)
+
+    def enqueue(self, codes):
+        """排入代號（已在佇列中的不重複排入），回傳實際排入數"""
+        added = 0
+        with self._queued_lock:
+            for code in codes:
+                if code not in self._queued:
+                    self._queued.add(code)
+                    self.code_q.put(code)
+                    added += 1
+        self.logger.info(f"📥 排入 {added} 檔（佇列中共 {self.code_q.qsize()} 檔）")
+        return added
+
+    # ---- 工作者 ----
+    def _worker(self):
+        import queue
+
+        crawler = self.pool.acquire()
+        since_restart = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    code = self.code_q.get(timeout=1)
+                except queue.Empty:
+                    continue
+                with self._queued_lock:
+                    self._queued.discard(code)
+
+                if since_restart >= 200:
+                    crawler.restart_driver()
+                    since_restart = 0
+                rec = next(crawler.iter_holdings([code], retry=self.retry, throttle_sec=0))
+                since_restart += 1
+                with self._write_lock:
+                    if rec["ok"]:
+                        crawler.append_to_master_excel(self.out_path, rec["data"])
+                        self.late_codes.discard(code)
+                    else:
+                        self.late_codes.add(code)
+                        self.logger.warning(f"⚠️ {code} 失敗（{rec['reason']}），列入晚申報補抓")
+                time.sleep(self.throttle_sec)
+        finally:
+            self.pool.release(crawler)
+
+    # ---- socket ----
+    def _serve_socket(self):
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                data = self.rfile.read(1024 * 1024).decode("utf-8", errors="replace")
+                codes = [c for c in re.split(r"[\s,]+", data) if c.isdigit()]
+                added = daemon.enqueue(codes)
+                self.wfile.write(f"queued {added}\n".encode("utf-8"))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", self.port), Handler)
+        self.logger.info(f"🔌 接收臨時代號清單: 127.0.0.1:{self.port}")
+        self._server.serve_forever()
+
+    def run(self, run_now=False):
+        """啟動常駐服務，直到 Ctrl+C"""
+        crawler = self.pool.crawlers[0]
+        crawler.load_company_index()
+        if not self.pool.start(company_index=crawler.company_index):
+            return False
+
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in self.pool.crawlers]
+        threads.append(threading.Thread(target=self._scheduler, daemon=True))
+        threads.append(threading.Thread(target=self._serve_socket, daemon=True))
+        for t in threads:
+            t.start()
+        if run_now:
+            self.enqueue_codes_file()
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.logger.info("🛑 收到中斷，停止常駐服務")
+        finally:
+            self._stop.set()
+            if self._server:
+                self._server.shutdown()
+            self.pool.close()
+        return True
+
+
+class HoldingsService:
+    """
+    本機 HTTP/JSON 查詢服務：GET /holdings/<代號> 回傳該公司目前的董監事持股。
+
+    - 先查記憶體 LRU，再查磁碟快取（cache_dir/<代號>.json，ttl_hours 內有效）。
+    - 同一代號同時有多個請求時只會啟動一次抓取，其餘請求共用結果。
+    - 未命中的查詢交給瀏覽器池，排隊中加執行中超過 max_pending 時直接回 503，避免回應時間失控。
+    - 查無資料、查無此公司代號這類重試也不會有結果的失敗，在記憶體中快取 negative_ttl_minutes 分鐘（回 404），
+      避免同一個無效代號每次請求都開瀏覽器；網站錯誤、逾時等暫時性失敗不快取。
+    - 有指定 store_path 時，抓到的結果同時 upsert 到 SQLite 資料庫。
+    """
+    NEGATIVE_REASONS = {FixedInputCrawler.RESULT_REASONS[s] for s in FixedInputCrawler.TERMINAL_RESULT_STATES}
+    RESTART_EVERY = 200  # 每個瀏覽器查詢這麼多檔後重啟一次（同 CrawlerDaemon）
+
+    def __init__(self, browsers=1, port=SERVICE_PORT, cache_dir=os.path.join("cache", "holdings"), ttl_hours=24,
+                 lru_size=512, max_pending=32, wait_timeout=180, retry=1, negative_ttl_minutes=10,
+                 **crawler_kwargs):
+        from collections import OrderedDict
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.port = port
+        self.cache_dir = cache_dir
+        self.ttl = ttl_hours * 3600
+        self.lru_size = lru_size
+        self.negative_ttl = negative_ttl_minutes * 60
+        self.max_pending = max_pending
+        self.wait_timeout = wait_timeout
+        self.retry = retry
+        self.pool = BrowserPool(browsers, **crawler_kwargs)
+        self.logger = self.pool.logger
+        self.executor = ThreadPoolExecutor(max_workers=browsers)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lru = OrderedDict()
+        self._negative = OrderedDict()  # 代號 -> (失敗原因, 到期時間)
+        self._inflight = {}
+        # 可重入：抓取在 add_done_callback 之前就完成時，_done 會在持有鎖的同一執行緒內立即執行
+        self._lock = threading.RLock()
+        self.stats = {"memory": 0, "disk": 0, "negative": 0, "crawl": 0, "coalesced": 0, "rejected": 0}
+        self._since_restart = {}  # 爬蟲實例 -> 上次重啟後查詢的檔數（同一時間只有借到它的執行緒會更新）
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    # ---- 快取 ----
+    def _fresh(self, entry):
+        return time.time() - entry["fetched_ts"] < self.ttl
+
+    def _lru_get(self, code):
+        with self._lock:
+            entry = self._lru.get(code)
+            if entry and self._fresh(entry):
+                self._lru.move_to_end(code)
+                return entry
+            return None
+
+    def _lru_put(self, code, entry):
+        with self._lock:
+            self._lru[code] = entry
+            self._lru.move_to_end(code)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _negative_get(self, code):
+        with self._lock:
+            hit = self._negative.get(code)
+            if hit and hit[1] > time.time():
+                return hit[0]
+            self._negative.pop(code, None)
+            return None
+
+    def _negative_put(self, code, reason):
+        if self.negative_ttl <= 0:
+            return
+        with self._lock:
+            self._negative[code] = (reason, time.time() + self.negative_ttl)
+            self._negative.move_to_end(code)
+            while len(self._negative) > self.lru_size:
+                self._negative.popitem(last=False)
+
+    def _disk_path(self, code):
+        return os.path.join(self.cache_dir, f"{code}.json")
+
+    def _disk_get(self, code):
+        try:
+            with open(self._disk_path(code), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry if self._fresh(entry) else None
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, code, entry):
+        tmp = self._disk_path(code) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, self._disk_path(code))
+
+    # ---- 查詢 ----
+    def _crawl(self, code):
+        crawler = self.pool.acquire()
+        try:
+            if self._since_restart.get(crawler, 0) >= self.RESTART_EVERY:
+                crawler.restart_driver()
+                self._since_restart[crawler] = 0
+            rec = next(crawler.iter_holdings([code], retry=self.retry, throttle_sec=0))
+            self._since_restart[crawler] = self._since_restart.get(crawler, 0) + 1
+        finally:
+            self.pool.release(crawler)
+        if not rec["ok"]:
+            if rec["reason"] in self.NEGATIVE_REASONS:
+                self._negative_put(code, rec["reason"])
+            return {"code": code, "ok": False, "reason": rec["reason"]}
+        if crawler.store is not None:
+            crawler.store.upsert(rec["data"])
+        df = rec["data"].astype(object).where(rec["data"].notna(), None)
+        entry = {
+            "code": code,
+            "ok": True,
+            "company": crawler.company_name(code),
+            "fetched_at": datetime.now().isoformat(timespec="seconds"),
+            "fetched_ts": time.time(),
+            "rows": df.drop(columns=["股票代號", "公司名稱"], errors="ignore").to_dict("records"),
+        }
+        self._lru_put(code, entry)
+        self._disk_put(code, entry)
+        return entry
+
+    def get(self, code, refresh=False):
+        """回傳 (HTTP 狀態碼, 結果 dict)"""
+        if not refresh:
+            reason = self._negative_get(code)
+            if reason:
+                self._count("negative")
+                return 404, {"code": code, "error": reason, "source": "negative"}
+            entry = self._lru_get(code)
+            if entry:
+                self._count("memory")
+                return 200, dict(entry, source="memory")
+            entry = self._disk_get(code)
+            if entry:
+                self._lru_put(code, entry)
+                self._count("disk")
+                return 200, dict(entry, source="disk")
+
+        with self._lock:
+            future = self._inflight.get(code)
+            if future is not None:
+                self.stats["coalesced"] += 1
+            elif len(self._inflight) >= self.max_pending:
+                self.stats["rejected"] += 1
+                return 503, {"code": code, "error": "查詢佇列已滿，請稍後再試"}
+            else:
+                future = self.executor.submit(self._crawl, code)
+                self._inflight[code] = future
+                future.add_done_callback(lambda _f, c=code: self._done(c))
+                self.stats["crawl"] += 1
+
+        try:
+            entry = future.result(timeout=self.wait_timeout)
+        except Exception as e:
+            return 504, {"code": code, "error": f"查詢逾時或失敗: {e}"}
+        if not entry.get("ok"):
+            status = 404 if entry.get("reason") in self.NEGATIVE_REASONS else 502
+            return status, {"code": code, "error": entry.get("reason")}
+        return 200, dict(entry, source="crawl")
+
+    def _done(self, code):
+        with self._lock:
+            self._inflight.pop(code, None)
+
+    # ---- HTTP ----
+    def serve(self):
+        """啟動 HTTP 服務，直到 Ctrl+C"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qs
+
+        crawler = self.pool.crawlers[0]
+        crawler.load_company_index()
+        if not self.pool.start(company_index=crawler.company_index):
+            return False
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == "/health":
+                    with service._lock:
+                        health = dict(service.stats, inflight=len(service._inflight), cached=len(service._lru))
+                    return self._send(200, health)
+                parts = [p for p in url.path.split("/") if p]
+                if not parts or parts[0] != "holdings":
+                    return self._send(404, {"error": "用法: /holdings/<代號>"})
+                code = parts[1] if len(parts) > 1 else (query.get("code") or [""])[0]
+                code = re.sub(r"[^\d]", "", code)
+                if not code:
+                    return self._send(400, {"error": "缺少代號"})
+                if crawler.company_index and code not in crawler.company_index:
+                    return self._send(404, {"code": code, "error": "代號不在上市櫃公司清單"})
+                status, payload = service.get(code, refresh=query.get("refresh", ["0"])[0] == "1")
+                payload.pop("fetched_ts", None)
+                self._send(status, payload)
+
+            def log_message(self, fmt, *args):
+                service.logger.info("🌐 " + fmt % args)
+
+        server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.logger.info(f"🌐 查詢服務已啟動: http://127.0.0.1:{self.port}/holdings/<代號>")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.logger.info("🛑 收到中斷，停止查詢服務")
+        finally:
+            server.server_close()
+            self.executor.shutdown(wait=False)
+            self.pool.close()
+        return True
+
+
+def submit_codes(codes, port=DAEMON_PORT):
+    """把代號清單送給執行中的常駐服務，回傳服務回應"""
+    import socket
+
+    with socket.create_connection(("127.0.0.1", port), timeout=10) as sock:
+        sock.sendall("\n".join(codes).encode("utf-8"))
+        sock.shutdown(socket.SHUT_WR)
+        return sock.recv(1024).decode("utf-8").strip()
+
+
+_reparse_crawler = None
+
+
+def _init_reparse_worker():
+    """重新解析子程序初始化：建立只用來解析的爬蟲實例，日誌只保留警告以上"""
+    global _reparse_crawler
+    _reparse_crawler = FixedInputCrawler()
+    _reparse_crawler.logger.setLevel(logging.WARNING)
+
+
+def _reparse_group(task):
+    """解析一組 (代號, 期別) 的封存項目：依 json、csv、html 順序，第一個解析成功者為準"""
+    root, code, period, entries = task
+    archive = RawArchive(root)
+    order = {"json": 0, "csv": 1, "html": 2}
+    for entry in sorted(entries, key=lambda e: order.get(e["kind"], 9)):
+        try:
+            df = _reparse_crawler.parse_archived(entry["kind"], archive.get(entry["sha256"]))
+        except Exception:
+            continue
+        if df is not None and len(df) > 0:
+            return code, period, df.to_dict("records")
+    return code, period, None
+
+
+def iter_holdings(codes, **kwargs):
+    """
+    函式庫介面：逐檔產出董監事持股結果。
+
+        for rec in iter_holdings(["2330", "1101"]):
+            if rec["ok"]:
+                load(rec["data"])
+
+    kwargs 會傳給 FixedInputCrawler.iter_holdings（periods、retry、throttle_sec）。
+    """
+    crawler = FixedInputCrawler()
+    yield from crawler.iter_holdings(list(codes), **kwargs)
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -1345,18 +4900,235 @@ def main():
     parser.add_argument("--out", default=None, help="輸出 Excel 路徑；不填則自動依時間命名")
     parser.add_argument("--retry", type=int, default=1)
     parser.add_argument("--throttle", type=float, default=1.5)
+    parser.add_argument("--no-validate", action="store_true", help="不以上市櫃公司清單檢查代號")
+    parser.add_argument("--refresh-index", action="store_true", help="強制重新抓取上市櫃公司清單")
+    parser.add_argument("--bulk", action="store_true", help="先下載整個市場的資料再過濾，未命中的才逐檔查詢")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：只重新查詢申報有異動的代號，其餘沿用 filing_snapshot.json 中的上次結果")
+    parser.add_argument("--markets", default=None, help="整體模式下載的市場，以逗號分隔，例如 上市,上櫃")
+    parser.add_argument("--period", default=None, help="整體模式只取指定資料年月，格式 YYYY-MM")
+    parser.add_argument("--periods", default=None, help="多期別回補，例如 2023-01..2026-09 或 2024-01,2024-03")
+    parser.add_argument("--no-block-resources", action="store_true",
+                        help="不阻擋圖片/字型/分析請求，並改回一般頁面載入策略（網站異常時使用）")
+    parser.add_argument("--measure-page-load", action="store_true", help="量測資源阻擋節省的傳輸量與時間後結束")
+    parser.add_argument("--chrome-profile-dir", default=None,
+                        help="沿用的 Chrome 設定檔根目錄（每個瀏覽器一個子目錄），重啟後不必重新下載網站資源")
+    parser.add_argument("--measure-restart", nargs="?", const="2330", default=None, metavar="CODE",
+                        help="量測重啟瀏覽器後第一檔查詢的延遲（無快取 vs 沿用設定檔）後結束")
+    parser.add_argument("--xhr", action="store_true", help="直接從查詢 API 的網路回應擷取資料，失敗時才解析頁面")
+    parser.add_argument("--archive", default=None, help="封存原始 CSV/HTML/JSON 回應的目錄，例如 archive")
+    parser.add_argument("--reparse", action="store_true", help="不連網，從 --archive 目錄重新解析並輸出 Excel")
+    parser.add_argument("--workers", type=int, default=None, help="重新解析使用的程序數（預設為 CPU 核心數）")
+    parser.add_argument("--pipeline", action="store_true", help="管線模式：瀏覽器查詢、解析、寫檔同時進行")
+    parser.add_argument("--parse-workers", type=int, default=2, help="管線模式的解析執行緒數")
+    parser.add_argument("--daemon", action="store_true", help="常駐模式：保持瀏覽器暖機，依申報期限排程並接收臨時清單")
+    parser.add_argument("--browsers", type=int, default=1, help="常駐模式的瀏覽器數量")
+    parser.add_argument("--port", type=int, default=None,
+                        help=f"常駐模式接收臨時代號清單的本機埠號（預設 {DAEMON_PORT}）；"
+                             f"查詢服務的埠號（預設 {SERVICE_PORT}）")
+    parser.add_argument("--run-now", action="store_true", help="常駐模式啟動後立即跑一次整份清單")
+    parser.add_argument("--submit", default=None, help="把代號（逗號分隔）送給執行中的常駐服務後結束")
+    parser.add_argument("--serve", action="store_true", help="啟動本機 HTTP/JSON 查詢服務（/holdings/<代號>）")
+    parser.add_argument("--cache-ttl", type=float, default=24, help="查詢服務快取有效時數")
+    parser.add_argument("--negative-ttl", type=float, default=10,
+                        help="查詢服務快取「查無資料／查無此公司代號」的分鐘數（0 表示不快取）")
+    parser.add_argument("--tabs", type=int, default=None,
+                        help="多分頁模式：在同一個 Chrome 內開 N 個分頁同時查詢（比開多個瀏覽器省記憶體）")
+    parser.add_argument("--store", default=None,
+                        help="結果寫入 SQLite 資料庫（例如 holdings.db），Excel 於結束時由資料庫匯出")
+    parser.add_argument("--lookup-holder", default=None,
+                        help="從資料庫查詢某人在哪些公司任董監事及持股後結束；結尾加 * 以開頭比對")
+    parser.add_argument("--code-deadline", type=Deadline.parse, default=None,
+                        help="單檔時限，例如 45s 或 2m；所有等待、逾時與輪詢都在此預算內，超過即放棄該檔")
+    parser.add_argument("--columns", type=FixedInputCrawler.parse_columns, default=None,
+                        help="輸出的明細欄位，以逗號分隔或 all（預設 姓名,目前持股）；可用："
+                             + "、".join(FixedInputCrawler.SCHEMA_FIELDS))
+    parser.add_argument("--input-order", action="store_true",
+                        help="依代號檔順序處理，不依歷史耗時與失敗紀錄排程")
+    parser.add_argument("--trace-driver", action="store_true",
+                        help="統計每檔的 WebDriver 往返次數與耗時（依指令與階段），明細寫入 driver_trace.csv")
+    parser.add_argument("--round-trip-budget", type=int, default=None,
+                        help="搭配 --trace-driver：任一檔往返次數超過此值時警告並以失敗結束")
+    parser.add_argument("--profile", nargs="?", const="crawler.prof", default=None,
+                        help="以 cProfile 記錄 Python 端耗時，存成指定檔案（預設 crawler.prof）並列出前幾名")
     args = parser.parse_args()
+    if args.daemon and args.store:
+        # 常駐模式的輸出是持續追加的合併 Excel，沒有一輪結束時由資料庫匯出的時機
+        parser.error("--store 不支援 --daemon 常駐模式")
+    if args.port is None:
+        args.port = SERVICE_PORT if args.serve else DAEMON_PORT
+
+    if args.submit:
+        print(submit_codes([c.strip() for c in args.submit.split(",") if c.strip()], port=args.port))
+        return
+
+    if args.lookup_holder:
+        lookup_holder(args.lookup_holder, args.store or "holdings.db")
+        return
 
     print("🔧 股票爬蟲（邊跑邊寫・可續跑）")
     print("="*50)
-    crawler = FixedInputCrawler()
-    ok = crawler.run_batch_resume(
-        codes_file=args.codes_file,
-        out_path=args.out,
-        throttle_sec=args.throttle,
-        retry=args.retry
-    )
+    profile_dir = os.path.join(args.chrome_profile_dir, "main") if args.chrome_profile_dir else None
+    crawler = FixedInputCrawler(block_resources=not args.no_block_resources, capture_xhr=args.xhr,
+                                archive_dir=args.archive or ("archive" if args.reparse else None),
+                                trace_driver=args.trace_driver, round_trip_budget=args.round_trip_budget,
+                                store_path=args.store, code_deadline=args.code_deadline,
+                                profile_dir=profile_dir, columns=args.columns)
+    crawler.schedule_by_history = not args.input_order
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        ok = _dispatch(args, crawler)
+    finally:
+        if profiler:
+            profiler.disable()
+            _report_profile(profiler, args.profile, crawler.logger)
+    if crawler.tracer and not crawler.tracer.summary():
+        ok = False
     print("\n✅ 完成" if ok else "\n❌ 失敗，請看 log")
 
+
+def lookup_holder(name, store_path="holdings.db"):
+    """印出某人在資料庫中的所有董監事持股"""
+    if not os.path.exists(store_path):
+        print(f"找不到資料庫: {store_path}")
+        return None
+    store = HoldingsStore(store_path)
+    try:
+        start = time.perf_counter()
+        prefix = name.endswith("*")
+        df = store.lookup_holder(name.rstrip("*"), prefix=prefix)
+        elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        store.close()
+    if df.empty:
+        print(f"查無「{name}」（{elapsed:.1f} ms）")
+    else:
+        print(df.to_string(index=False))
+        print(f"共 {len(df)} 筆，{df['股票代號'].nunique()} 家公司（{elapsed:.1f} ms）")
+    return df
+
+
+def _report_profile(profiler, path, logger, top=25):
+    """存下 cProfile 結果並把累計耗時前幾名寫入 log"""
+    import io
+    import pstats
+    profiler.dump_stats(path)
+    buf = io.StringIO()
+    pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(top)
+    logger.info(f"📊 cProfile 結果已存到 {path}（可用 python -m pstats {path} 檢視）\n{buf.getvalue()}")
+
+
+def _dispatch(args, crawler):
+    """依參數選擇執行模式"""
+    if args.serve:
+        service = HoldingsService(
+            browsers=args.browsers,
+            port=args.port,
+            ttl_hours=args.cache_ttl,
+            retry=args.retry,
+            block_resources=not args.no_block_resources,
+            capture_xhr=args.xhr,
+            negative_ttl_minutes=args.negative_ttl,
+            archive_dir=args.archive,
+            profile_dir=args.chrome_profile_dir,
+            columns=args.columns,
+            store_path=args.store,
+            code_deadline=args.code_deadline,
+            trace_driver=args.trace_driver,
+            round_trip_budget=args.round_trip_budget
+        )
+        ok = service.serve()
+    elif args.daemon:
+        daemon = CrawlerDaemon(
+            codes_file=args.codes_file,
+            out_path=args.out or "董監事持股_合併_常駐.xlsx",
+            browsers=args.browsers,
+            port=args.port,
+            retry=args.retry,
+            throttle_sec=args.throttle,
+            block_resources=not args.no_block_resources,
+            capture_xhr=args.xhr,
+            archive_dir=args.archive,
+            profile_dir=args.chrome_profile_dir,
+            columns=args.columns,
+            code_deadline=args.code_deadline,
+            trace_driver=args.trace_driver,
+            round_trip_budget=args.round_trip_budget
+        )
+        ok = daemon.run(run_now=args.run_now)
+    elif args.reparse:
+        ok = crawler.reparse(out_path=args.out, workers=args.workers)
+    elif args.measure_page_load:
+        ok = crawler.measure_page_load() is not None
+        if crawler.driver:
+            crawler.driver.quit()
+    elif args.measure_restart:
+        ok = crawler.measure_restart(args.measure_restart) is not None
+    elif args.tabs:
+        ok = crawler.run_tabs(
+            tabs=args.tabs,
+            codes_file=args.codes_file,
+            out_path=args.out,
+            throttle_sec=args.throttle,
+            retry=args.retry,
+            validate=not args.no_validate,
+            refresh_index=args.refresh_index
+        )
+    elif args.pipeline:
+        ok = crawler.run_pipeline(
+            codes_file=args.codes_file,
+            out_path=args.out,
+            parse_workers=args.parse_workers,
+            throttle_sec=args.throttle,
+            retry=args.retry,
+            validate=not args.no_validate,
+            refresh_index=args.refresh_index
+        )
+    elif args.periods:
+        ok = crawler.run_periods(
+            crawler.parse_periods(args.periods),
+            codes_file=args.codes_file,
+            out_path=args.out,
+            throttle_sec=args.throttle,
+            retry=args.retry,
+            validate=not args.no_validate,
+            refresh_index=args.refresh_index
+        )
+    elif args.incremental:
+        ok = crawler.run_incremental(
+            codes_file=args.codes_file,
+            out_path=args.out,
+            markets=args.markets.split(",") if args.markets else None,
+            throttle_sec=args.throttle,
+            retry=args.retry,
+            validate=not args.no_validate,
+            refresh_index=args.refresh_index
+        )
+    elif args.bulk:
+        ok = crawler.run_bulk(
+            codes_file=args.codes_file,
+            out_path=args.out,
+            markets=args.markets.split(",") if args.markets else None,
+            period=args.period,
+            throttle_sec=args.throttle,
+            retry=args.retry,
+            validate=not args.no_validate,
+            refresh_index=args.refresh_index
+        )
+    else:
+        ok = crawler.run_batch_resume(
+            codes_file=args.codes_file,
+            out_path=args.out,
+            throttle_sec=args.throttle,
+            retry=args.retry,
+            validate=not args.no_validate,
+            refresh_index=args.refresh_index
+        )
+    return ok
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def _workdir(tmp_path, monkeypatch):
+    """爬蟲會在目前目錄建立日誌、downloads/ 與各種快取檔，測試一律在暫存目錄執行"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
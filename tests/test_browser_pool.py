@@ -0,0 +1,21 @@
+from fixed_input_crawler import BrowserPool
+
+
+def test_run_spreads_codes_over_started_browsers():
+    pool = BrowserPool(size=2)
+    seen = {}
+    for crawler in pool.crawlers:
+        def iter_holdings(codes, retry=1, throttle_sec=0, crawler=crawler):
+            seen[codes[0]] = crawler
+            yield {"code": codes[0], "period": None, "ok": codes[0] != "9999", "data": None, "reason": None}
+        crawler.iter_holdings = iter_holdings
+        pool.release(crawler)
+    pool.started = 2
+
+    codes = ["1101", "2330", "9999", "2317", "1301"]
+    records = list(pool.run(codes, throttle_sec=0))
+
+    assert sorted(r["code"] for r in records) == sorted(codes)
+    assert [r["code"] for r in records if not r["ok"]] == ["9999"]
+    assert set(seen.values()) <= set(pool.crawlers)
+    assert pool._idle.qsize() == 2
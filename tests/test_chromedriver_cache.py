@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+import fixed_input_crawler as fic
+from fixed_input_crawler import ChromeDriverCache, FixedInputCrawler
+
+
+class FakeDriver:
+    def __init__(self, service=None):
+        self.service = service
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    driver_path = tmp_path / "chromedriver"
+    browser_path = tmp_path / "chrome"
+    driver_path.write_text("")
+    browser_path.write_text("")
+    cache = ChromeDriverCache(str(tmp_path / "chromedriver_cache.json"))
+    cache._save({"driver_path": str(driver_path), "browser_path": str(browser_path),
+                 "browser_mtime": os.path.getmtime(browser_path), "driver_version": "120.0.6099.109",
+                 "browser_version": "120.0.6099.109"})
+    monkeypatch.setattr(fic, "chromedriver_cache", cache)
+    return cache
+
+
+def test_failed_launch_keeps_shared_service_for_live_sessions(cache, monkeypatch):
+    monkeypatch.setattr(ChromeDriverCache, "_version", staticmethod(lambda binary: "120.0.6099.109"))
+    shutdowns = []
+    monkeypatch.setattr(fic._SharedDriverService, "shutdown", lambda self: shutdowns.append(self))
+    calls = []
+
+    def chrome(options=None, service=None):
+        calls.append(service)
+        if service is not None and len(calls) == 2:
+            raise fic.WebDriverException("session not created: profile in use")
+        return FakeDriver(service)
+
+    monkeypatch.setattr(fic.webdriver, "Chrome", chrome)
+    crawler = FixedInputCrawler()
+    alive = crawler._launch_chrome(crawler.setup_chrome())
+    shared = cache._service
+
+    fallback = crawler._launch_chrome(crawler.setup_chrome())
+
+    assert alive.service is shared and fallback.service is None
+    assert shutdowns == []
+    assert cache._service is shared
+    assert os.path.exists(cache.path)
+    # 下一個瀏覽器仍沿用同一個服務
+    assert crawler._launch_chrome(crawler.setup_chrome()).service is shared
+
+
+def test_version_mismatch_drops_cache_without_stopping_service(cache, monkeypatch):
+    monkeypatch.setattr(ChromeDriverCache, "_version", staticmethod(lambda binary: "120.0.6099.109"))
+    shutdowns = []
+    monkeypatch.setattr(fic._SharedDriverService, "shutdown", lambda self: shutdowns.append(self))
+    options = FixedInputCrawler().setup_chrome()
+    old = cache.service(options)
+    monkeypatch.setattr(ChromeDriverCache, "_browser_version", classmethod(lambda cls, binary: "121.0.6167.85"))
+
+    assert cache.revalidate() is True
+    assert shutdowns == [] and old is not None
+    assert cache._paths is None and cache._service is None
+    assert not os.path.exists(cache.path)
+
+
+def test_unreadable_browser_version_forces_revalidation(cache, monkeypatch):
+    entry = cache._load()
+    entry["browser_mtime"] = 0  # Chrome 自動更新過
+    monkeypatch.setattr(ChromeDriverCache, "_browser_version", classmethod(lambda cls, binary: None))
+    assert cache._check(entry) is None
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from fixed_input_crawler import Deadline, DeadlineExceeded, FixedInputCrawler
+
+BUDGET = 1.0
+EPSILON = 0.5
+
+
+class SlowFindDriver:
+    """每次 find_elements 都耗滿隱式等待仍找不到元素的假 driver"""
+
+    current_url = "http://127.0.0.1/mops/#/web/home"
+    title = "fake"
+    window_handles = ["main"]
+
+    def __init__(self):
+        self.wait = 10
+        self.finds = 0
+
+    def implicitly_wait(self, seconds):
+        self.wait = seconds
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def find_elements(self, by, value):
+        self.finds += 1
+        time.sleep(self.wait)
+        return []
+
+    def get(self, url):
+        self.current_url = url
+
+    def refresh(self):
+        pass
+
+    def execute_script(self, script, *args):
+        return None
+
+    def get_cookies(self):
+        return []
+
+
+@pytest.fixture
+def crawler():
+    crawler = FixedInputCrawler(code_deadline=BUDGET)
+    crawler.driver = SlowFindDriver()
+    return crawler
+
+
+def test_query_button_strategies_stop_at_deadline(crawler):
+    crawler._start_deadline()
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        crawler.click_query_button(wait=False)
+    assert time.monotonic() - started < BUDGET + EPSILON
+
+
+def test_single_stock_aborts_within_budget(crawler):
+    crawler._start_deadline()
+    started = time.monotonic()
+    assert crawler.process_single_stock("2330") is False
+    assert time.monotonic() - started < BUDGET + EPSILON
+    assert crawler.last_failure_reason == crawler.DEADLINE_REASON
+
+
+def test_deadline_check():
+    deadline = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+    assert Deadline(5).cap(1) == 1
+
+
+class FailingSession:
+    def get(self, url, timeout=None):
+        time.sleep(timeout)
+        raise OSError("timed out")
+
+
+def test_background_download_uses_the_deadline_it_was_given(crawler):
+    # 瀏覽器執行緒已換成下一個期別（或沒有時限），背景下載仍依送出時的時限停止
+    crawler._deadline = None
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        crawler._fetch_and_parse_csv("http://127.0.0.1/x.csv", FailingSession(), "2330", "2024-05",
+                                     deadline=Deadline(BUDGET))
+    assert time.monotonic() - started < BUDGET + EPSILON
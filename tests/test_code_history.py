@@ -0,0 +1,20 @@
+from fixed_input_crawler import CodeHistory, FixedInputCrawler
+
+
+def test_history_is_loaded_only_when_used(monkeypatch):
+    loads = []
+    monkeypatch.setattr(CodeHistory, "load", lambda self: loads.append(self.path))
+    crawlers = [FixedInputCrawler() for _ in range(3)]
+    assert loads == []
+
+    history = crawlers[0].history
+    assert loads == ["code_history.csv"]
+    assert crawlers[0].history is history
+
+
+def test_history_can_be_shared():
+    shared = CodeHistory()
+    crawler = FixedInputCrawler()
+    crawler.history = shared
+    crawler._record_history("2330", 12.5, True)
+    assert shared.entries["2330"]["tries"] == 1
@@ -0,0 +1,34 @@
+import logging
+
+from fixed_input_crawler import DriverTracer, FixedInputCrawler
+
+
+class ExecuteDriver:
+    """所有操作都經由 execute 的假 driver（同真正的 WebDriver），找不到任何元素"""
+
+    def execute(self, command, params=None):
+        return {"value": []}
+
+    def implicitly_wait(self, seconds):
+        self.execute("setTimeouts", {"implicit": int(seconds * 1000)})
+
+    def set_page_load_timeout(self, seconds):
+        self.execute("setTimeouts", {"pageLoad": int(seconds * 1000)})
+
+    def find_elements(self, by, value):
+        return self.execute("findElements", {"using": by, "value": value})["value"]
+
+
+def test_finds_reuse_implicit_wait_and_credit_the_stage():
+    tracer = DriverTracer(logging.getLogger(__name__), path="trace.csv")
+    crawler = FixedInputCrawler(code_deadline=60)
+    crawler.driver = tracer.attach(ExecuteDriver())
+    crawler._start_deadline()
+    tracer.begin("2330")
+
+    assert crawler.click_query_button(wait=False) is False
+
+    stages = {stage for stage, _ in tracer._counts}
+    assert stages == {"click_query_button"}
+    assert ("click_query_button", "setTimeouts") not in tracer._counts
+    assert tracer._counts[("click_query_button", "findElements")][0] == 9
@@ -0,0 +1,61 @@
+import pandas as pd
+
+from fixed_input_crawler import HoldingsService
+
+
+def _service(results, **kwargs):
+    service = HoldingsService(browsers=1, **kwargs)
+    crawler = service.pool.crawlers[0]
+    crawls = []
+
+    def iter_holdings(codes, retry=1, throttle_sec=0):
+        crawls.append(codes[0])
+        yield dict(results[codes[0]], code=codes[0], period=None)
+
+    crawler.iter_holdings = iter_holdings
+    service.pool.release(crawler)
+    return service, crawls
+
+
+def test_terminal_failures_are_cached_briefly():
+    service, crawls = _service({"9999": {"ok": False, "data": None, "reason": "查無此公司代號"}})
+    assert service.get("9999")[0] == 404
+    status, payload = service.get("9999")
+    assert status == 404 and payload["source"] == "negative"
+    assert crawls == ["9999"]
+    assert service.get("9999", refresh=True)[0] == 404
+    assert crawls == ["9999", "9999"]
+
+
+def test_transient_failures_are_not_cached():
+    service, crawls = _service({"2330": {"ok": False, "data": None, "reason": "網站錯誤"}})
+    assert service.get("2330")[0] == 502
+    assert service.get("2330")[0] == 502
+    assert crawls == ["2330", "2330"]
+
+
+def test_negative_cache_can_be_disabled():
+    service, crawls = _service({"9999": {"ok": False, "data": None, "reason": "查無資料"}}, negative_ttl_minutes=0)
+    service.get("9999")
+    service.get("9999")
+    assert crawls == ["9999", "9999"]
+
+
+def test_results_are_written_to_store(tmp_path):
+    data = pd.DataFrame({"股票代號": ["2330"], "公司名稱": ["台積電"], "姓名": ["董事甲"], "目前持股": [100]})
+    service, _ = _service({"2330": {"ok": True, "data": data, "reason": None}},
+                          store_path=str(tmp_path / "holdings.db"))
+    assert service.get("2330")[0] == 200
+    store = service.pool.crawlers[0].store
+    assert store.conn.execute("SELECT code, name FROM holdings").fetchall() == [("2330", "董事甲")]
+
+
+def test_pooled_browser_restarts_every_200_crawls():
+    service, crawls = _service({"2330": {"ok": False, "data": None, "reason": "網站錯誤"}})
+    crawler = service.pool.crawlers[0]
+    restarts = []
+    crawler.restart_driver = lambda: restarts.append(len(crawls)) or True
+    for _ in range(service.RESTART_EVERY * 2 + 1):
+        service.get("2330")
+    assert restarts == [service.RESTART_EVERY, service.RESTART_EVERY * 2]
+    assert service.stats["crawl"] == service.RESTART_EVERY * 2 + 1
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from fixed_input_crawler import HoldingsStore
+
+
+def _crawl(names, period="2024-05"):
+    return pd.DataFrame({
+        "股票代號": "2330", "公司名稱": "台積電", "期別": period,
+        "姓名": names, "目前持股": [1000 * (i + 1) for i in range(len(names))],
+    })
+
+
+def test_recrawl_drops_directors_who_left(tmp_path):
+    store = HoldingsStore(str(tmp_path / "holdings.db"), batch_size=1)
+    store.upsert(_crawl(["張三", "李四", "王五"]))
+    store.upsert(_crawl(["張三", "李四"], period="2024-04"))
+
+    assert store.upsert(_crawl(["張三", "王五"])) == 2
+
+    assert list(store.holdings_of("2330", "2024-05")["姓名"]) == ["張三", "王五"]
+    assert list(store.holdings_of("2330", "2024-04")["姓名"]) == ["張三", "李四"]
+    assert store.lookup_holder("李四")["期別"].tolist() == ["2024-04"]
@@ -0,0 +1,37 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from fixed_input_crawler import StreamingExcelWriter
+
+COLUMNS = ["股票代號", "姓名", "目前持股"]
+
+
+def _frame(start, rows):
+    return pd.DataFrame({"股票代號": ["2330"] * rows, "姓名": [f"董事{i}" for i in range(start, start + rows)],
+                         "目前持股": list(range(start, start + rows))})
+
+
+def _sheets(path):
+    wb = load_workbook(path, read_only=True)
+    try:
+        return {ws.title: sum(1 for _ in ws.iter_rows()) - 1 for ws in wb.worksheets}
+    finally:
+        wb.close()
+
+
+def test_merged_sheets_split_at_row_limit(tmp_path):
+    writer = StreamingExcelWriter(str(tmp_path / "out.xlsx"), COLUMNS, max_rows=4)
+    writer.append(_frame(0, 7))
+    paths = writer.close()
+    assert paths == [str(tmp_path / "out.xlsx")]
+    assert _sheets(paths[0]) == {"合併": 3, "合併_2": 3, "合併_3": 1}
+    assert writer.total_rows == 7
+
+
+def test_merged_sheet_names_continue_across_file_rollover(tmp_path):
+    writer = StreamingExcelWriter(str(tmp_path / "out.xlsx"), COLUMNS, max_rows=4, max_sheets=2)
+    writer.append(_frame(0, 12))
+    paths = writer.close()
+    assert paths == [str(tmp_path / "out.xlsx"), str(tmp_path / "out_part2.xlsx")]
+    assert _sheets(paths[0]) == {"合併": 3, "合併_2": 3}
+    assert _sheets(paths[1]) == {"合併_3": 3, "合併_4": 3}
@@ -0,0 +1,49 @@
+from fixed_input_crawler import Deadline, TabGroup, _TabSlot
+
+
+class SwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.window = handle
+
+
+class SessionDriver:
+    """逾時設定屬於整個 session 的假 driver"""
+
+    def __init__(self):
+        self.implicit = 10
+        self.page_load = 30
+        self.window = "tab_1"
+        self.switch_to = SwitchTo(self)
+
+    def implicitly_wait(self, seconds):
+        self.implicit = seconds
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load = seconds
+
+
+def test_each_tab_reapplies_its_own_timeouts():
+    group = TabGroup(tabs=2)
+    group.driver = SessionDriver()
+    for i, crawler in enumerate(group.crawlers, 1):
+        crawler.driver = group.driver
+        crawler._tab = _TabSlot(group, crawler, f"tab_{i}")
+    bounded, free = group.crawlers
+
+    bounded._tab.acquire()
+    bounded._deadline = Deadline(3)
+    bounded._apply_driver_timeouts()
+    assert group.driver.implicit <= 3 and group.driver.page_load <= 3
+    bounded._tab.release()
+
+    free._tab.acquire()
+    assert group.driver.window == "tab_2"
+    assert (group.driver.implicit, group.driver.page_load) == (10, 30)
+    free._tab.release()
+
+    bounded._tab.acquire()
+    assert group.driver.implicit <= 3 and group.driver.page_load <= 3
+    bounded._tab.release()